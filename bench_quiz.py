@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+성경 암기 퀴즈 벤치마크
+- serialization: 합성 사용자(기본 10k 세션)로 load_db / save_db / GET /data 시간과 파일 크기 측정
+            JSON 백엔드(stdlib/orjson) × 저장 포맷(pretty/compact) 조합 비교
+- load: 합성 코퍼스(기본 31,102절)·사용자·시도 기록을 만든 뒤 동시 클라이언트로
+            /login → /verses → /data → /save ×N → /leaderboard 시나리오 반복,
+            라우트별 처리량·p50/p95/p99 지연 시간과 디스크 사용량 보고
+            --mode testclient(Flask 테스트 클라이언트, 프로세스 내) | wsgi(실제 스레드 WSGI 서버 + HTTP)
+            --json 으로 결과 저장, --baseline 으로 이전 결과와 비교(p95 악화가 --max-regression% 초과 시 종료 코드 1)
+실행: python bench_quiz.py serialization [--sessions 10000] [--repeat 5]
+      python bench_quiz.py load [--users 100] [--attempts 1000] [--verses 31102] [--concurrency 16] [--mode wsgi]
+(임시 디렉터리로 옮긴 뒤 앱을 불러오고 끝나면 지우므로 실제 quiz_stats.json은 건드리지 않음)
+"""
+import os, sys, csv, json, time, random, shutil, argparse, tempfile, statistics, threading
+import http.cookiejar, urllib.request, urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+quiz = None  # bible_quiz_app — main()이 임시 디렉터리로 옮긴 뒤 불러온다(저장 경로가 작업 디렉터리 기준)
+
+QTYPES = ["identify_ref", "cloze", "multiple_choice", "continue_verse", "multiple_choice_text"]
+
+def _fake_question(v, qtype, rnd):
+    ref = f"{v['book']} {v['chapter']},{v['verse']}"
+    others = rnd.sample(quiz.SERVER_VERSES, 3)
+    return {
+        "qtype": qtype, "subj": qtype not in ("multiple_choice", "multiple_choice_text"),
+        "verse": dict(v), "prompt": f"{ref} — 구절 전체를 입력하세요:",
+        "options": [f"“{o['text']}”" for o in others + [v]] if qtype.startswith("multiple") else None,
+        "correctIndex": 3 if qtype.startswith("multiple") else None,
+        "maskedHtml": None,
+    }
+
+def make_user(n_sessions, rnd, exam_ratio=0.1, exam_size=30):
+    """합성 사용자: 대부분 학습(1문항) 세션 + 일부 시험(세트 덤프 포함) 세션"""
+    verses = quiz.SERVER_VERSES
+    sessions = []
+    scores = {}
+    for i in range(n_sessions):
+        is_exam = rnd.random() < exam_ratio
+        picked = rnd.sample(verses, min(exam_size, len(verses))) if is_exam else [rnd.choice(verses)]
+        details, dump = [], []
+        correct = 0
+        for v in picked:
+            qtype = rnd.choice(QTYPES)
+            ok = rnd.random() < 0.7
+            correct += ok
+            details.append({"qtype": qtype, "subj": not qtype.startswith("multiple"), "book": v["book"],
+                            "chapter": v["chapter"], "verse": v["verse"], "text": v["text"],
+                            "correct": ok, "skipped": False})
+            dump.append(_fake_question(v, qtype, rnd))
+            key = quiz.verse_key(v)
+            scores[key] = max(0, scores.get(key, 0) + (-1 if ok else 1))
+        se = {"id": f"sess_{i}", "type": "exam" if is_exam else "practice",
+              "dateISO": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00.000Z",
+              "total": len(picked), "correct": correct, "skip": 0, "score": correct, "details": details}
+        if is_exam:
+            se["questionsDump"] = dump
+        sessions.append(se)
+    u = quiz.new_user()
+    u.update(sessions=sessions, verseScores=scores)
+    return u
+
+def _timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000.0
+
+def bench_serialization(args):
+    rnd = random.Random(args.seed)
+    db = {"schemaVersion": quiz.SCHEMA_VERSION, "users": {"bench": make_user(args.sessions, rnd)}}
+    backends = ["stdlib"] + (["orjson"] if quiz.orjson is not None else [])
+    quiz.PERSIST_MODE = "sync"  # 파일 I/O 자체를 재기 위해 write-behind 캐시를 끈다
+    client = quiz.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "bench"
+    print(f"합성 사용자: 세션 {args.sessions}개, 반복 {args.repeat}회(중앙값 ms)")
+    print(f"{'backend':8} {'format':8} {'size(KB)':>10} {'save':>9} {'load':>9} {'/data':>9} {'/data(KB)':>10}")
+    for backend in backends:
+        for pretty in (True, False):
+            quiz.JSON_BACKEND = backend
+            quiz.STORAGE_PRETTY = pretty
+            quiz.save_db(db)
+            size = os.path.getsize(quiz.DATA_FILE) / 1024.0
+            t_save = _timeit(lambda: quiz.save_db(db), args.repeat)
+            t_load = _timeit(quiz.load_db, args.repeat)
+            body = client.get("/data").data
+            t_data = _timeit(lambda: client.get("/data"), args.repeat)
+            print(f"{backend:8} {'pretty' if pretty else 'compact':8} {size:10.1f} {t_save:9.1f} {t_load:9.1f} {t_data:9.1f} {len(body) / 1024.0:10.1f}")
+
+# ------------------------------
+# load: 합성 데이터 + 동시 클라이언트 부하
+# ------------------------------
+BENCH_PASSWORD = "bench-pw"
+BOOKS = ["창세", "탈출", "레위", "민수", "신명", "여호", "판관", "룻", "사무상", "사무하", "열왕상", "열왕하",
+         "시편", "잠언", "이사", "예레", "에제", "다니", "마태", "마르", "루카", "요한", "사도", "로마",
+         "1코린", "2코린", "갈라", "에페", "필리", "콜로", "히브", "야고", "1베드", "1요한", "묵시"]
+SYLLABLES = "가나다라마바사아자차카타파하고노도로모보소오조주하느님사랑말씀은혜믿음소망평화생명진리길빛"
+
+def make_corpus(path, n_verses, rnd):
+    """책/장/절이 이어지는 합성 구절 CSV 작성 (한 장 평균 25절)"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["Book", "Chapter", "Verse", "Text"])
+        per_book = max(1, n_verses // len(BOOKS))
+        for i in range(n_verses):
+            book = BOOKS[min(i // per_book, len(BOOKS) - 1)]
+            within = i - BOOKS.index(book) * per_book
+            words = ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(1, 4))) for _ in range(rnd.randint(5, 18))]
+            w.writerow([book, within // 25 + 1, within % 25 + 1, " ".join(words) + "."])
+
+def seed_users(n_users, n_attempts, rnd):
+    """합성 사용자 n명(각 n_attempts개 시도)을 저장 경로(압축·보존 정책 포함) 그대로 기록"""
+    pw_hash = quiz.generate_password_hash(BENCH_PASSWORD)  # 모두 같은 비밀번호 — 해시는 한 번만 계산
+    db = {"schemaVersion": quiz.SCHEMA_VERSION, "users": {}}
+    for i in range(n_users):
+        uname = f"user{i:05d}"
+        u = make_user(n_attempts, rnd)
+        u["pw_hash"] = pw_hash
+        u["sessions"] = [quiz.compact_session(se) for se in u["sessions"]]
+        quiz.apply_retention(uname, u)
+        db["users"][uname] = u
+    quiz.save_db(db)
+    quiz.flush_db()
+
+def _disk_bytes():
+    total = os.path.getsize(quiz.DATA_FILE) if os.path.exists(quiz.DATA_FILE) else 0
+    for root, _, files in os.walk(quiz.ARCHIVE_DIR):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+class TestClientDriver:
+    """Flask 테스트 클라이언트(프로세스 내, 네트워크/서버 오버헤드 제외)"""
+    def __init__(self, base=None):
+        self.client = quiz.app.test_client()
+
+    def request(self, method, path, body=None):
+        r = self.client.open(path, method=method, json=body)
+        return r.status_code, len(r.data)
+
+class HttpDriver:
+    """실제 HTTP 요청(클라이언트마다 쿠키 저장소 하나)"""
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=120) as r:
+                return r.status, len(r.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+def _practice_session(rnd, client_id, seq):
+    v = rnd.choice(quiz.SERVER_VERSES)
+    ok = rnd.random() < 0.7
+    detail = {"qtype": rnd.choice(QTYPES), "subj": True, "book": v["book"], "chapter": v["chapter"],
+              "verse": v["verse"], "text": v["text"], "correct": ok, "skipped": False}
+    return {"id": f"load_{client_id}_{seq}", "type": "practice", "dateISO": "2025-06-01T00:00:00.000Z",
+            "total": 1, "correct": int(ok), "skip": 0, "score": int(ok), "details": [detail]}
+
+def _run_client(driver, client_id, args, samples, errors, lock):
+    rnd = random.Random(args.seed * 1000 + client_id)
+    uname = f"user{client_id % args.users:05d}"
+    local, local_err = [], {}
+
+    def call(name, method, path, body=None):
+        t0 = time.perf_counter()
+        status, _ = driver.request(method, path, body)
+        local.append((name, time.perf_counter() - t0))
+        if status >= 400:
+            local_err[name] = local_err.get(name, 0) + 1
+
+    for rnd_no in range(args.rounds):
+        call("/login", "POST", "/login", {"username": uname, "password": BENCH_PASSWORD})
+        call("/verses", "GET", "/verses")
+        call("/data", "GET", "/data")
+        for k in range(args.saves):
+            key = f"{client_id}-{rnd_no}-{k}"
+            call("/save", "POST", "/save", {"session": _practice_session(rnd, client_id, key), "idempotencyKey": key})
+        call("/leaderboard", "GET", "/leaderboard")
+    with lock:
+        samples.extend(local)
+        for name, n in local_err.items():
+            errors[name] = errors.get(name, 0) + n
+
+def _percentile(sorted_vals, pct):
+    # nearest-rank
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(pct / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+def bench_load(args):
+    rnd = random.Random(args.seed)
+    corpus = os.path.abspath("bench_verses.csv")
+    make_corpus(corpus, args.verses, rnd)
+    os.environ["VERSES_FILE"] = corpus
+    quiz.load_server_verses_file()
+    quiz.PERSIST_MODE = args.persist
+    # 부하 발생기는 한 IP에서 수많은 로그인을 보내므로 속도 제한을 사실상 끈다
+    quiz.LOGIN_LIMIT_IP = quiz.RateLimiter("1000000000/60")
+    quiz.LOGIN_LIMIT_USER = quiz.RateLimiter("1000000000/60")
+
+    t0 = time.perf_counter()
+    seed_users(args.users, args.attempts, rnd)
+    seed_s = time.perf_counter() - t0
+    disk_before = _disk_bytes()
+    print(f"합성 데이터: 구절 {len(quiz.SERVER_VERSES)}개, 사용자 {args.users}명 × 시도 {args.attempts}개 "
+          f"(생성 {seed_s:.1f}s, 디스크 {disk_before / 1048576.0:.1f}MB)")
+
+    server = None
+    if args.mode == "wsgi":
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass  # 요청마다 찍히는 접근 로그가 측정을 방해하지 않도록
+        server = make_server("127.0.0.1", 0, quiz.app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, name="bench-wsgi", daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        driver_cls = HttpDriver
+    else:
+        base = None
+        driver_cls = TestClientDriver
+
+    samples, errors, lock = [], {}, threading.Lock()
+    threads = [threading.Thread(target=_run_client, args=(driver_cls(base), i, args, samples, errors, lock))
+               for i in range(args.concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    if server is not None:
+        server.shutdown()
+    quiz.flush_db()
+    disk_after = _disk_bytes()
+
+    by_route = {}
+    for name, dt in samples:
+        by_route.setdefault(name, []).append(dt)
+    result = {"mode": args.mode, "persist": args.persist, "users": args.users, "attempts": args.attempts,
+              "verses": len(quiz.SERVER_VERSES), "concurrency": args.concurrency, "rounds": args.rounds,
+              "saves": args.saves, "elapsed_s": elapsed, "requests": len(samples),
+              "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+              "disk_bytes_before": disk_before, "disk_bytes_after": disk_after, "routes": {}}
+    print(f"모드 {args.mode}, 동시 클라이언트 {args.concurrency}, 요청 {len(samples)}개 / {elapsed:.2f}s "
+          f"= {result['throughput_rps']:.1f} req/s, 디스크 {disk_after / 1048576.0:.1f}MB")
+    print(f"{'route':12} {'count':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name in ("/login", "/verses", "/data", "/save", "/leaderboard"):
+        vals = sorted(by_route.get(name, []))
+        if not vals:
+            continue
+        row = {"count": len(vals), "errors": errors.get(name, 0), "rps": len(vals) / elapsed,
+               "p50_ms": _percentile(vals, 50) * 1000.0, "p95_ms": _percentile(vals, 95) * 1000.0,
+               "p99_ms": _percentile(vals, 99) * 1000.0, "max_ms": vals[-1] * 1000.0}
+        result["routes"][name] = row
+        print(f"{name:12} {row['count']:7d} {row['errors']:5d} {row['rps']:8.1f} {row['p50_ms']:8.1f} "
+              f"{row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['max_ms']:8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        return _compare_baseline(result, args.baseline, args.max_regression)
+    return 0
+
+def _compare_baseline(result, path, max_regression):
+    """이전 실행 결과(--json)와 p95/처리량 비교 — p95 악화가 허용치를 넘으면 1"""
+    with open(path, encoding="utf-8") as f:
+        base = json.load(f)
+    failed = False
+    print(f"기준 결과 비교: {path}")
+    for name, row in result["routes"].items():
+        old = base.get("routes", {}).get(name)
+        if not old or not old.get("p95_ms"):
+            continue
+        delta = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100.0
+        flag = "  <-- 악화" if delta > max_regression else ""
+        failed = failed or bool(flag)
+        print(f"  {name:12} p95 {old['p95_ms']:8.1f} → {row['p95_ms']:8.1f} ms ({delta:+.0f}%){flag}")
+    if base.get("throughput_rps"):
+        delta = (result["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100.0
+        print(f"  처리량 {base['throughput_rps']:.1f} → {result['throughput_rps']:.1f} req/s ({delta:+.0f}%)")
+    return 1 if failed else 0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="성경 암기 퀴즈 벤치마크")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serialization", help="load/save//data 직렬화 비교")
+    p.add_argument("--sessions", type=int, default=10000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_serialization)
+    p = sub.add_parser("load", help="동시 클라이언트 부하 테스트(처리량, p50/p95/p99, 디스크 사용량)")
+    p.add_argument("--users", type=int, default=100)
+    p.add_argument("--attempts", type=int, default=1000, help="사용자당 기존 시도(세션) 수")
+    p.add_argument("--verses", type=int, default=31102, help="합성 코퍼스 구절 수")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--rounds", type=int, default=5, help="클라이언트당 시나리오 반복 횟수")
+    p.add_argument("--saves", type=int, default=5, help="시나리오 1회당 /save 횟수")
+    p.add_argument("--mode", choices=["testclient", "wsgi"], default="testclient")
+    p.add_argument("--persist", choices=["writebehind", "sync"], default="writebehind")
+    p.add_argument("--json", help="결과를 JSON 파일로 저장")
+    p.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    p.add_argument("--max-regression", type=float, default=20.0, help="허용 p95 악화율(%%)")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_load)
+    args = ap.parse_args(argv)
+    for attr in ("json", "baseline"):
+        if getattr(args, attr, None):
+            setattr(args, attr, os.path.abspath(getattr(args, attr)))  # 작업 디렉터리 이동 전 기준
+    global quiz
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="quiz_bench_")
+    os.chdir(workdir)  # DATA_FILE/아카이브는 상대 경로 → 임시 디렉터리에 생성
+    try:
+        import bible_quiz_app as quiz
+        return args.func(args) or 0
+    finally:
+        if quiz is not None:
+            quiz.flush_db()  # 남은 기록은 여기서 — 종료 시 atexit flush 가 원래 디렉터리에 쓰지 않게
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
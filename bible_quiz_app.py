@@ -22,20 +22,133 @@
 - 평가: **띄어쓰기는 고려하지 않음** (문자 LCS 유사도)
 - 표시: **시험 중에는 점수/스킵 숨김**, **학습 중에는 점수/스킵/정확도 표시**
 - 인증: **간단 가입/로그인/로그아웃** 추가, **유저별** 통계/설정/가중치 분리 저장
+            비밀번호 해시는 프로세스 풀에서 계산(동시성 상한·대기 시간 통계), IP/아이디별 시도 속도 제한
 - 구절 로딩: **기본적으로 서버의 verses.csv** 를 자동 로드(환경변수 VERSES_FILE로 경로 변경 가능),
             원하면 설정 화면에서 **서버 기본 다시 불러오기** 또는 **사용자 CSV 업로드**로 덮어쓰기 가능
+- 업로드 코퍼스: 올린 CSV는 서버가 파싱해 내용 해시로 한 부만 저장(QUIZ_CORPUS_DIR 또는 공유 KV),
+            사용자에게는 포인터만 — 다른 기기에서도 같은 코퍼스, GET /corpus/<id> 는 /verses 와 같은 압축·ETag 캐시
 - 요약 보강: **책별 최근 오답율(최근 100문항)** 표시
 - 랭킹: **최근 10문제 이상 시험 5개 평균 점수** 기준 전체 유저 랭킹 표시(상위 10)
-- 영속 저장: quiz_stats.json
-의존성: Flask, Bootstrap/Chart.js/PapaParse, Werkzeug(비밀번호 해시)
-실행: python bible_quiz_app.py → http://127.0.0.1:5000
+- 영속 저장: quiz_stats.json (기본 compact, QUIZ_STORAGE_FORMAT=pretty 로 들여쓰기 저장)
+            스키마 버전(schemaVersion)을 기록하고 기동 시 한 번 마이그레이션 — 현재 버전 데이터는 정규화 없이 읽음
+            write-behind: 메모리 갱신 후 즉시 응답, 변경은 모아서 주기적으로 기록(QUIZ_PERSIST_MODE=sync 로 끌 수 있음)
+- JSON: orjson 설치 시 자동 사용(QUIZ_JSON_BACKEND=auto|orjson|stdlib), 저장소/API 응답 공용
+- 보존 정책: 최근 N개 시험(QUIZ_KEEP_FULL_EXAMS, 기본 50)만 상세 보관, 이전 시험은 점수/집계만 남기고
+            상세는 사용자별·월별 압축 아카이브(QUIZ_ARCHIVE_DIR)로 이동, 재시험 시 자동 조회
+- 세트 덤프 압축: questionsDump는 구절 키 + 출제 파라미터(가린 단어 위치, 보기 키 순서)만 저장,
+            읽을 때 서버 코퍼스로 복원(복원 결과가 원본과 다르면 원본 그대로 저장)
+의존성: Flask, Werkzeug(비밀번호 해시), (옵션) orjson, brotli, redis
+        프런트엔드 라이브러리는 static/vendor 에 포함(Bootstrap 5.3 CSS, Chart.js 4.4) — 외부 CDN 불필요
+- 정적 자산: static/app.css, static/app.js 를 콘텐츠 해시 URL(Cache-Control: immutable)로 제공,
+            gzip/br 사전 압축, / 와 /verses 는 ETag 재검증(304)
+- 오프라인(PWA): 서비스 워커(/sw.js)가 앱 셸·코퍼스·최근 데이터를 캐시, 학습 시도는 IndexedDB 큐에
+            쌓았다가 온라인이 되면 /sync_attempts 로 일괄 동기화(시도 id 기준 멱등)
+- 계측: /metrics (Prometheus 텍스트) — 라우트별 지연 시간 히스토그램, DB 로드/저장 시간·크기, 응답 크기,
+            활성 사용자, 비밀번호 해시 통계(QUIZ_METRICS=0 으로 끔, QUIZ_METRICS_TOKEN 으로 보호)
+- 실시간 갱신: /events (SSE)로 저장 시 본인 기록 변경분과 리더보드(상위 10 변경 시)를 푸시,
+            클라이언트는 사용자 데이터를 캐시해 두고 변경분만 반영(저장 후 /data·/leaderboard 재요청 없음)
+            로그인 사용자만 연결, 스레드 서버는 워커당 스트림 수 상한(넘으면 503 → 클라이언트는 /data 주기 재요청)
+- ASGI: asgi_app (uvicorn bible_quiz_app:asgi_app) — 연결은 이벤트 루프가 유지하고 라우트는 스레드 풀에서 실행
+- 프로파일링(옵트인): QUIZ_PROFILE=1 또는 관리자 헤더(X-Quiz-Profile: 1)로 느린 요청의 cProfile 결과를
+            QUIZ_PROFILE_DIR 에 회전 저장(라우트·사용자·크기 포함), /admin/profiles 로 목록/다운로드
+            관리자 API는 QUIZ_ADMIN_TOKEN 설정 시에만 활성(X-Admin-Token 헤더)
+- 멱등 저장: /save 는 Idempotency-Key 헤더(또는 idempotencyKey)로 재전송을 한 번만 반영하고 처음 결과를 반환,
+            사용자별 최근 시도 id 인덱스(LRU, QUIZ_IDEMPOTENCY_KEEP 개)를 /sync_attempts 와 공유
+- 학습 세트: 책·장 범위·참조 목록·저장된 검색(+다른 세트 합/교/차, 숙달 구절 제외)으로 출제 범위를 정의,
+            서버가 코퍼스 비트맵(int 비트 연산)으로 계산 — 시험은 세트에서 무작위 추출, 학습 모드·대시보드도 세트 기준
+- 구절 검색: GET /search?q= — 코퍼스 로드 시 만든 문자 1/2-gram 역색인(띄어쓰기 무시), 여러 단어(AND),
+            "구" 검색, 접두어*, 점수순 결과와 원문 일치 구간 — q 가 참조("누가 2:1", "시 23")면 그 구절
+- 단락 암송: 같은 장에서 절이 이어지는 구절로 단락을 만들어 다음 절 잇기·절 순서 맞추기·단락 채우기 출제,
+            "시편 23,1-6" 처럼 단락을 지정하면 그 범위에서만 출제(GET /passage), 단락 본문도 /grade 로 채점
+- 서술형 채점: POST /grade — 공백 무시 글자 유사도(비트 병렬 LCS)로 통과/부분 점수, 단어 단위 diff(빠짐/추가/바뀜)
+            피드백, 부분 점수는 구절별 verseStats(시도 수, 이동평균)에 누적되어 학습 모드 출제 가중치에 반영
+- 참조 파서: 책 별칭 트라이(가톨릭/개신교 이름·약어, 영문) — "테살로니카 1서 4장 3절", "1 Thess 4:3" 같은
+            자유 형식을 채점(identify_ref, /book_aliases 로 표 공유)·검색·학습 세트 참조 목록에서 같은 방식으로 해석
+- 다중 노드: QUIZ_STORE=redis(QUIZ_REDIS_URL)면 사용자·세션·랭킹·아카이브·코퍼스 버전을 공유 KV에 두고
+            사용자별 분산 잠금으로 수정 직렬화 — 세션 고정 없이 여러 호스트/워커로 확장(세션은 공유 키로 서명한 쿠키)
+- 백업/이전: GET /admin/export, POST /admin/import (또는 CLI export/import) — 사용자 단위 gzip JSON Lines 스트림,
+            가져오기는 세션 id 기준 중복 제거 + verseScores 합/최댓값 병합, 운영 중에도 사용자 하나씩만 메모리에
+- 스냅샷: QUIZ_SNAPSHOT_INTERVAL초(기본 300)마다 바뀐 사용자만 증분, 주기적으로 전체 — 기록을 막지 않음,
+            /admin/snapshots 목록·수동 실행, /admin/restore 로 사용자 한 명을 특정 시점으로 복원
+실행: python bible_quiz_app.py → http://127.0.0.1:10000 (개발 서버, 디버그 모드)
+      python bible_quiz_app.py serve [--workers N] [--threads N] [--server auto|asgi|wsgi] → 운영 서버
+            (uvicorn 있으면 asgi_app — gunicorn도 있으면 preload + UvicornWorker, 없으면 gunicorn gthread 또는
+            스레드 풀 서버), 코퍼스는 마스터에서 한 번만 로드, SIGHUP으로 무중단 재로딩
+      python bible_quiz_app.py export [-o FILE] [--users a,b] / import FILE [--scores max|sum]
 """
-import os, json, csv
-from flask import Flask, Response, request, jsonify, session
+import os, re, io, sys, json, csv, gzip, shutil, time, signal, atexit, threading, functools, hashlib, bisect, hmac, secrets
+import gc, zlib, math, queue, heapq, random, asyncio, argparse, contextlib, unicodedata, cProfile, pstats
+from array import array
+from collections import deque, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify, session, g
+from flask.json.provider import JSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.serving import BaseWSGIServer
+
+try:  # (옵션) orjson이 설치되어 있으면 JSON 인코딩/디코딩을 orjson으로
+    import orjson
+except ImportError:
+    orjson = None
+try:  # (옵션) brotli가 설치되어 있으면 정적 자산의 br 압축본도 미리 만든다
+    import brotli
+except ImportError:
+    brotli = None
+try:  # (옵션) QUIZ_STORE=redis 로 여러 호스트가 상태를 공유할 때
+    import redis
+except ImportError:
+    redis = None
 
-app = Flask(__name__)
+# ------------------------------
+# JSON 직렬화 계층 (저장소 + 모든 API 응답 공용)
+# ------------------------------
+# QUIZ_JSON_BACKEND: auto(기본, orjson 있으면 사용) | orjson | stdlib
+JSON_BACKEND = os.environ.get("QUIZ_JSON_BACKEND", "auto")
+if JSON_BACKEND == "auto":
+    JSON_BACKEND = "orjson" if orjson is not None else "stdlib"
+# QUIZ_STORAGE_FORMAT: compact(기본, 운영) | pretty(사람이 읽기 좋은 들여쓰기, 개발용)
+STORAGE_PRETTY = os.environ.get("QUIZ_STORAGE_FORMAT", "compact") == "pretty"
+
+def dumps_json(obj, pretty=False):
+    """obj → UTF-8 JSON bytes (비ASCII 문자는 이스케이프하지 않음)"""
+    if JSON_BACKEND == "orjson" and orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:
+            pass  # orjson이 처리 못하는 값(64비트 초과 정수 등)은 stdlib로
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads_json(data):
+    if JSON_BACKEND == "orjson" and orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class QuizJSONProvider(JSONProvider):
+    """jsonify()/request.get_json()이 위 직렬화 계층을 쓰도록 하는 Flask JSON 프로바이더(항상 compact)"""
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads_json(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        t0 = time.perf_counter()
+        body = dumps_json(obj)
+        observe("quiz_json_encode_seconds", time.perf_counter() - t0, target="response")
+        return self._app.response_class(body, mimetype="application/json")
+
+app = Flask(__name__, static_folder=None)  # /static 은 아래 지문(해시) 자산 라우트가 담당
 app.secret_key = os.environ.get("BIBLE_QUIZ_SECRET", "dev-secret-change-me")
+app.json = QuizJSONProvider(app)
+if os.environ.get("QUIZ_TRUST_PROXY") == "1":
+    # 리버스 프록시 뒤에서는 X-Forwarded-For로 실제 클라이언트 IP 사용(속도 제한 키)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
 
 # ------------------------------
 # 서버측 영속 저장소 (멀티유저)
@@ -45,77 +158,1354 @@ DEFAULT_SETTINGS = {
     "numQuestions": 30,
     "enabledQTypes": ["identify_ref", "cloze", "multiple_choice", "continue_verse", "multiple_choice_text"]
 }
-DEFAULT_USER_DATA = {
-    "sessions": [],
-    "settings": DEFAULT_SETTINGS.copy(),
-    "verseScores": {}  # key: "Book|Chapter|Verse" -> int (>=0)
-}
-DEFAULT_DB = {
-    "users": {}  # username -> {"pw_hash": str, **DEFAULT_USER_DATA}
-}
+# 저장 스키마 버전: 파일 DB는 최상위 "schemaVersion", 사용자 레코드는 "schema" 에 기록.
+# 기동 시 migrate(STORE.migrate)가 한 번 올려서 저장하고, 이후 읽기는 버전만 보고 정규화를 건너뛴다.
+# 레코드 구조를 바꿀 때는 SCHEMA_VERSION 을 올리고 USER_MIGRATIONS 에 (그 버전, 변환 함수)를 추가한다.
+SCHEMA_VERSION = 4
+
+def default_settings():
+    return {"numQuestions": DEFAULT_SETTINGS["numQuestions"], "enabledQTypes": list(DEFAULT_SETTINGS["enabledQTypes"])}
+
+def new_user():
+    """새 사용자 레코드 {"pw_hash", "schema", "sessions", "settings", "verseScores"(키 "Book|Chapter|Verse" -> int >= 0),
+    "verseStats"(키 -> [시도 수, 부분 점수 이동평균 0~1]), "studySets"(id -> 학습 세트),
+    "corpus"(업로드 코퍼스 포인터 {"id", "name", "count", "uploadedAt"}, 서버 코퍼스를 쓰면 None)}"""
+    return {"pw_hash": None, "schema": SCHEMA_VERSION, "sessions": [], "settings": default_settings(), "verseScores": {},
+            "verseStats": {}, "studySets": {}, "corpus": None}
+
+def _migrate_user_v1(u):
+    """버전 없던 레코드: 빠진 필드 기본값 보정 (사용자 설정을 존중: 체크 해제 항목을 임의 추가하지 않음)"""
+    u.setdefault("pw_hash", None)
+    if not isinstance(u.get("sessions"), list):
+        u["sessions"] = []
+    if not isinstance(u.get("settings"), dict):
+        u["settings"] = default_settings()
+    else:
+        u["settings"].setdefault("numQuestions", DEFAULT_SETTINGS["numQuestions"])
+        u["settings"].setdefault("enabledQTypes", list(DEFAULT_SETTINGS["enabledQTypes"]))
+    if not isinstance(u.get("verseScores"), dict):
+        u["verseScores"] = {}
+
+def _migrate_user_v2(u):
+    """학습 세트 필드 추가"""
+    if not isinstance(u.get("studySets"), dict):
+        u["studySets"] = {}
+
+def _migrate_user_v3(u):
+    """구절별 부분 점수 통계 필드 추가 (이전 기록은 부분 점수가 없어 새로 쌓는다)"""
+    if not isinstance(u.get("verseStats"), dict):
+        u["verseStats"] = {}
+
+def _migrate_user_v4(u):
+    """업로드 코퍼스 포인터 추가 (이전에는 업로드가 브라우저에만 있었으므로 서버 코퍼스로 시작)"""
+    if not isinstance(u.get("corpus"), dict):
+        u["corpus"] = None
+
+USER_MIGRATIONS = [(1, _migrate_user_v1), (2, _migrate_user_v2), (3, _migrate_user_v3), (4, _migrate_user_v4)]
+
+def migrate_user(u):
+    """사용자 레코드를 현재 스키마로 (제자리 수정) — 이미 현재 버전이면 바로 False"""
+    ver = u.get("schema", 0)
+    if ver == SCHEMA_VERSION:
+        return False
+    for target, fn in USER_MIGRATIONS:
+        if ver < target:
+            fn(u)
+            ver = target
+    u["schema"] = ver
+    return True
+
+def migrate_db(db):
+    """파일 DB 전체를 현재 스키마로 (제자리 수정) — 이미 현재 버전이면 바로 False"""
+    if db.get("schemaVersion") == SCHEMA_VERSION:
+        return False
+    if "users" not in db:
+        # 단일 사용자 스키마(최상위 sessions/settings/verseScores)를 멀티유저로 승격
+        users = {}
+        if any(k in db for k in ("sessions", "settings", "verseScores")):
+            users["_migrated"] = {"pw_hash": None, "sessions": db.get("sessions", []),
+                                  "settings": db.get("settings"), "verseScores": db.get("verseScores", {})}
+        db.clear()
+        db["users"] = users
+    users = db["users"]
+    for uname, u in list(users.items()):
+        if isinstance(u, dict):
+            migrate_user(u)
+        else:
+            users[uname] = new_user()
+    db["schemaVersion"] = SCHEMA_VERSION
+    return True
+
+# 저장 방식
+# - QUIZ_PERSIST_MODE=writebehind(기본): 메모리 DB를 갱신하고 즉시 응답, 백그라운드 스레드가
+#   QUIZ_FLUSH_INTERVAL_MS(기본 250ms) 동안 모인 변경을 한 번에 파일로 기록
+# - QUIZ_PERSIST_MODE=sync: 요청마다 파일을 읽고 동기 기록(이전 방식)
+# - QUIZ_FSYNC=always(기본, flush마다 fsync) | never(OS 캐시에 맡김)
+# 메모리 DB는 프로세스 단위이므로, 여러 워커 프로세스가 같은 파일을 쓰면 다른 워커의 기록은
+# 파일 변경(mtime/size)이 감지될 때 다시 읽어 반영한다(동시 수정은 마지막 기록이 이긴다).
+PERSIST_MODE = os.environ.get("QUIZ_PERSIST_MODE", "writebehind")
+FLUSH_INTERVAL = float(os.environ.get("QUIZ_FLUSH_INTERVAL_MS", "250")) / 1000.0
+FSYNC_POLICY = os.environ.get("QUIZ_FSYNC", "always")
+
+DB_LOCK = threading.RLock()  # 메모리 DB 읽기/수정 보호 (라우트 단위)
+_WRITE_LOCK = threading.Lock()  # 파일 기록 직렬화 (writer 스레드 ↔ 종료 시 flush)
+_FLUSH_EVENT = threading.Event()
+_DB_CACHE = None
+_DB_DIRTY = False
+_DB_STAT = None  # 마지막으로 읽거나 쓴 파일의 (mtime_ns, size)
+_WRITER = None
+_WRITER_START_LOCK = threading.Lock()
+
+def _data_file_stat():
+    try:
+        st = os.stat(DATA_FILE)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
 
 def load_db():
+    global _DB_CACHE, _DB_STAT
+    if PERSIST_MODE != "writebehind":
+        return _read_db_file()
+    with DB_LOCK:
+        if _DB_CACHE is not None and (_DB_DIRTY or _data_file_stat() == _DB_STAT):
+            return _DB_CACHE
+        stat = _data_file_stat()
+        _DB_CACHE = _read_db_file()
+        _DB_STAT = stat
+        return _DB_CACHE
+
+def _read_db_file():
+    t0 = time.perf_counter()
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            db = json.load(f)
+        with open(DATA_FILE, "rb") as f:
+            raw = f.read()
+        db = loads_json(raw)
+        observe("quiz_db_load_bytes", len(raw), SIZE_BUCKETS)
     except Exception:
         db = {}
+    if not isinstance(db, dict):
+        db = {}
+    observe("quiz_db_load_seconds", time.perf_counter() - t0)
 
-    # 마이그레이션: 단일 사용자 스키마를 멀티유저로 승격
-    if "users" not in db:
-        users = {}
-        sessions = db.get("sessions", [])
-        settings = db.get("settings", DEFAULT_SETTINGS.copy())
-        verseScores = db.get("verseScores", {})
-        if sessions or verseScores or settings:
-            users["_migrated"] = {"pw_hash": None, "sessions": sessions, "settings": settings, "verseScores": verseScores}
-        db = {"users": users}
-
-    # 필수 기본값 보정 (사용자 설정을 존중: 체크 해제 항목을 임의 추가하지 않음)
-    for uname, u in list(db["users"].items()):
-        if u is None or not isinstance(u, dict):
-            db["users"][uname] = {"pw_hash": None, **DEFAULT_USER_DATA}
-        else:
-            u.setdefault("pw_hash", None)
-            u.setdefault("sessions", [])
-            # settings가 없으면 기본 제공
-            if not isinstance(u.get("settings"), dict):
-                u["settings"] = DEFAULT_SETTINGS.copy()
-            else:
-                u["settings"].setdefault("numQuestions", DEFAULT_SETTINGS["numQuestions"])
-                u["settings"].setdefault("enabledQTypes", DEFAULT_SETTINGS["enabledQTypes"].copy())
-            u.setdefault("verseScores", {})
-
+    # 현재 스키마면 그대로(빠른 경로), 아니면 메모리에서 올린다 — 파일 반영은 기동 시 run_startup_migration()
+    migrate_db(db)
     return db
 
 def save_db(db):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+    global _DB_CACHE, _DB_DIRTY
+    if PERSIST_MODE != "writebehind":
+        _write_db_file(_encode_db(db))
+        return
+    with DB_LOCK:
+        _DB_CACHE = db
+        _DB_DIRTY = True
+    _ensure_writer()
+    _FLUSH_EVENT.set()
+
+def _encode_db(db):
+    t0 = time.perf_counter()
+    data = dumps_json(db, pretty=STORAGE_PRETTY)
+    observe("quiz_json_encode_seconds", time.perf_counter() - t0, target="storage")
+    return data
+
+def _write_db_file(data):
+    # 임시 파일에 쓰고 교체: 기록 도중 중단되어도 기존 파일이 깨지지 않음
+    t0 = time.perf_counter()
+    tmp = f"{DATA_FILE}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        if FSYNC_POLICY == "always":
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, DATA_FILE)
+    observe("quiz_db_save_seconds", time.perf_counter() - t0)
+    observe("quiz_db_save_bytes", len(data), SIZE_BUCKETS)
+
+def flush_db():
+    """대기 중인 변경을 즉시 파일에 기록 (writer 스레드, 종료 시 사용)"""
+    global _DB_DIRTY, _DB_STAT
+    with _WRITE_LOCK:
+        with DB_LOCK:
+            if not _DB_DIRTY or _DB_CACHE is None:
+                return False
+            data = _encode_db(_DB_CACHE)
+            _DB_DIRTY = False
+        try:
+            _write_db_file(data)
+        except Exception:
+            with DB_LOCK:
+                _DB_DIRTY = True  # 다음 flush에서 재시도
+            raise
+        with DB_LOCK:
+            _DB_STAT = _data_file_stat()
+    return True
+
+def _writer_loop():
+    while True:
+        _FLUSH_EVENT.wait()
+        time.sleep(FLUSH_INTERVAL)  # 이 구간 동안 들어온 변경을 모아서 한 번에 기록
+        _FLUSH_EVENT.clear()
+        try:
+            flush_db()
+        except Exception as e:
+            app.logger.error("quiz_stats flush 실패: %s", e)
+            _FLUSH_EVENT.set()
+
+def _ensure_writer():
+    # fork 이후에는 스레드가 복제되지 않으므로 프로세스마다 지연 시작
+    global _WRITER
+    if _WRITER is None or not _WRITER.is_alive():
+        with _WRITER_START_LOCK:
+            if _WRITER is None or not _WRITER.is_alive():
+                _WRITER = threading.Thread(target=_writer_loop, name="quiz-db-writer", daemon=True)
+                _WRITER.start()
+
+def install_shutdown_flush():
+    """SIGTERM 수신 시에도 종료 전에 flush 되도록 (정상 종료는 atexit이 처리)"""
+    prev = signal.getsignal(signal.SIGTERM)
+
+    def _on_term(signum, frame):
+        flush_db()
+        if callable(prev):
+            prev(signum, frame)
+        else:
+            raise SystemExit(0)
+    try:
+        signal.signal(signal.SIGTERM, _on_term)
+    except ValueError:
+        pass  # 메인 스레드가 아니면 설치 불가 — atexit에 맡긴다
 
-def ensure_user(db, username):
-    if username not in db["users"]:
-        db["users"][username] = {"pw_hash": None, **json.loads(json.dumps(DEFAULT_USER_DATA))}
-    u = db["users"][username]
-    u.setdefault("sessions", [])
-    if not isinstance(u.get("settings"), dict):
-        u["settings"] = DEFAULT_SETTINGS.copy()
-    else:
-        u["settings"].setdefault("numQuestions", DEFAULT_SETTINGS["numQuestions"])
-        u["settings"].setdefault("enabledQTypes", DEFAULT_SETTINGS["enabledQTypes"].copy())
-    u.setdefault("verseScores", {})
+atexit.register(flush_db)
+
+# ------------------------------
+# 저장소 백엔드 (사용자 단위 get/put)
+# ------------------------------
+# QUIZ_STORE=file(기본): 위의 quiz_stats.json — 단일 호스트
+# QUIZ_STORE=redis: QUIZ_REDIS_URL 의 Redis(호환) KV — 여러 호스트가 사용자/세션/랭킹/아카이브/코퍼스를 공유하므로
+#   로드밸런서 뒤에서 세션 고정(sticky) 없이 수평 확장 가능. 같은 사용자의 동시 수정은 사용자별 분산 잠금으로 직렬화
+# QUIZ_STORE=memory: 프로세스 내 KV(LocalKV) — redis와 같은 코드 경로를 네트워크 없이 (테스트/개발용)
+# Flask 세션은 서명 쿠키(서버 상태 없음)라 어느 노드로 가도 되지만, 모든 노드가 같은 비밀 키를 써야 한다
+# (BIBLE_QUIZ_SECRET 미설정 시 공유 저장소에 한 번 만든 키를 모든 노드가 사용).
+# 노드 단위로 남는 것: 로그인 속도 제한, /events 구독(다른 노드의 변경은 재접속 시 재동기화), 프로파일 파일
+STORE_KIND = os.environ.get("QUIZ_STORE", "file")
+REDIS_URL = os.environ.get("QUIZ_REDIS_URL", "redis://localhost:6379/0")
+USER_LOCK_TTL = 10.0   # 초, 잠금을 쥔 노드가 죽어도 이 시간 뒤 자동 해제
+USER_LOCK_WAIT = 5.0   # 초, 이 안에 잠금을 못 얻으면 503
+
+class StoreBusy(Exception):
+    """다른 요청(다른 노드 포함)이 같은 사용자를 수정 중이라 잠금을 얻지 못함"""
+
+class FileStore:
+    """quiz_stats.json 전체를 메모리 DB로 두는 기존 방식 (프로세스 안의 동시성은 DB_LOCK)"""
+    shared = False
+
+    def __init__(self):
+        self._leaders_db = None  # 랭킹 캐시가 반영한 DB — write-behind: 메모리 DB 객체, sync: 파일 (mtime, size)
+        self._leaders = {}
+        self._snap_dirty = set()
+
+    def process_lock(self):
+        return DB_LOCK
+
+    def user_lock(self, username):
+        return contextlib.nullcontext()  # DB_LOCK 이 이미 모든 수정을 직렬화
+
+    def warm(self):
+        with DB_LOCK:
+            load_db()
+
+    def migrate(self):
+        """파일이 이전 스키마면 올린 결과를 기록(원본은 <파일>.schema<N>.bak 로 보관). 반환: 올린 사용자 수"""
+        with DB_LOCK:
+            # 판단은 지금 디스크에 있는 파일로 — 메모리 DB는 읽을 때 이미 올라가 있고, 그 뒤 파일이 바뀌었을 수도 있다
+            try:
+                with open(DATA_FILE, "rb") as f:
+                    old = loads_json(f.read()).get("schemaVersion")
+            except (OSError, ValueError, AttributeError):
+                return 0
+            if old == SCHEMA_VERSION:
+                return 0
+            db = load_db()
+            shutil.copy2(DATA_FILE, f"{DATA_FILE}.schema{old or 0}.bak")
+            save_db(db)
+        flush_db()
+        return len(db["users"])
+
+    def get_user(self, username):
+        return load_db()["users"].get(username)
+
+    def put_user(self, username, u):
+        db = load_db()
+        fresh = PERSIST_MODE != "writebehind" and self._leaders_fresh()
+        db["users"][username] = u
+        save_db(db)
+        if fresh:
+            # sync: 방금 쓴 파일 = 캐시가 반영한 파일 + 이 사용자(이어서 set_leader_entry 가 갱신) — 다시 계산하지 않게
+            self._leaders_db = _data_file_stat()
+
+    def user_count(self):
+        return len(load_db()["users"])
+
+    def usernames(self):
+        return list(load_db()["users"])
+
+    def _leaders_fresh(self):
+        """랭킹 캐시가 지금 DB를 반영하는지 — write-behind: 메모리 DB 객체(다른 프로세스 기록을 다시 읽으면 바뀜),
+        sync: 파일 (mtime, size) — sync 의 load_db 는 매번 새 객체라 객체로 비교하면 요청마다 전체를 다시 계산한다"""
+        if PERSIST_MODE == "writebehind":
+            return self._leaders_db is load_db()
+        return self._leaders_db is not None and self._leaders_db == _data_file_stat()
+
+    def leader_entries(self):
+        # 사용자별 랭킹 항목 캐시 — DB가 바뀌었을 때만 전체 재계산
+        if not self._leaders_fresh():
+            stat = _data_file_stat()  # 읽기 전에 — 그사이 파일이 바뀌면 다음 호출에서 다시 계산
+            db = load_db()
+            self._leaders_db = db if PERSIST_MODE == "writebehind" else stat
+            self._leaders = {uname: _leader_entry(uname, u) for uname, u in db["users"].items()}
+        return [e for e in self._leaders.values() if e]
+
+    def set_leader_entry(self, username, entry):
+        self.leader_entries()
+        self._leaders[username] = entry
+
+    def archive_append(self, username, month, records):
+        _archive_append(username, month, records)
+
+    def archive_fetch(self, username, month, sid):
+        return _archive_fetch(username, month, sid)
+
+    def archive_delete(self, username, month, sid):
+        return _archive_delete(username, month, sid)
+
+    def archive_remove_user(self, username):
+        _archive_remove_user(username)
+
+    def archive_months(self, username):
+        return _archive_months(username)
+
+    def mark_dirty(self, username):
+        with DB_LOCK:
+            self._snap_dirty.add(username)
+
+    def take_dirty(self):
+        """마지막 스냅샷 이후 바뀐 사용자 (가져가면 비워짐 — 실패 시 mark_dirty 로 되돌린다)"""
+        with DB_LOCK:
+            names, self._snap_dirty = self._snap_dirty, set()
+        return names
+
+    def snapshot_lock(self):
+        return contextlib.nullcontext(True)  # 노드 하나 — 프로세스 안 중복은 _SNAPSHOT_LOCK 이 막는다
+
+    def archive_records(self, username, month):
+        return _archive_records(username, month)
+
+    def corpus_version(self):
+        return None
+
+    def get_user_corpus(self, cid):
+        return _corpus_file_get(cid)
+
+    def put_user_corpus(self, cid, corpus):
+        _corpus_file_put(cid, corpus)
+
+class KVStore:
+    """redis-py 호환 클라이언트 위의 저장소. 키 구성(접두어 quiz:):
+    user:<이름> 사용자 JSON, users 사용자 이름 집합, leaders 이름→랭킹 항목 해시,
+    archive:<이름>:<월> gzip JSON 리스트, archives:<이름> 월 집합, lock:<이름> 사용자 잠금,
+    corpus:current 현재 코퍼스 버전, corpus:<버전> 코퍼스 JSON, ucorpus:<id> 업로드 코퍼스 gzip JSON,
+    secret 세션 서명 키"""
+    shared = True
+    PREFIX = "quiz:"
+
+    def __init__(self, kv):
+        self.kv = kv
+
+    def _k(self, *parts):
+        return self.PREFIX + ":".join(parts)
+
+    def process_lock(self):
+        return contextlib.nullcontext()  # 프로세스 전역 잠금 없이 사용자 단위로만 직렬화
+
+    @contextlib.contextmanager
+    def user_lock(self, username):
+        if not username:
+            yield
+            return
+        lock = self.kv.lock(self._k("lock", username), timeout=USER_LOCK_TTL, blocking_timeout=USER_LOCK_WAIT)
+        if not lock.acquire():
+            raise StoreBusy()
+        try:
+            yield
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass  # TTL 만료 후 해제 실패 — 이미 풀린 잠금
+
+    def warm(self):
+        pass
+
+    def migrate(self):
+        """이전 스키마 사용자 레코드를 올려 저장 (완료 표시 키가 있으면 건너뜀, 여러 노드 중 하나만 수행)"""
+        done = str(SCHEMA_VERSION).encode("ascii")
+        if self.kv.get(self._k("schema")) == done:
+            return 0
+        lock = self.kv.lock(self._k("lock", "@migrate"), timeout=600, blocking_timeout=600)
+        if not lock.acquire():
+            raise StoreBusy()
+        try:
+            if self.kv.get(self._k("schema")) == done:
+                return 0
+            count = 0
+            for uname in self.usernames():
+                with self.user_lock(uname):
+                    u = self.get_user(uname)
+                    if isinstance(u, dict) and migrate_user(u):
+                        self.put_user(uname, u)
+                        count += 1
+            self.kv.set(self._k("schema"), done)
+            return count
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass
+
+    def get_user(self, username):
+        raw = self.kv.get(self._k("user", username))
+        return loads_json(raw) if raw is not None else None
+
+    def put_user(self, username, u):
+        self.kv.set(self._k("user", username), dumps_json(u))
+        self.kv.sadd(self._k("users"), username)
+
+    def user_count(self):
+        return self.kv.scard(self._k("users"))
+
+    def usernames(self):
+        return [n.decode("utf-8") if isinstance(n, bytes) else n for n in self.kv.smembers(self._k("users"))]
+
+    def leader_entries(self):
+        return [loads_json(v) for v in self.kv.hvals(self._k("leaders"))]
+
+    def set_leader_entry(self, username, entry):
+        if entry:
+            self.kv.hset(self._k("leaders"), username, dumps_json(entry))
+        else:
+            self.kv.hdel(self._k("leaders"), username)
+
+    def archive_append(self, username, month, records):
+        self.kv.rpush(self._k("archive", username, month), *[gzip.compress(dumps_json(r)) for r in records])
+        self.kv.sadd(self._k("archives", username), month)
+
+    def archive_fetch(self, username, month, sid):
+        # 같은 id가 여러 번 있으면 마지막 기록 우선
+        for raw in reversed(self.kv.lrange(self._k("archive", username, month), 0, -1)):
+            rec = loads_json(gzip.decompress(raw))
+            if rec.get("id") == sid:
+                return rec
+        return None
+
+    def archive_months(self, username):
+        return sorted(m.decode("utf-8") if isinstance(m, bytes) else m for m in self.kv.smembers(self._k("archives", username)))
+
+    def archive_delete(self, username, month, sid):
+        key = self._k("archive", username, month)
+        removed = 0
+        for raw in self.kv.lrange(key, 0, -1):
+            if loads_json(gzip.decompress(raw)).get("id") == sid:
+                removed += self.kv.lrem(key, 0, raw)
+        return removed
+
+    def mark_dirty(self, username):
+        self.kv.sadd(self._k("snapdirty"), username)
+
+    def take_dirty(self):
+        # 읽은 이름만 지우고 레코드는 그 뒤에 읽으므로, 사이에 들어온 변경도 이번 스냅샷에 담긴다
+        names = self.kv.smembers(self._k("snapdirty"))
+        if names:
+            self.kv.srem(self._k("snapdirty"), *names)
+        return {n.decode("utf-8") if isinstance(n, bytes) else n for n in names}
+
+    @contextlib.contextmanager
+    def snapshot_lock(self):
+        """여러 노드 중 하나만 스냅샷을 뜨도록 (못 얻으면 False — 이번 주기는 건너뜀)"""
+        lock = self.kv.lock(self._k("lock", "@snapshot"), timeout=SNAPSHOT_INTERVAL or 300, blocking_timeout=0)
+        got = lock.acquire()
+        try:
+            yield got
+        finally:
+            if got:
+                try:
+                    lock.release()
+                except Exception:
+                    pass
+
+    def archive_records(self, username, month):
+        return [loads_json(gzip.decompress(raw)) for raw in self.kv.lrange(self._k("archive", username, month), 0, -1)]
+
+    def archive_remove_user(self, username):
+        months = self.archive_months(username)
+        self.kv.delete(self._k("archives", username), *[self._k("archive", username, m) for m in months])
+
+    def corpus_version(self):
+        v = self.kv.get(self._k("corpus", "current"))
+        return v.decode("ascii") if isinstance(v, bytes) else v
+
+    def get_corpus(self, version):
+        raw = self.kv.get(self._k("corpus", version))
+        return loads_json(raw) if raw is not None else None
+
+    def put_corpus(self, version, corpus, make_current=True):
+        """코퍼스 본문은 버전(내용 해시) 키로 불변 저장, make_current=False 면 현재 버전이 없을 때만 지정"""
+        self.kv.set(self._k("corpus", version), dumps_json(corpus))
+        self.kv.set(self._k("corpus", "current"), version, nx=not make_current)
+        return self.corpus_version()
+
+    def get_user_corpus(self, cid):
+        raw = self.kv.get(self._k("ucorpus", cid))
+        return loads_json(gzip.decompress(raw)) if raw is not None else None
+
+    def put_user_corpus(self, cid, corpus):
+        # 같은 id = 같은 내용이므로 이미 있으면 그대로 둔다
+        self.kv.set(self._k("ucorpus", cid), gzip.compress(dumps_json(corpus), 6), nx=True)
+
+    def shared_secret(self):
+        self.kv.set(self._k("secret"), secrets.token_hex(32), nx=True)
+        return self.kv.get(self._k("secret")).decode("ascii")
+
+class LocalKV:
+    """KVStore가 쓰는 redis 명령만 흉내 낸 프로세스 내 KV (값은 bytes, 잠금 TTL은 무시)"""
+    def __init__(self):
+        self._data = {}
+        self._mutex = threading.RLock()
+        self._locks = {}
+
+    @staticmethod
+    def _b(v):
+        return v.encode("utf-8") if isinstance(v, str) else v
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value, nx=False):
+        with self._mutex:
+            if nx and key in self._data:
+                return None
+            self._data[key] = self._b(value)
+            return True
+
+    def delete(self, *keys):
+        with self._mutex:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+
+    def sadd(self, key, *members):
+        with self._mutex:
+            st = self._data.setdefault(key, set())
+            n = len(st)
+            st.update(self._b(m) for m in members)
+            return len(st) - n
+
+    def smembers(self, key):
+        with self._mutex:
+            return set(self._data.get(key, ()))
+
+    def srem(self, key, *members):
+        with self._mutex:
+            st = self._data.get(key, set())
+            n = len(st)
+            st.difference_update(self._b(m) for m in members)
+            return n - len(st)
+
+    def scard(self, key):
+        return len(self._data.get(key, ()))
+
+    def hset(self, name, key, value):
+        with self._mutex:
+            self._data.setdefault(name, {})[self._b(key)] = self._b(value)
+
+    def hdel(self, name, *keys):
+        with self._mutex:
+            h = self._data.get(name, {})
+            return sum(h.pop(self._b(k), None) is not None for k in keys)
+
+    def hvals(self, name):
+        with self._mutex:
+            return list(self._data.get(name, {}).values())
+
+    def rpush(self, key, *values):
+        with self._mutex:
+            lst = self._data.setdefault(key, [])
+            lst.extend(self._b(v) for v in values)
+            return len(lst)
+
+    def lrange(self, key, start, end):
+        with self._mutex:
+            lst = self._data.get(key, [])
+            return lst[start:] if end == -1 else lst[start:end + 1]
+
+    def lrem(self, key, count, value):
+        # count=0(전부)만 쓴다
+        with self._mutex:
+            lst = self._data.get(key, [])
+            kept = [v for v in lst if v != self._b(value)]
+            self._data[key] = kept
+            return len(lst) - len(kept)
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        with self._mutex:
+            lk = self._locks.setdefault(name, threading.Lock())
+        return _LocalLock(lk, blocking_timeout)
+
+class _LocalLock:
+    def __init__(self, lk, blocking_timeout):
+        self._lk = lk
+        self._wait = -1 if blocking_timeout is None else blocking_timeout
+
+    def acquire(self):
+        return self._lk.acquire(timeout=self._wait)
+
+    def release(self):
+        self._lk.release()
+
+def make_store(kind):
+    if kind == "redis":
+        if redis is None:
+            raise RuntimeError("QUIZ_STORE=redis 에는 redis 패키지가 필요합니다 (pip install redis)")
+        return KVStore(redis.Redis.from_url(REDIS_URL))
+    if kind == "memory":
+        return KVStore(LocalKV())
+    return FileStore()
+
+STORE = make_store(STORE_KIND)
+if STORE.shared and not os.environ.get("BIBLE_QUIZ_SECRET"):
+    app.secret_key = STORE.shared_secret()
+
+@app.errorhandler(StoreBusy)
+def _store_busy(e):
+    resp = jsonify({"ok": False, "error": "요청이 몰려 처리하지 못했습니다. 잠시 후 다시 시도하세요."})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+def db_locked(fn):
+    """라우트 전체를 저장소 잠금 안에서 실행 — file: DB_LOCK(메모리 DB 동시 수정 방지),
+    공유 저장소: 수정 요청(GET 외)은 현재 사용자 잠금(노드 간)"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        user_lock = STORE.user_lock(current_username()) if request.method != "GET" else contextlib.nullcontext()
+        with STORE.process_lock(), user_lock:
+            return fn(*args, **kwargs)
+    return wrapper
+
+def ensure_user(username):
+    """사용자 레코드(없으면 기본값으로 새로 만든 것 — 저장은 save_user)"""
+    u = STORE.get_user(username)
+    if not isinstance(u, dict):
+        return new_user()
+    migrate_user(u)  # 기동 시 이미 올렸으면 버전 비교 한 번 (가져오기/복원/구 노드가 쓴 레코드 대비)
     return u
 
+def save_user(username, u):
+    STORE.put_user(username, u)
+    STORE.set_leader_entry(username, _leader_entry(username, u))
+    STORE.mark_dirty(username)
+    _ensure_snapshotter()
+
+# ------------------------------
+# 세션 보존 정책 (최근 N개 시험만 상세 보관, 나머지는 집계 + 월별 압축 아카이브)
+# ------------------------------
+ARCHIVE_DIR = os.environ.get("QUIZ_ARCHIVE_DIR", "quiz_archive")
+KEEP_FULL_EXAMS = int(os.environ.get("QUIZ_KEEP_FULL_EXAMS", "50"))
+
+def is_exam_session(se):
+    # 리더보드/대시보드와 같은 기준: 시험 타입이거나 2문항 이상 세트
+    return se.get("type") == "exam" or (se.get("total", 0) or 0) > 1
+
+def _archive_path(username, month):
+    # 사용자명은 임의 문자열이므로 파일명으로 안전하게 인코딩
+    return os.path.join(ARCHIVE_DIR, quote(username, safe=""), f"{month}.jsonl.gz")
+
+def _session_month(se):
+    d = se.get("dateISO") or ""
+    return d[:7] if len(d) >= 7 else "unknown"
+
+def _aggregate_session(se, month):
+    """상세(details/questionsDump)를 버리고 점수·집계만 남긴 세션 레코드"""
+    tallies = {"subjT": 0, "subjC": 0, "objT": 0, "objC": 0, "skipT": 0, "skipC": 0}
+    by_book = {}  # book -> [시도, 오답]
+    for d in se.get("details") or []:
+        if not isinstance(d, dict):
+            continue
+        if d.get("subj"):
+            tallies["subjT"] += 1
+            tallies["subjC"] += 1 if d.get("correct") else 0
+        else:
+            tallies["objT"] += 1
+            tallies["objC"] += 1 if d.get("correct") else 0
+        tallies["skipT"] += 1
+        tallies["skipC"] += 1 if d.get("skipped") else 0
+        bt = by_book.setdefault(d.get("book") or "(미상)", [0, 0])
+        bt[0] += 1
+        if d.get("skipped") or not d.get("correct"):
+            bt[1] += 1
+    agg = {k: se[k] for k in ("id", "attemptId", "type", "dateISO", "total", "correct", "skip", "score", "originSessionId") if k in se}
+    agg["archived"] = month
+    agg["tallies"] = tallies
+    agg["byBook"] = by_book
+    return agg
+
+def _archive_append(username, month, records):
+    path = _archive_path(username, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # gzip 멤버 이어붙이기: 기존 파일을 다시 압축하지 않고 append
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+def _archive_fetch(username, month, sid):
+    """아카이브에서 세션 상세를 찾는다(같은 id가 여러 번 있으면 마지막 기록 우선)"""
+    path = _archive_path(username, month)
+    found = None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if sid not in line:
+                    continue
+                rec = json.loads(line)
+                if rec.get("id") == sid:
+                    found = rec
+    except FileNotFoundError:
+        return None
+    return found
+
+def _archive_delete(username, month, sid):
+    """월 아카이브에서 세션 상세를 지운다(남는 기록으로 파일을 다시 써서 교체). 반환: 지운 기록 수"""
+    path = _archive_path(username, month)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return 0
+    kept = [line for line in lines if sid not in line or json.loads(line).get("id") != sid]
+    if len(kept) == len(lines):
+        return 0
+    if not kept:
+        os.remove(path)
+    else:
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+    return len(lines) - len(kept)
+
+def _archive_months(username):
+    try:
+        names = os.listdir(os.path.join(ARCHIVE_DIR, quote(username, safe="")))
+    except FileNotFoundError:
+        return []
+    return sorted(n[:-len(".jsonl.gz")] for n in names if n.endswith(".jsonl.gz"))
+
+def _archive_records(username, month):
+    try:
+        with gzip.open(_archive_path(username, month), "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def _archive_remove_user(username):
+    shutil.rmtree(os.path.join(ARCHIVE_DIR, quote(username, safe="")), ignore_errors=True)
+
+def apply_retention(username, u):
+    """최근 KEEP_FULL_EXAMS개를 넘는 오래된 시험의 상세를 아카이브로 옮기고 집계 레코드로 대체 (대체된 집계 목록 반환)"""
+    sessions = u.get("sessions", [])
+    full = [i for i, se in enumerate(sessions)
+            if isinstance(se, dict) and is_exam_session(se) and not se.get("archived")]
+    excess = len(full) - KEEP_FULL_EXAMS
+    if excess <= 0:
+        return []
+    full.sort(key=lambda i: sessions[i].get("dateISO", ""))
+    old = full[:excess]
+    by_month = {}
+    for i in old:
+        se = sessions[i]
+        by_month.setdefault(_session_month(se), []).append(
+            {"id": se.get("id"), "details": se.get("details", []), "questionsDump": se.get("questionsDump")})
+    # 아카이브 기록이 끝난 뒤에만 원본을 집계로 교체(중간 실패 시 데이터 유실 방지)
+    for month, recs in by_month.items():
+        STORE.archive_append(username, month, recs)
+    for i in old:
+        sessions[i] = _aggregate_session(sessions[i], _session_month(sessions[i]))
+    return [sessions[i] for i in old]
+
 def current_username():
-    return session.get("username")
+    uname = session.get("username")
+    if uname and METRICS_ENABLED:
+        _ACTIVE_USERS[uname] = time.time()
+    return uname
 
 def require_login():
     return bool(current_username())
 
+# ------------------------------
+# 성경 책 이름 별칭 + 자유 형식 참조 파서 ("누가 2:1", "테살로니카 1서 4장 3절", "1 Thess 4:3")
+# ------------------------------
+# 책마다 고유 id(영문 약어)에 가톨릭/개신교 전체 이름·약어·영문 이름을 모두 별칭으로 건다.
+# 별칭은 NFKC·소문자·공백/마침표 제거 형태로 트라이에 넣고, 입력은 앞에서부터 한 글자씩 트라이를 따라가며
+# (공백·마침표는 건너뜀) 끝나는 지점마다 후보를 남긴다 — 입력 길이에 비례하는 한 번의 순회.
+# 후보 중 나머지가 "장[:절[-끝 절]]"로 읽히는 것을 고르되 절까지 읽히는 해석 > 장만 > 책만, 같으면 긴 일치 우선
+# ("john 3 16" 은 3john 이 아니라 john 3:16). 클라이언트 채점도 /book_aliases 로 같은 표를 받아 같은 방식으로 푼다.
+_BOOK_ALIASES = """
+gen 창세기 창세 창 genesis gen gn ge
+exod 탈출기 탈출 출애굽기 출애굽 출 exodus exod ex
+lev 레위기 레위 레 leviticus lev lv
+num 민수기 민수 민 numbers num nm
+deut 신명기 신명 신 deuteronomy deut dt
+josh 여호수아기 여호수아 여호 수 joshua josh jos
+judg 판관기 판관 사사기 사사 삿 judges judg jdg
+ruth 룻기 룻 ruth rt
+ezra 에즈라기 에즈라 에즈 에스라 스 ezra ezr
+neh 느헤미야기 느헤미야 느헤 느 nehemiah neh
+tob 토빗기 토빗 tobit tob
+jdt 유딧기 유딧 judith jdt
+esth 에스테르기 에스테르 에스 에스더 에 esther esth est
+job 욥기 욥 job jb
+ps 시편 시 psalms psalm ps psa
+prov 잠언 잠 proverbs prov prv
+eccl 코헬렛 코헬 전도서 전도 전 ecclesiastes eccl ecc qoheleth
+song 아가 아가서 아 songofsongs songofsolomon song sos
+wis 지혜서 지혜 wisdom wis
+sir 집회서 집회 sirach sir ecclesiasticus
+isa 이사야서 이사야 이사 사 isaiah isa
+jer 예레미야서 예레미야 예레 렘 jeremiah jer
+lam 애가 예레미야애가 애 lamentations lam
+bar 바룩서 바룩 baruch bar
+ezek 에제키엘서 에제키엘 에제 에스겔 겔 ezekiel ezek eze
+dan 다니엘서 다니엘 다니 단 daniel dan dn
+hos 호세아서 호세아 호세 호 hosea hos
+joel 요엘서 요엘 욜 joel jl
+amos 아모스서 아모스 아모 암 amos am
+obad 오바드야서 오바드야 오바 오바댜 옵 obadiah obad ob
+jonah 요나서 요나 욘 jonah jon
+mic 미카서 미카 미가 미 micah mic
+nah 나훔서 나훔 나 nahum nah
+hab 하바쿡서 하바쿡 하바 하박국 합 habakkuk hab
+zeph 스바니야서 스바니야 스바 스바냐 습 zephaniah zeph
+hag 하까이서 하까이 하까 학개 학 haggai hag
+zech 즈카르야서 즈카르야 즈카 스가랴 슥 zechariah zech
+mal 말라키서 말라키 말라 말라기 말 malachi mal
+matt 마태오복음서 마태오복음 마태오 마태복음 마태 마 matthew matt mt
+mark 마르코복음서 마르코복음 마르코 마르 마가복음 마가 막 mark mk mrk
+luke 루카복음서 루카복음 루카 누가복음 누가 눅 luke lk
+john 요한복음서 요한복음 요한 요 john jn
+acts 사도행전 사도 행전 행 acts ac
+rom 로마신자들에게보낸서간 로마서 로마 롬 romans rom
+gal 갈라티아신자들에게보낸서간 갈라티아서 갈라티아 갈라 갈라디아서 갈라디아 갈 galatians gal
+eph 에페소신자들에게보낸서간 에페소서 에페소 에페 에베소서 에베소 엡 ephesians eph
+phil 필리피신자들에게보낸서간 필리피서 필리피 필리 빌립보서 빌립보 빌 philippians phil php
+col 콜로새신자들에게보낸서간 콜로새서 콜로새 콜로 골로새서 골로새 골 colossians col
+titus 티토에게보낸서간 티토서 티토 디도서 디도 딛 titus tit
+phlm 필레몬에게보낸서간 필레몬서 필레몬 필레 빌레몬서 빌레몬 몬 philemon phlm phm
+heb 히브리인들에게보낸서간 히브리서 히브리 히브 히 hebrews heb
+jas 야고보서간 야고보서 야고보 야고 약 james jas jm
+jude 유다서간 유다서 유다 유 jude jud
+rev 요한묵시록 묵시록 묵시 요한계시록 계시록 계 revelation rev rv apocalypse
+"""
+# 번호 붙은 책: (id 뒷부분, 권 수, 한국어 이름 뿌리, 영문 이름 뿌리, 개신교 약어(권 순서))
+# 뿌리마다 "1테살", "테살1서", "테살일서", "테살첫째서간", "테살전서", "테살상", "테살상권", "1thess", "ithess",
+# "firstthess" 꼴을 만든다 — 실제로 안 쓰는 꼴(예: "고린도상")이 생겨도 다른 책과 겹치지 않으면 해가 없다
+_NUMBERED_BOOKS = [
+    ("sam", 2, "사무엘기 사무엘 사무", "samuel sam sa", "삼상 삼하"),
+    ("kgs", 2, "열왕기 열왕", "kings kgs ki", "왕상 왕하"),
+    ("chr", 2, "역대기 역대", "chronicles chron chr", "대상 대하"),
+    ("macc", 2, "마카베오기 마카베오 마카", "maccabees macc mac", ""),
+    ("cor", 2, "코린토신자들에게보낸 코린토 코린 고린도 고린", "corinthians cor co", "고전 고후"),
+    ("thess", 2, "테살로니카신자들에게보낸 테살로니카 테살 데살로니가 데살", "thessalonians thess thes th", "살전 살후"),
+    ("tim", 2, "티모테오에게보낸 티모테오 티모 디모데 디모", "timothy tim ti", "딤전 딤후"),
+    ("pet", 2, "베드로의 베드로 베드", "peter pet pt", "벧전 벧후"),
+    ("john", 3, "요한의 요한", "john jn jo", "요일 요이 요삼"),
+]
+_KO_NUM = ("", "일", "이", "삼")
+_KO_ORD = ("", "첫째", "둘째", "셋째")
+_KO_PAIR = ("", ("전", "상"), ("후", "하"))
+_EN_NUM = ("", ("i", "first", "1st"), ("ii", "second", "2nd"), ("iii", "third", "3rd"))
+_REF_SKIP = frozenset(" \t\r\n.·")
+_REF_TAIL = re.compile(r"^\s*(?:(\d+)(?:\s*[:,.]\s*|\s+)(\d+)(?:\s*[-~]\s*(\d+))?|(\d+))?\s*\.?\s*$")
+_REF_FUZZY = re.compile(r"^\s*(\d?)\s*([^\d:,.]+?)\s*((?:\d.*)?)$")
+
+def ref_fold(s):
+    """별칭 비교용: NFKC, 소문자, 공백·마침표 제거"""
+    return "".join(ch for ch in unicodedata.normalize("NFKC", s or "").lower() if ch not in _REF_SKIP)
+
+def _book_alias_table():
+    table = {}
+    def add(alias, bid):
+        table.setdefault(ref_fold(alias), bid)  # 먼저 적은 책이 우선 (겹치는 별칭은 표 순서로 정한다)
+    for line in _BOOK_ALIASES.strip().splitlines():
+        bid, *aliases = line.split()
+        for a in aliases:
+            add(a, bid)
+    for key, count, ko, en, abbrs in _NUMBERED_BOOKS:
+        abbrs = abbrs.split()
+        for n in range(1, count + 1):
+            bid = f"{n}{key}"
+            for b in ko.split():
+                for form in (f"{n}{b}", f"{b}{n}서", f"{b}{_KO_NUM[n]}서", f"{b}{_KO_ORD[n]}서간"):
+                    add(form, bid)
+                if count == 2:
+                    for w in _KO_PAIR[n]:
+                        add(f"{b}{w}서", bid)
+                        add(f"{b}{w}", bid)
+                        add(f"{b}{w}권", bid)
+            for b in en.split():
+                add(f"{n}{b}", bid)
+                for w in _EN_NUM[n]:
+                    add(f"{w}{b}", bid)
+            if abbrs:
+                add(abbrs[n - 1], bid)
+    return table
+
+BOOK_ALIAS_TABLE = _book_alias_table()  # 접힌 별칭 -> 책 id
+
+def _build_alias_trie(table):
+    root = {}
+    for alias, bid in table.items():
+        node = root
+        for ch in alias:
+            node = node.setdefault(ch, {})
+        node[""] = bid
+    return root
+
+_ALIAS_TRIE = _build_alias_trie(BOOK_ALIAS_TABLE)
+
+def _alias_deletes(s):
+    return {s[:j] + s[j + 1:] for j in range(len(s))}
+
+def _build_alias_fuzzy(table):
+    """오타 한 글자(삭제/삽입/치환) 허용 조회표 — 세 글자 이상 별칭만 (짧은 약어는 오타 구분이 안 된다)"""
+    out = defaultdict(set)
+    for alias, bid in table.items():
+        if len(alias) >= 3:
+            out[alias].add(bid)
+            for d in _alias_deletes(alias):
+                out[d].add(bid)
+    return dict(out)
+
+_ALIAS_FUZZY = _build_alias_fuzzy(BOOK_ALIAS_TABLE)
+
+def _ref_tail(rest):
+    """책 이름 뒤 나머지 → (장, 절, 끝 절) — 모르는 꼴이면 None"""
+    mt = _REF_TAIL.match(rest.replace("장", " ").replace("절", " "))
+    if not mt:
+        return None
+    if mt.group(4):
+        return int(mt.group(4)), None, None
+    if mt.group(1):
+        return int(mt.group(1)), int(mt.group(2)), int(mt.group(3)) if mt.group(3) else None
+    return None, None, None
+
+def parse_reference(text, fuzzy=False):
+    """자유 형식 참조 → (책 id, 장, 절, 끝 절) — 없는 부분은 None, 책을 못 찾으면 None.
+    fuzzy=True 면 트라이에 없는 책 이름을 오타 한 글자까지 허용해 다시 찾는다(뜻이 하나로 정해질 때만)"""
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    node, cands = _ALIAS_TRIE, []
+    for j, ch in enumerate(s):
+        if ch in _REF_SKIP:
+            continue
+        node = node.get(ch)
+        if node is None:
+            break
+        if "" in node:
+            cands.append((node[""], j + 1))
+    best, best_rank = None, -1
+    for bid, end in reversed(cands):  # 긴 일치부터
+        tail = _ref_tail(s[end:])
+        if tail is None:
+            continue
+        rank = (tail[0] is not None) + (tail[1] is not None)
+        if rank > best_rank:
+            best, best_rank = (bid, *tail), rank
+    if best is None and fuzzy:
+        mt = _REF_FUZZY.match(s)
+        tail = _ref_tail(mt.group(3)) if mt else None
+        if tail is not None:
+            name = ref_fold(mt.group(1) + mt.group(2))
+            ids = set()
+            for k in _alias_deletes(name) | {name}:
+                ids |= _ALIAS_FUZZY.get(k, set())
+            if len(ids) == 1:
+                best = (ids.pop(), *tail)
+    return best
+
+def book_id(name):
+    """책 이름(별칭) → 책 id, 모르는 이름이면 None"""
+    ref = parse_reference(name)
+    return ref[0] if ref and ref[1] is None else None
+
+CORPUS_BOOKS = {}  # 책 id -> 현재 코퍼스의 책 이름 (코퍼스 로드 때 채움)
+
+def corpus_books(verses):
+    """책 id -> 코퍼스에 처음 나온 책 이름"""
+    books = {}
+    for name in dict.fromkeys(v["book"] for v in verses):
+        bid = book_id(name)
+        if bid:
+            books.setdefault(bid, name)
+    return books
+
+def corpus_book(name, fuzzy=False):
+    """사용자가 쓴 책 이름 → 현재 코퍼스의 책 이름 (모르는 이름은 그대로)"""
+    ref = parse_reference(name, fuzzy)
+    if ref and ref[1] is None and ref[0] in CORPUS_BOOKS:
+        return CORPUS_BOOKS[ref[0]]
+    return (name or "").strip()
+
+def book_aliases_entry():
+    global _BOOK_ALIASES_CACHE
+    if _BOOK_ALIASES_CACHE is None:
+        _BOOK_ALIASES_CACHE = make_cached_body(dumps_json({"ok": True, "aliases": BOOK_ALIAS_TABLE}),
+                                               "application/json")
+    return _BOOK_ALIASES_CACHE
+
+_BOOK_ALIASES_CACHE = None
+
+# ------------------------------
+# 구절 검색 (문자 n-gram 역색인): GET /search?q=
+# ------------------------------
+# 한글은 띄어쓰기가 번역/사용자마다 달라 단어 단위 색인이 맞지 않는다 — 채점과 같은 정규화(NFKC, 소문자,
+# 문장부호 제거)에 공백까지 지운 본문의 문자 1-gram/2-gram 역색인을 쓴다. 검색어 하나는 "공백 무시 부분 문자열".
+# 질의 문법: 단어 여러 개 = 모두 포함(AND), "따옴표" = 구(공백 무시 연속), 단어* = 어절이 그 단어로 시작(접두)
+# 후보는 검색어 n-gram 중 가장 드문 두 개의 게시 목록 교집합, 실제 포함 여부는 점수 계산(str.count)에서 확인한다.
+# 순위: Σ 검색어별 idf × (1 + log 출현 수) × (어절 시작 일치 가산) ÷ 본문 길이 보정, 동점은 코퍼스 순서
+_SEARCH_PUNCT = re.compile(r"[\u2000-\u206F\u2E00-\u2E7F\\'!\"#$%&()*+,\-./:;<=>?@\[\]^_`{|}~]")
+_SEARCH_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+SEARCH_LIMIT_MAX = 100
+
+def search_normalize(text):
+    """채점(normalizeText)과 같은 정규화 — 반환: (공백 하나로 정리한 본문, 공백을 모두 지운 본문)"""
+    spaced = " ".join(_SEARCH_PUNCT.sub(" ", unicodedata.normalize("NFKC", text or "").lower()).split())
+    return spaced, spaced.replace(" ", "")
+
+class VerseSearchIndex:
+    def __init__(self, verses):
+        self.verses = verses
+        self.compact = []   # 구절 번호 -> 공백 제거 정규화 본문
+        self.padded = []    # 구절 번호 -> " " + 공백 정리 본문 (어절 시작 = " "+검색어 포함)
+        postings = defaultdict(lambda: array("I"))  # n-gram -> 구절 번호 목록(오름차순, 중복 없음)
+        for i, v in enumerate(verses):
+            spaced, compact = search_normalize(v["text"])
+            self.compact.append(compact)
+            self.padded.append(" " + spaced)
+            grams = set(compact)
+            grams.update(map(str.__add__, compact, compact[1:]))
+            for gm in grams:
+                postings[gm].append(i)
+        self.postings = dict(postings)
+        self.avg_len = (sum(map(len, self.compact)) / len(self.compact)) if self.compact else 1.0
+
+    def _grams(self, term):
+        return [term] if len(term) == 1 else [term[j:j + 2] for j in range(len(term) - 1)]
+
+    def _candidates(self, term):
+        lists = sorted((self.postings.get(gm, ()) for gm in set(self._grams(term))), key=len)
+        if not lists or not lists[0]:
+            return [], 0
+        rarest = lists[0]
+        if len(lists) == 1:
+            return rarest, len(rarest)
+        return set(rarest).intersection(lists[1]), len(rarest)
+
+    @staticmethod
+    def parse_query(q):
+        """→ [(공백 제거 검색어, 종류 'term'|'phrase'|'prefix', 어절 시작 확인용 " "+정리된 검색어)]"""
+        terms = []
+        for phrase, word in _SEARCH_QUERY.findall(q or ""):
+            kind = "phrase" if phrase else "term"
+            raw = phrase or word
+            if kind == "term" and raw.endswith("*"):
+                kind, raw = "prefix", raw.rstrip("*")
+            spaced, compact = search_normalize(raw)
+            if compact:
+                terms.append((compact, kind, " " + spaced))
+        return terms
+
+    def search(self, q, limit=20, book=None):
+        """반환: (일치 구절 수, [(점수, 구절 번호)] 점수 내림차순 상위 limit개)"""
+        terms = self.parse_query(q)
+        if not terms:
+            return 0, []
+        n = len(self.verses)
+        # 가장 드문 검색어부터 후보를 좁힌다
+        planned = []
+        for term, kind, head in terms:
+            cands, df = self._candidates(term)
+            if not cands:
+                return 0, []
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5)) * (1.5 if kind == "phrase" else 1.0)
+            planned.append((df, term, kind, head, idf, cands))
+        planned.sort(key=lambda t: t[0])
+        alive = planned[0][5]
+        for p in planned[1:]:
+            alive = set(alive).intersection(p[5])
+            if not alive:
+                return 0, []
+        compact, padded, avg = self.compact, self.padded, self.avg_len
+        verses = self.verses
+        checks = [(term, kind == "prefix", head, idf) for _, term, kind, head, idf, _ in planned]
+        scored = []
+        for i in alive:
+            if book and verses[i]["book"] != book:
+                continue
+            text, words = compact[i], padded[i]
+            score = 0.0
+            # 출현 수·어절 시작 여부는 str.count / in (C 구현)으로만 — 흔한 검색어도 후보 하나당 몇 번의 호출
+            for term, prefix, head, idf in checks:
+                at_start = head in words
+                occ = words.count(head) if prefix else text.count(term)
+                if not occ:
+                    break
+                score += idf * (1.0 + math.log(occ)) * (1.3 if at_start else 1.0)
+            else:
+                scored.append((-score / (0.5 + 0.5 * len(text) / avg), i))
+        top = heapq.nsmallest(limit, scored)
+        return len(scored), [(-neg, i) for neg, i in top]
+
+    def matching(self, q):
+        """q 에 일치하는 모든 구절 번호 (학습 세트의 저장된 검색용)"""
+        return [i for _, i in self.search(q, limit=len(self.verses))[1]]
+
+    def highlights(self, i, q):
+        """원문 기준 일치 구간 [[시작, 끝), ...] — 응답에 넣을 상위 결과에만 계산"""
+        text = self.verses[i]["text"]
+        # 원문 글자마다 정규화 결과를 이어 붙이며 공백 제거 본문 위치 -> 원문 위치 대응표를 만든다
+        back, compact = [], []
+        for j, ch in enumerate(text):
+            for c in _SEARCH_PUNCT.sub("", unicodedata.normalize("NFKC", ch).lower()):
+                if not c.isspace():
+                    compact.append(c)
+                    back.append(j)
+        compact = "".join(compact)
+        spans = []
+        for term, _, _ in self.parse_query(q):
+            pos = compact.find(term)
+            while pos >= 0:
+                spans.append([back[pos], back[pos + len(term) - 1] + 1])
+                pos = compact.find(term, pos + 1)
+        spans.sort()
+        merged = []
+        for a, b in spans:
+            if merged and a <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        return merged
+
+SEARCH_INDEX = VerseSearchIndex([])
+
+# ------------------------------
+# 답안 정렬 채점 (cloze / continue_verse): POST /grade
+# ------------------------------
+# 통과 여부는 기존 클라이언트 채점과 같은 "공백 무시 글자 LCS ÷ 긴 쪽 길이" 유사도 + 유형별 기준이고,
+# 이 유사도가 그대로 부분 점수(credit, 0~1)가 된다. 글자 LCS 길이는 비트 병렬(Allison-Dix/Hyyrö) — 긴 쪽 글자 위치를
+# 비트로 둔 int 하나를 짧은 쪽 글자마다 덧셈·논리 연산 몇 번으로 갱신하므로 수백 글자 단락도 수백 번의 정수 연산.
+# 피드백용 단어 diff 는 단어 단위 LCS 표를 역추적한다(공통 앞/뒤 단어는 먼저 잘라 표를 줄임). 두 일치 사이의
+# 빠진/추가 단어 묶음은 이어 붙여 같으면 띄어쓰기만 다른 것이라 일치로, 아니면 앞에서부터 짝지어 "바뀜"(sub)으로 본다.
+GRADE_PASS = {"cloze": 0.70, "continue_verse": 0.85, "passage_next": 0.85, "passage_fill": 0.80}
+GRADE_TEXT_MAX = 5000
+
+def lcs_len(a, b):
+    """두 문자열의 LCS 길이 — 비트 병렬, 긴 쪽 길이만큼의 비트를 쓰는 int 하나로 O(짧은 쪽 길이)번 연산"""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return 0
+    pm = {}
+    for i, ch in enumerate(a):
+        pm[ch] = pm.get(ch, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    v = mask  # 0 인 비트 수 = 지금까지의 LCS 길이
+    for ch in b:
+        u = v & pm.get(ch, 0)
+        v = ((v + u) | (v - u)) & mask
+    return len(a) - v.bit_count()
+
+def text_similarity(expected, answer):
+    """클라이언트 charSimIgnoreSpaces 와 같은 값: 정규화·공백 제거 후 LCS ÷ 긴 쪽 길이"""
+    a, b = search_normalize(expected)[1], search_normalize(answer)[1]
+    longest = max(len(a), len(b))
+    return lcs_len(a, b) / longest if longest else 0.0
+
+def _diff_tokens(text):
+    """단어 → (비교용 정규화 단어, 원래 단어) — 문장부호뿐인 단어는 뺀다"""
+    out = []
+    for w in (text or "").split():
+        norm = search_normalize(w)[1]
+        if norm:
+            out.append((norm, w))
+    return out
+
+def word_diff(expected, answer):
+    """단어 단위 정렬: [{"op": equal|missing|extra|sub, "text": 정답 쪽 단어(extra 는 답안 단어), "answer": sub 의 답안 단어}]"""
+    exp, ans = _diff_tokens(expected), _diff_tokens(answer)
+    head = 0
+    while head < len(exp) and head < len(ans) and exp[head][0] == ans[head][0]:
+        head += 1
+    tail = 0
+    while tail < len(exp) - head and tail < len(ans) - head and exp[-1 - tail][0] == ans[-1 - tail][0]:
+        tail += 1
+    e, a = exp[head:len(exp) - tail], ans[head:len(ans) - tail]
+    n, m = len(e), len(a)
+    # table[i][j] = e[i:], a[j:] 의 단어 LCS 길이 — 앞에서부터 역추적하면 연산이 순서대로 나온다
+    table = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        row, below, ei = table[i], table[i + 1], e[i][0]
+        for j in range(m - 1, -1, -1):
+            row[j] = below[j + 1] + 1 if ei == a[j][0] else max(below[j], row[j + 1])
+    raw = [("equal", tok) for tok in exp[:head]]
+    i = j = 0
+    while i < n or j < m:
+        if i < n and j < m and e[i][0] == a[j][0]:
+            raw.append(("equal", e[i])); i += 1; j += 1
+        elif j >= m or (i < n and table[i + 1][j] >= table[i][j + 1]):
+            raw.append(("missing", e[i])); i += 1
+        else:
+            raw.append(("extra", a[j])); j += 1
+    raw.extend(("equal", tok) for tok in exp[len(exp) - tail:])
+
+    out, missing, extra = [], [], []
+    def flush():
+        if missing and extra and "".join(t[0] for t in missing) == "".join(t[0] for t in extra):
+            out.extend({"op": "equal", "text": t[1]} for t in missing)  # 띄어쓰기만 다름
+        else:
+            for (ne, oe), (_, oa) in zip(missing, extra):
+                out.append({"op": "sub", "text": oe, "answer": oa})
+            out.extend({"op": "missing", "text": t[1]} for t in missing[len(extra):])
+            out.extend({"op": "extra", "text": t[1]} for t in extra[len(missing):])
+        missing.clear(); extra.clear()
+    for op, tok in raw:
+        if op == "equal":
+            flush()
+            out.append({"op": "equal", "text": tok[1]})
+        else:
+            (missing if op == "missing" else extra).append(tok)
+    flush()
+    return out
+
+def grade_text(expected, answer, qtype):
+    """주관식 서술형 채점 → {similarity, credit, correct, diff, words(연산별 단어 수)}"""
+    sim = text_similarity(expected, answer)
+    diff = word_diff(expected, answer)
+    words = {"equal": 0, "missing": 0, "extra": 0, "sub": 0}
+    for d in diff:
+        words[d["op"]] += 1
+    return {"similarity": round(sim, 4), "credit": round(sim, 3), "correct": sim >= GRADE_PASS[qtype],
+            "diff": diff, "words": words}
+
+# ------------------------------
+# 단락 (연속된 구절): GET /passage?ref=시편 23,1-6
+# ------------------------------
+# 단락 = 같은 책·장에서 절 번호가 이어지는 구절들. 코퍼스 색인(VERSE_BITMAPS.by_chapter)에서 절 순서로 꺼내고
+# 번역이 여러 개면 절마다 첫 번째 것만 쓴다. 단락 키는 "책|장|시작-끝" — /grade 가 이 키로 단락 본문 전체를 채점한다.
+# 출제(다음 절 잇기/순서 맞추기/단락 채우기)는 클라이언트가 불러온 코퍼스에서 같은 규칙으로 단락을 만든다.
+PASSAGE_VERSES_MAX = 30
+_PASSAGE_KEY = re.compile(r"^(.+)\|(\d+)\|(\d+)-(\d+)$")
+
+def corpus_passage(book, chapter, start=None, end=None, bm=None):
+    """코퍼스(bm, 기본은 서버 코퍼스)에서 book chapter 의 start~end 절 (절 순서, 절마다 하나) — 최대 PASSAGE_VERSES_MAX 절"""
+    bm = VERSE_BITMAPS if bm is None else bm
+    verses, seen = [], set()
+    for i in sorted(bm.by_chapter.get((book, chapter), ()), key=lambda i: bm.verses[i]["verse"]):
+        v = bm.verses[i]
+        if v["verse"] in seen or (start is not None and v["verse"] < start) or (end is not None and v["verse"] > end):
+            continue
+        seen.add(v["verse"])
+        verses.append(v)
+        if len(verses) >= PASSAGE_VERSES_MAX:
+            break
+    return verses
+
+def passage_text(verses):
+    return " ".join(v["text"] for v in verses)
+
+def passage_key_text(key, bm=None):
+    """단락 키 "책|장|시작-끝" → 코퍼스(기본은 서버 코퍼스)의 단락 본문 (없으면 None)"""
+    mt = _PASSAGE_KEY.match(key or "")
+    if not mt:
+        return None
+    verses = corpus_passage(mt.group(1), int(mt.group(2)), int(mt.group(3)), int(mt.group(4)), bm)
+    return passage_text(verses) if verses else None
+
+# ------------------------------
+# 구절 비트맵 (학습 세트): 코퍼스 구절 번호 i ↔ 파이썬 int 의 i번째 비트
+# ------------------------------
+# 합집합/교집합/차집합은 int 의 | & & ~ 한 번(C 구현, 구절 10만 개 = 12KB), 개수는 bit_count().
+# 책/장/참조 → 구절 번호는 코퍼스 로드 때 위치 목록으로만 만들어 두고 비트맵은 필요할 때 생성(장마다 비트맵을
+# 미리 만들면 코퍼스 크기 × 장 수만큼 메모리를 쓴다) — 자주 쓰는 조각은 _SOURCE_BITS_CACHE 에 보관
+_BYTE_BITS = [tuple(j for j in range(8) if b >> j & 1) for b in range(256)]
+
+def bits_from_indices(idxs, n):
+    buf = bytearray((n + 7) // 8)
+    for i in idxs:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+def indices_from_bits(bits):
+    out = []
+    for bi, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = bi << 3
+            out.extend(base + j for j in _BYTE_BITS[byte])
+    return out
+
+class VerseBitmaps:
+    def __init__(self, verses):
+        self.verses = verses
+        self.n = len(verses)
+        self.all = (1 << self.n) - 1
+        self.by_book = defaultdict(lambda: array("I"))
+        self.by_chapter = defaultdict(lambda: array("I"))
+        self.by_key = defaultdict(lambda: array("I"))  # 번역이 여러 개면 참조 하나에 구절 여러 개
+        for i, v in enumerate(verses):
+            self.by_book[v["book"]].append(i)
+            self.by_chapter[(v["book"], v["chapter"])].append(i)
+            self.by_key[verse_key(v)].append(i)
+        self.by_book, self.by_chapter, self.by_key = dict(self.by_book), dict(self.by_chapter), dict(self.by_key)
+
+    def book(self, book, chapters=None):
+        if not chapters:
+            return bits_from_indices(self.by_book.get(book, ()), self.n)
+        lo, hi = chapters
+        return bits_from_indices((i for (b, ch), idxs in self.by_chapter.items()
+                                  if b == book and lo <= ch <= hi for i in idxs), self.n)
+
+    def refs(self, keys):
+        return bits_from_indices((i for k in keys for i in self.by_key.get(k, ())), self.n)
+
+    def unique_keys(self, bits):
+        """비트맵 → 참조 키 목록(코퍼스 순서, 번역이 여러 개여도 한 번)"""
+        seen, out = set(), []
+        for i in indices_from_bits(bits):
+            k = verse_key(self.verses[i])
+            if k not in seen:
+                seen.add(k)
+                out.append(k)
+        return out
+
+VERSE_BITMAPS = VerseBitmaps([])
+_NO_BITMAPS = VerseBitmaps([])  # 찾지 못한 업로드 코퍼스 대신 (서버 코퍼스로 잘못 채점하지 않게)
+
 # ------------------------------
 # 서버 기본 구절 로딩(verses.csv)
 # ------------------------------
 SERVER_VERSES = []
 SERVER_VERSES_SOURCE = None  # 실제 사용 파일 경로
+SERVER_VERSE_INDEX = {}  # "Book|Chapter|Verse" -> verse
+SERVER_TEXT_INDEX = {}   # 본문 -> 첫 참조 키 (객관식 보기 압축용)
+SERVER_CORPUS_VERSION = None  # 코퍼스 내용 해시 — 공유 저장소에서 노드 간 같은 코퍼스인지 판별
+
+def verse_key(v):
+    return f"{v['book']}|{v['chapter']}|{v['verse']}"
 
 def _parse_row_to_verse(row):
     # 헤더 대소문자/변형 허용
@@ -146,7 +1536,6 @@ def _parse_row_to_verse(row):
 
 def load_server_verses_file():
     """환경변수 VERSES_FILE 경로 우선, 없으면 ./verses.csv 시도"""
-    global SERVER_VERSES, SERVER_VERSES_SOURCE
     paths = []
     env_path = os.environ.get("VERSES_FILE")
     if env_path:
@@ -175,14 +1564,177 @@ def load_server_verses_file():
                 break
             except Exception:
                 continue
+    _install_corpus(verses, src)
+
+def _install_corpus(verses, src, version=None):
+    global SERVER_VERSES, SERVER_VERSES_SOURCE, SERVER_VERSE_INDEX, SERVER_TEXT_INDEX, SERVER_CORPUS_VERSION, SEARCH_INDEX
+    global VERSE_BITMAPS, CORPUS_BOOKS
     SERVER_VERSES = verses
     SERVER_VERSES_SOURCE = src
+    SERVER_CORPUS_VERSION = version or hashlib.sha256(dumps_json(verses)).hexdigest()[:16]
+    SERVER_VERSE_INDEX = {verse_key(v): v for v in verses}
+    text_index = {}
+    for v in verses:
+        text_index.setdefault(v["text"], verse_key(v))
+    SERVER_TEXT_INDEX = text_index
+    SEARCH_INDEX = VerseSearchIndex(verses)
+    VERSE_BITMAPS = VerseBitmaps(verses)
+    CORPUS_BOOKS = corpus_books(verses)
+
+def sync_corpus(publish=False):
+    """공유 저장소의 현재 코퍼스 버전에 이 노드를 맞춘다 (file 저장소는 노드 하나라 할 일 없음).
+    처음 뜬 노드의 코퍼스가 현재 버전이 되고, 파일이 다른 노드도 같은 구절/같은 세트 덤프 복원 결과를 쓴다.
+    publish=True(/verses?reload)면 이 노드가 방금 읽은 파일을 현재 버전으로 지정"""
+    if not STORE.shared:
+        return
+    mine = {"verses": SERVER_VERSES, "source": SERVER_VERSES_SOURCE}
+    if publish:
+        STORE.put_corpus(SERVER_CORPUS_VERSION, mine, make_current=True)
+        return
+    current = STORE.corpus_version()
+    if current is None:
+        current = STORE.put_corpus(SERVER_CORPUS_VERSION, mine, make_current=False)
+    if current != SERVER_CORPUS_VERSION:
+        stored = STORE.get_corpus(current)
+        if stored:
+            _install_corpus(stored["verses"], stored.get("source"), current)
 
 # 앱 최초 기동 시 서버 기본 구절 로드
 load_server_verses_file()
+sync_corpus()
 
 # ------------------------------
-# HTML (Bootstrap + Chart.js + PapaParse)
+# 세트 덤프 압축 저장 (구절 키 + 출제 파라미터만 저장, 읽을 때 코퍼스로 복원)
+# ------------------------------
+# 클라이언트 makeQuestion()/maskWords()와 동일한 문구를 재현해야 재시험이 정확히 일치한다
+CLOZE_BLANK_HTML = '<span class="cloze-blank">____</span>'
+_WS_SPLIT = re.compile(r"(\s+)")
+
+def _format_ref(v):
+    return f"{v['book']} {v['chapter']},{v['verse']}"
+
+def _ref_from_key(key):
+    book, ch, vs = (key.split("|") + ["", ""])[:3]
+    try:
+        return {"book": book, "chapter": int(ch), "verse": int(vs)}
+    except ValueError:
+        return {"book": book, "chapter": ch, "verse": vs}
+
+def _expand_question(cq):
+    """압축 문항 → 클라이언트 questionsDump 형식"""
+    key = cq.get("ref", "")
+    v = SERVER_VERSE_INDEX.get(key) or {**_ref_from_key(key), "text": ""}
+    qtype = cq.get("qtype")
+    q = {"qtype": qtype, "subj": qtype not in ("multiple_choice", "multiple_choice_text"),
+         "verse": {"book": v["book"], "chapter": v["chapter"], "verse": v["verse"], "text": v["text"]},
+         "prompt": None, "options": None, "correctIndex": None, "maskedHtml": None}
+    ref = _format_ref(v)
+    if qtype == "identify_ref":
+        q["prompt"] = "다음 구절의 책/장/절을 입력하세요:"
+    elif qtype == "cloze":
+        words = _WS_SPLIT.split(v["text"])
+        for i in cq.get("mask", []):
+            if 0 <= i < len(words):
+                words[i] = CLOZE_BLANK_HTML
+        q["prompt"] = f"{ref} — 빈칸에 들어갔던 단어를 복원하세요:"
+        q["maskedHtml"] = "".join(words)
+    elif qtype == "continue_verse":
+        q["prompt"] = f"{ref} — 구절 전체를 입력하세요:"
+    elif qtype in ("multiple_choice", "multiple_choice_text"):
+        opts = [SERVER_VERSE_INDEX.get(k) or {**_ref_from_key(k), "text": ""} for k in cq.get("opts", [])]
+        if qtype == "multiple_choice_text":
+            q["prompt"] = f"다음 참조의 올바른 문구를 고르세요: {ref}"
+            q["options"] = [f"“{o['text']}”" for o in opts]
+        else:
+            q["prompt"] = f"다음 구절의 참조(책/장/절)를 고르세요: “{v['text']}”"
+            q["options"] = [_format_ref(o) for o in opts]
+        q["correctIndex"] = cq.get("ci")
+    return q
+
+def _cloze_mask_indices(text, masked_html):
+    """maskedHtml을 원문 토큰과 맞춰 가려진 단어 인덱스를 복원(불일치 시 None)"""
+    pos = 0
+    mask = []
+    for i, tok in enumerate(_WS_SPLIT.split(text)):
+        if i % 2 == 0 and masked_html.startswith(CLOZE_BLANK_HTML, pos):
+            mask.append(i)
+            pos += len(CLOZE_BLANK_HTML)
+        elif masked_html.startswith(tok, pos):
+            pos += len(tok)
+        else:
+            return None
+    return mask if pos == len(masked_html) else None
+
+def _option_key(qtype, label):
+    if qtype == "multiple_choice_text":
+        return SERVER_TEXT_INDEX.get(label[1:-1]) if label.startswith("“") and label.endswith("”") else None
+    book, _, chvs = label.rpartition(" ")
+    ch, _, vs = chvs.partition(",")
+    key = f"{book}|{ch}|{vs}"
+    return key if key in SERVER_VERSE_INDEX else None
+
+def _compact_question(q):
+    """questionsDump 문항 하나를 압축. 복원 결과가 원본과 정확히 같을 때만 압축본을 돌려준다"""
+    if not isinstance(q, dict) or not isinstance(q.get("verse"), dict):
+        return q
+    key = verse_key(q["verse"])
+    v = SERVER_VERSE_INDEX.get(key)
+    if v is None or v["text"] != q["verse"].get("text"):
+        return q
+    qtype = q.get("qtype")
+    cq = {"qtype": qtype, "ref": key}
+    if qtype == "cloze":
+        mask = _cloze_mask_indices(v["text"], q.get("maskedHtml") or "")
+        if mask is None:
+            return q
+        cq["mask"] = mask
+    elif qtype in ("multiple_choice", "multiple_choice_text"):
+        opts = [_option_key(qtype, o) for o in (q.get("options") or [])]
+        ci = q.get("correctIndex")
+        if None in opts or not isinstance(ci, int) or not (0 <= ci < len(opts)):
+            return q
+        opts[ci] = key  # 본문이 같은 다른 참조와 섞이지 않도록 정답 위치는 실제 참조로 고정
+        cq["opts"] = opts
+        cq["ci"] = ci
+    return cq if _expand_question(cq) == q else q
+
+def compact_session(se):
+    """저장 전 세션 압축: questionsDump는 키+파라미터로, details의 본문은 코퍼스와 같으면 제거"""
+    if not isinstance(se, dict):
+        return se
+    dump = se.get("questionsDump")
+    if isinstance(dump, list):
+        se["questionsDump"] = [_compact_question(q) for q in dump]
+    for d in se.get("details") or []:
+        if isinstance(d, dict) and "text" in d:
+            v = SERVER_VERSE_INDEX.get(f"{d.get('book')}|{d.get('chapter')}|{d.get('verse')}")
+            if v is not None and v["text"] == d["text"]:
+                del d["text"]
+    return se
+
+def _expand_detail(d):
+    if not isinstance(d, dict) or "text" in d:
+        return d
+    v = SERVER_VERSE_INDEX.get(f"{d.get('book')}|{d.get('chapter')}|{d.get('verse')}")
+    return {**d, "text": v["text"] if v else ""}
+
+def expand_session(se):
+    """읽기 시 복원: 압축 문항(ref 보유)과 본문이 빠진 details를 코퍼스로 채운 사본을 돌려준다"""
+    if not isinstance(se, dict):
+        return se
+    out = dict(se)
+    dump = se.get("questionsDump")
+    if isinstance(dump, list):
+        out["questionsDump"] = [_expand_question(q) if isinstance(q, dict) and "ref" in q else q for q in dump]
+    if se.get("details"):
+        out["details"] = [_expand_detail(d) for d in se["details"]]
+    return out
+
+# ------------------------------
+# HTML 셸 (로컬 Bootstrap CSS + 앱 CSS/JS, 외부 CDN 없음)
+# - 스타일/스크립트는 static/app.css, static/app.js 로 분리
+# - Chart.js(static/vendor)와 CSV 파서(static/csv.js)는 필요할 때 app.js가 지연 로드
+# - {{이름}} 자리표시자는 기동 시 콘텐츠 해시가 붙은 /static URL로 치환
 # ------------------------------
 INDEX_HTML = r"""<!doctype html>
 <html lang="ko">
@@ -190,21 +1742,11 @@ INDEX_HTML = r"""<!doctype html>
   <meta charset="utf-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1" />
   <title>성경 암기 퀴즈</title>
-  <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css" rel="stylesheet">
-  <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js"></script>
-  <script src="https://cdn.jsdelivr.net/npm/papaparse@5.4.1/papaparse.min.js"></script>
-  <style>
-    body { padding-bottom: 40px; }
-    .hidden { display: none; }
-    .nowrap { white-space: nowrap; }
-    .mono { font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace; }
-    .cloze-blank { border-bottom: 2px solid #999; padding: 0 6px; }
-    .question-card.correct { border-left: 6px solid #28a745; }
-    .question-card.incorrect { border-left: 6px solid #dc3545; }
-    .answer-reveal { background: #f8f9fa; border-left: 4px solid #0d6efd; padding: .75rem 1rem; margin-top: .5rem; }
-    .btn[disabled] { pointer-events: none; }
-    .scroll-sm { max-height: 180px; overflow:auto; }
-  </style>
+  <meta name="theme-color" content="#0d6efd" />
+  <link rel="manifest" href="{{manifest.webmanifest}}">
+  <link rel="icon" href="{{icon.svg}}" type="image/svg+xml">
+  <link href="{{vendor/bootstrap.min.css}}" rel="stylesheet">
+  <link href="{{app.css}}" rel="stylesheet">
 </head>
 <body>
   <nav class="navbar navbar-expand-lg bg-light border-bottom">
@@ -354,6 +1896,56 @@ INDEX_HTML = r"""<!doctype html>
           </div>
         </div>
 
+        <div class="col-12">
+          <div class="card">
+            <div class="card-body">
+              <h5 class="card-title">학습 세트 <small class="text-muted">(책·장 범위·참조 목록·검색으로 출제 범위 만들기)</small></h5>
+              <div class="row g-2 align-items-end">
+                <div class="col-6 col-md-2">
+                  <label class="form-label mb-1" for="ss-name">이름</label>
+                  <input id="ss-name" class="form-control form-control-sm" />
+                </div>
+                <div class="col-6 col-md-2">
+                  <label class="form-label mb-1" for="ss-book">책</label>
+                  <input id="ss-book" class="form-control form-control-sm" placeholder="예: 요한" />
+                </div>
+                <div class="col-6 col-md-2">
+                  <label class="form-label mb-1">장 범위</label>
+                  <div class="d-flex gap-1">
+                    <input id="ss-ch-from" type="number" min="1" class="form-control form-control-sm" placeholder="시작" />
+                    <input id="ss-ch-to" type="number" min="1" class="form-control form-control-sm" placeholder="끝" />
+                  </div>
+                </div>
+                <div class="col-6 col-md-2">
+                  <label class="form-label mb-1" for="ss-search">검색어</label>
+                  <input id="ss-search" class="form-control form-control-sm" placeholder='사랑 "길이요 진리"' />
+                </div>
+                <div class="col-12 col-md-4">
+                  <label class="form-label mb-1" for="ss-refs">참조 목록 <small class="text-muted">(; 로 구분)</small></label>
+                  <input id="ss-refs" class="form-control form-control-sm" placeholder="요한 3:16; 로마 8:28" />
+                </div>
+                <div class="col-12 d-flex flex-wrap gap-3 align-items-center">
+                  <div class="form-check">
+                    <input class="form-check-input" type="checkbox" id="ss-exclude-mastered" />
+                    <label class="form-check-label" for="ss-exclude-mastered">숙달 구절 제외</label>
+                  </div>
+                  <button class="btn btn-sm btn-outline-secondary" id="btn-ss-preview">미리보기</button>
+                  <button class="btn btn-sm btn-primary" id="btn-ss-save">세트 저장</button>
+                  <small class="text-muted" id="ss-preview"></small>
+                </div>
+              </div>
+              <div class="table-responsive mt-2">
+                <table class="table table-sm table-bordered align-middle mb-0">
+                  <thead class="table-light">
+                    <tr><th>세트</th><th class="text-end">구절</th><th class="text-end">시도</th><th class="text-end">숙달</th><th class="nowrap">액션</th></tr>
+                  </thead>
+                  <tbody id="table-study-sets"></tbody>
+                </table>
+              </div>
+            </div>
+          </div>
+        </div>
+
         <div class="col-12">
           <div class="card">
             <div class="card-body">
@@ -382,6 +1974,20 @@ INDEX_HTML = r"""<!doctype html>
               <label class="form-label mb-1">한 회차 문항 수</label>
               <input id="input-num-questions" type="number" min="5" max="100" value="30" class="form-control form-control-sm" style="width:120px" />
             </div>
+            <div>
+              <label class="form-label mb-1" for="select-study-set">출제 범위</label>
+              <select id="select-study-set" class="form-select form-select-sm" style="width:180px">
+                <option value="">전체 구절</option>
+              </select>
+            </div>
+            <div>
+              <label class="form-label mb-1" for="input-passage-ref">단락 지정 <small class="text-muted">(선택)</small></label>
+              <input id="input-passage-ref" class="form-control form-control-sm" style="width:150px" placeholder="시편 23,1-6" />
+            </div>
+            <div>
+              <label class="form-label mb-1" for="input-passage-len">단락 길이</label>
+              <input id="input-passage-len" type="number" min="2" max="12" value="4" class="form-control form-control-sm" style="width:80px" />
+            </div>
             <div>
               <label class="form-label mb-1">문제 유형</label>
               <div class="d-flex flex-wrap gap-3">
@@ -405,6 +2011,18 @@ INDEX_HTML = r"""<!doctype html>
                   <input class="form-check-input" type="checkbox" value="multiple_choice_text" id="qtype-mc-text" checked />
                   <label class="form-check-label" for="qtype-mc-text">객관식(장절→문구)</label>
                 </div>
+                <div class="form-check">
+                  <input class="form-check-input" type="checkbox" value="passage_next" id="qtype-passage-next" />
+                  <label class="form-check-label" for="qtype-passage-next">단락: 다음 절 잇기</label>
+                </div>
+                <div class="form-check">
+                  <input class="form-check-input" type="checkbox" value="passage_order" id="qtype-passage-order" />
+                  <label class="form-check-label" for="qtype-passage-order">단락: 절 순서 맞추기</label>
+                </div>
+                <div class="form-check">
+                  <input class="form-check-input" type="checkbox" value="passage_fill" id="qtype-passage-fill" />
+                  <label class="form-check-label" for="qtype-passage-fill">단락 채우기</label>
+                </div>
               </div>
             </div>
             <div class="ms-auto">
@@ -455,7 +2073,7 @@ INDEX_HTML = r"""<!doctype html>
           <h5 class="card-title">CSV 업로드</h5>
           <p class="text-muted small mb-2">CSV 컬럼 순서: <span class="mono">Book,Chapter,Verse,Text</span> (헤더 포함 권장)</p>
           <input type="file" id="csv-input" accept=".csv" class="form-control" />
-          <div class="form-text">파일은 서버에 업로드되지 않으며 브라우저에서만 파싱됩니다.</div>
+          <div class="form-text">로그인 중이면 서버에 저장되어 다른 기기에서도 같은 구절을 씁니다(같은 파일은 한 부만 저장). 비로그인이면 브라우저에서만 파싱됩니다.</div>
           <div class="d-flex gap-2 mt-2">
             <button class="btn btn-sm btn-outline-primary" id="btn-load-server-verses">서버 기본 구절 다시 불러오기</button>
           </div>
@@ -480,1423 +2098,636 @@ INDEX_HTML = r"""<!doctype html>
     </section>
   </main>
 
-  <script>
-    // ------------------------------
-    // 전역 상태(클라이언트)
-    // ------------------------------
-    let VERSES = []; // {book, chapter, verse, text}
-    let VERSES_SOURCE = 'server'; // 'server' | 'upload'
-    let CURRENT_QUIZ = null; // {questions, index, score, skip, answered[], practice, ...}
-    let LAST_RESULT = null; // 서버 저장용 캐시
-    let PRACTICE_MODE = false;
-    let chartScores = null;
-    let CURRENT_USER = null;
-
-    // ------------------------------
-    // 서버 API
-    // ------------------------------
-    async function apiGet(path){
-      const r = await fetch(path);
-      if (r.status === 401){
-        alert('로그인이 필요합니다.');
-        showView('auth');
-        return {ok:false, error:'unauthorized'};
-      }
-      return await r.json();
-    }
-    async function apiPost(path, data){
-      const r = await fetch(path, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(data||{})});
-      if (r.status === 401){
-        alert('로그인이 필요합니다.');
-        showView('auth');
-        return {ok:false, error:'unauthorized'};
-      }
-      return await r.json();
-    }
-
-    // ------------------------------
-    // 서버 verses.csv 기본 로드
-    // ------------------------------
-    async function loadDefaultVersesFromServer(forceReload=false){
-      const url = forceReload ? '/verses?reload=1' : '/verses';
-      const res = await apiGet(url);
-      if (res && res.ok){
-        VERSES = res.verses || [];
-        VERSES_SOURCE = 'server';
-        refreshMeta();
-        if ((res.meta?.count||0) > 0 && forceReload){
-          alert('서버 기본 구절 로딩 완료: ' + res.meta.count + '개');
-        }
-      } else {
-        console.warn('서버 구절 로드 실패', res?.error);
-      }
-    }
-
-    // ------------------------------
-    // 인증 UI
-    // ------------------------------
-    async function refreshWhoAmI(){
-      const info = await apiGet('/whoami');
-      if (!info) return;
-      CURRENT_USER = info.logged_in ? info.username : null;
-      updateAuthUI();
-      // ★ 로그인되어 있으면 저장된 서버 설정을 즉시 불러와 UI에 반영
-      if (CURRENT_USER){
-        await loadSettings();
-      }
-    }
-    function updateAuthUI(){
-      const hello = document.getElementById('hello-user');
-      const nameEl = document.getElementById('current-username');
-      const btnAuth = document.getElementById('btn-show-auth');
-      const btnLogout = document.getElementById('btn-logout');
-      if (CURRENT_USER){
-        if (hello) hello.classList.remove('hidden');
-        if (nameEl) nameEl.textContent = CURRENT_USER;
-        if (btnLogout) btnLogout.classList.remove('hidden');
-        if (btnAuth) btnAuth.classList.add('hidden');
-      } else {
-        if (hello) hello.classList.add('hidden');
-        if (nameEl) nameEl.textContent = '';
-        if (btnLogout) btnLogout.classList.add('hidden');
-        if (btnAuth) btnAuth.classList.remove('hidden');
-      }
-    }
-    function bindAuthUI(){
-      const tabLogin = document.getElementById('tab-login');
-      const tabSignup = document.getElementById('tab-signup');
-      const loginForm = document.getElementById('login-form');
-      const signupForm = document.getElementById('signup-form');
-      if (tabLogin) tabLogin.addEventListener('click', ()=>{ tabLogin.classList.add('active'); tabSignup.classList.remove('active'); loginForm.classList.remove('hidden'); signupForm.classList.add('hidden'); });
-      if (tabSignup) tabSignup.addEventListener('click', ()=>{ tabSignup.classList.add('active'); tabLogin.classList.remove('active'); signupForm.classList.remove('hidden'); loginForm.classList.add('hidden'); });
-
-      const btnAuth = document.getElementById('btn-show-auth');
-      if (btnAuth) btnAuth.addEventListener('click', ()=>{ showView('auth'); });
-
-      const btnLogout = document.getElementById('btn-logout');
-      if (btnLogout) btnLogout.addEventListener('click', async ()=>{
-        const res = await apiPost('/logout', {});
-        if (res && res.ok){
-          CURRENT_USER = null;
-          updateAuthUI();
-          showView('auth');
-          buildDashboard(); // 비로그인 상태의 빈 대시보드
-        }
-      });
-
-      const btnLogin = document.getElementById('btn-login');
-      if (btnLogin) btnLogin.addEventListener('click', async ()=>{
-        const username = document.getElementById('login-username').value.trim();
-        const password = document.getElementById('login-password').value;
-        if (!username || !password){ alert('아이디와 비밀번호를 입력하세요.'); return; }
-        const res = await apiPost('/login', {username, password});
-        if (res && res.ok){
-          CURRENT_USER = res.username;
-          updateAuthUI();
-          showView('home');
-          await loadSettings(); // ★ 로그인 직후 설정 반영
-          buildDashboard();
-        } else {
-          alert(res?.error || '로그인 실패');
-        }
-      });
-
-      const btnSignup = document.getElementById('btn-signup');
-      if (btnSignup) btnSignup.addEventListener('click', async ()=>{
-        const username = document.getElementById('signup-username').value.trim();
-        const password = document.getElementById('signup-password').value;
-        if (!username || !password){ alert('아이디와 비밀번호를 입력하세요.'); return; }
-        const res = await apiPost('/signup', {username, password});
-        if (res && res.ok){
-          CURRENT_USER = res.username;
-          updateAuthUI();
-          showView('home');
-          await loadSettings(); // ★ 가입 직후 설정 반영
-          buildDashboard();
-        } else {
-          alert(res?.error || '가입 실패');
-        }
-      });
-    }
-
-    // ------------------------------
-    // 버튼 바인딩
-    // ------------------------------
-    document.getElementById('btn-start-quiz').addEventListener('click', ()=>{ startQuizInternal(); });
-    document.getElementById('btn-practice-toggle').addEventListener('click', ()=>{ togglePractice(); });
-    document.getElementById('btn-start-top20').addEventListener('click', ()=>{ startTop20Quiz(); });
-    document.getElementById('btn-start-top20-2').addEventListener('click', ()=>{ startTop20Quiz(); });
-    document.getElementById('btn-load-server-verses').addEventListener('click', async ()=>{ await loadDefaultVersesFromServer(true); });
-    document.getElementById('btn-clear-top20').addEventListener('click', async ()=>{
-      if (!CURRENT_USER){ alert('로그인하세요.'); return; }
-      if (!confirm('TOP20(오답 카운트)을 모두 초기화할까요?')) return;
-      const res = await apiPost('/clear_top20', {});
-      if (res && res.ok){ buildDashboard(); }
-    });
-
-    // ------------------------------
-    // 뷰 전환
-    // ------------------------------
-    function showView(name){
-      for (const id of ['home','quiz','settings','auth']){
-        const el = document.getElementById('view-'+id);
-        if (el) el.classList.toggle('hidden', id!==name);
-      }
-      if (name==='home') buildDashboard();
-      if (name==='settings') refreshMeta();
-      if (name==='auth') { /* no-op */ }
-    }
-
-    // ------------------------------
-    // CSV 로딩 (클라이언트 파싱)
-    // ------------------------------
-    document.getElementById('csv-input').addEventListener('change', (ev)=>{
-      const file = ev.target.files?.[0];
-      if (!file) return;
-      Papa.parse(file, {
-        header: true,
-        skipEmptyLines: true,
-        complete: function(results){
-          const rows = results.data; VERSES = [];
-          for (const r of rows){
-            const book = (r.Book || r.book || '').trim();
-            const chapter = parseInt(r.Chapter || r.chapter, 10);
-            const verse = parseInt(r.Verse || r.verse, 10);
-            const text = (r.Text || r.text || '').trim();
-            if (book && Number.isFinite(chapter) && Number.isFinite(verse) && text){ VERSES.push({book, chapter, verse, text}); }
-          }
-          VERSES_SOURCE = 'upload';
-          alert('구절 로딩 완료: '+VERSES.length+'개 (사용자 업로드)');
-          refreshMeta();
-        }
-      });
-    });
-
-    function refreshMeta(){
-      const srcEl = document.getElementById('meta-source');
-      document.getElementById('meta-verse-count').textContent = VERSES.length;
-      apiGet('/data').then(d=>{ document.getElementById('meta-saved-sessions').textContent = (d && d.sessions) ? d.sessions.length : 0; });
-      if (srcEl){
-        srcEl.textContent = (VERSES_SOURCE==='upload') ? '사용자 업로드' : '서버 verses.csv';
-        srcEl.className = 'badge ' + ((VERSES_SOURCE==='upload')?'text-bg-warning':'text-bg-info');
-      }
-    }
-
-    // ------------------------------
-    // 유틸리티 (정규화/유사도)
-    // ------------------------------
-    function randInt(n){ return Math.floor(Math.random()*n); }
-    function shuffle(a){ for(let i=a.length-1;i>0;i--){ const j=randInt(i+1); [a[i],a[j]]=[a[j],a[i]]; } return a; }
-
-    function normalizeText(s){
-      if (!s) return '';
-      const lowered = s.normalize('NFKC').toLowerCase();
-      const noPunct = lowered.replace(/[\u2000-\u206F\u2E00-\u2E7F\\'!"#$%&()*+,\-./:;<=>?@\[\]^_`{|}~]/g, ' ');
-      return noPunct.replace(/\s+/g,' ').trim();
-    }
-    function normalizeLabel(s){
-      if (!s) return '';
-      return s.normalize('NFKC').trim().toLowerCase().replace(/\s+/g,' ');
-    }
-
-    // 공백 완전 무시 비교용 정규화 + LCS
-    function normalizeForCompare(s){
-      if (!s) return '';
-      const lowered = s.normalize('NFKC').toLowerCase();
-      const noPunct = lowered.replace(/[\u2000-\u206F\u2E00-\u2E7F\\'!"#$%&()*+,\-./:;<=>?@\[\]^_`{|}~]/g, '');
-      return noPunct.replace(/\s+/g,'');
-    }
-    function lcsLen(a, b){
-      const n = a.length, m = b.length;
-      if (n===0 || m===0) return 0;
-      const prev = new Array(m+1).fill(0);
-      const curr = new Array(m+1).fill(0);
-      for (let i=1;i<=n;i++){
-        for (let j=1;j<=m;j++){
-          if (a[i-1] === b[j-1]) curr[j] = prev[j-1] + 1;
-          else curr[j] = Math.max(prev[j], curr[j-1]);
-        }
-        for (let j=0;j<=m;j++) prev[j] = curr[j], curr[j] = 0;
-      }
-      return prev[m];
-    }
-    function charSimIgnoreSpaces(a, b){
-      const A = normalizeForCompare(a);
-      const B = normalizeForCompare(b);
-      const L = Math.max(A.length, B.length);
-      if (L === 0) return 0;
-      const lcs = lcsLen(A, B);
-      return lcs / L;
-    }
-
-    function formatRef(v){ return `${v.book} ${v.chapter},${v.verse}`; }
-    function verseKey(v){ return `${v.book}|${v.chapter}|${v.verse}`; } // 참조 키
-
-    // ------------------------------
-    // 출제 가중치 (오답↑ 스킵↑ 정답↓ + verseScores 강화) — 학습 모드에서만 사용
-    // ------------------------------
-    function buildWeights(sessions, verseScores){
-      const statByRef = {};
-      for (const se of (sessions||[])){
-        for (const d of (se.details||[])){
-          const key = `${d.book}|${d.chapter}|${d.verse}`;
-          if (!statByRef[key]) statByRef[key] = {correct:0, wrong:0, skip:0};
-          if (d.correct) statByRef[key].correct++;
-          else { if (d.skipped) statByRef[key].skip++; else statByRef[key].wrong++; }
-        }
-      }
-      // 가중치 파라미터
-      const BASE=1, A=1, S=1, C=1, V=4;
-
-      const weights = new Array(VERSES.length).fill(1);
-      for (let i=0;i<VERSES.length;i++){
-        const v = VERSES[i];
-        const key = verseKey(v);
-        const s = statByRef[key] || {correct:0, wrong:0, skip:0};
-        const vs = (verseScores && typeof verseScores[key]==='number') ? verseScores[key] : 0;
-        let w = BASE + A*s.wrong + S*s.skip - C*s.correct + V*vs;
-        if (w < 1) w = 1;
-        weights[i] = w;
-      }
-      const prefix = [];
-      let acc=0;
-      for (let i=0;i<weights.length;i++){ acc+=weights[i]; prefix.push(acc); }
-      return { weights, prefix, total: acc };
-    }
-
-    function pickVerseWeighted(prefix, total){
-      if (!VERSES.length) return null;
-      if (total<=0) return VERSES[randInt(VERSES.length)];
-      const r = Math.random()*total;
-      let lo=0, hi=prefix.length-1, ans=hi;
-      while (lo<=hi){
-        const mid = (lo+hi)>>1;
-        if (prefix[mid] >= r){ ans=mid; hi=mid-1; }
-        else lo=mid+1;
-      }
-      return VERSES[ans];
-    }
-
-    // (시험 전용) 균등 랜덤 비복원 샘플링 + 참조 유니크 보장
-    function pickUniqueIndicesUniform(want){
-      const idxs = Array.from({length: VERSES.length}, (_,i)=>i);
-      shuffle(idxs); // 균등 랜덤
-      const selected = [];
-      const usedRef = new Set();
-      for (const i of idxs){
-        const v = VERSES[i];
-        const k = verseKey(v);
-        if (usedRef.has(k)) continue; // 같은 참조 재출제 금지
-        usedRef.add(k);
-        selected.push(i);
-        if (selected.length === want) break;
-      }
-      return selected;
-    }
-
-    // ------------------------------
-    // 학습 모드 전용: 선택 로직 초기화 (랜덤 ↔ 가중치 번갈아 + 재출제 큐 + 최근 버퍼)
-    // ------------------------------
-    function initPracticeSelector(dataForWeight, qtypes){
-      const {prefix, total} = buildWeights(dataForWeight.sessions, dataForWeight.verseScores);
-      const recentKeys = [];           // 최근 N개 버퍼
-      const RECENT_MAX = 10;
-      const retryQueue = [];           // {key, verse, dueAt, tries}
-      let altToggle = false;           // false: 균등 랜덤, true: 가중치
-      let attemptsCounter = 0;         // 현재까지 시도 수(학습 모드)
-
-      function onAttempt(){ attemptsCounter++; }
-
-      function pushRecent(key){
-        recentKeys.push(key);
-        if (recentKeys.length > RECENT_MAX) recentKeys.shift();
-      }
-      function inRecent(key){ return recentKeys.includes(key); }
-
-      function pickUniformAvoidRecent(maxTries=50){
-        if (!VERSES.length) return null;
-        for (let t=0;t<maxTries;t++){
-          const v = VERSES[randInt(VERSES.length)];
-          const k = verseKey(v);
-          if (!inRecent(k)) return v;
-        }
-        return VERSES[randInt(VERSES.length)]; // fallback
-      }
-
-      function pickWeightedAvoidRecent(maxTries=80){
-        if (!VERSES.length) return null;
-        for (let t=0;t<maxTries;t++){
-          const v = pickVerseWeighted(prefix, total);
-          const k = verseKey(v);
-          if (!inRecent(k)) return v;
-        }
-        return pickVerseWeighted(prefix, total); // fallback
-      }
-
-      function scheduleRetryForVerse(verse, currentAttempts){
-        const k = verseKey(verse);
-        const found = retryQueue.find(it => it.key === k);
-        const gap = 3 + randInt(3); // 3~5문항 뒤 무작위
-        const due = (currentAttempts||0) + gap;
-        if (found){
-          found.dueAt = Math.min(found.dueAt, due);
-          found.tries = (found.tries||0) + 1;
-        } else {
-          retryQueue.push({ key: k, verse, dueAt: due, tries: 1 });
-        }
-      }
-
-      function discardFromRetryByKey(k){
-        const idx = retryQueue.findIndex(it => it.key === k);
-        if (idx >= 0) retryQueue.splice(idx,1);
-      }
-
-      function chooseVerse(){
-        // 1) 재출제 큐 우선
-        const idx = retryQueue.findIndex(it => it.dueAt <= attemptsCounter);
-        if (idx >= 0){
-          const it = retryQueue.splice(idx,1)[0];
-          pushRecent(it.key);
-          return it.verse;
-        }
-        // 2) 번갈이: false면 랜덤, true면 가중치
-        let verse = null;
-        if (altToggle){
-          verse = pickWeightedAvoidRecent();
-        } else {
-          verse = pickUniformAvoidRecent();
-        }
-        const k = verseKey(verse);
-        pushRecent(k);
-        altToggle = !altToggle;
-        return verse;
-      }
-
-      function makeOne(){
-        const verse = chooseVerse();
-        const t = qtypes[randInt(qtypes.length)];
-        return makeQuestion(t, verse);
-      }
-
-      return {
-        makeOne, retryQueue, recentKeys,
-        scheduleRetryForVerse, discardFromRetryByKey,
-        onAttempt
-      };
-    }
-
-    // ------------------------------
-    // 설정 I/O
-    // ------------------------------
-    async function loadSettings(){
-      const d = await apiGet('/data');
-      const st = d.settings || { numQuestions:30, enabledQTypes:["identify_ref","cloze","multiple_choice","continue_verse","multiple_choice_text"] };
-      document.getElementById('input-num-questions').value = st.numQuestions;
-      document.getElementById('qtype-identify').checked = st.enabledQTypes.includes('identify_ref');
-      document.getElementById('qtype-cloze').checked = st.enabledQTypes.includes('cloze');
-      document.getElementById('qtype-mc').checked = st.enabledQTypes.includes('multiple_choice');
-      document.getElementById('qtype-continue').checked = st.enabledQTypes.includes('continue_verse');
-      // ★ 버그 수정: 저장값을 그대로 반영 (자동 강제 체크 금지)
-      document.getElementById('qtype-mc-text').checked = st.enabledQTypes.includes('multiple_choice_text');
-      // 알림은 최초 자동 로드시엔 표시 안함(사용자 클릭 시에만 표시)
-      return st;
-    }
-
-    async function saveSettings(){
-      if (!CURRENT_USER){ alert('설정을 저장하려면 로그인하세요.'); showView('auth'); return; }
-      const st = {
-        numQuestions: Math.max(5, Math.min(100, parseInt(document.getElementById('input-num-questions').value,10)||30)),
-        enabledQTypes: [
-          ...(document.getElementById('qtype-identify').checked? ['identify_ref']:[]),
-          ...(document.getElementById('qtype-cloze').checked? ['cloze']:[]),
-          ...(document.getElementById('qtype-mc').checked? ['multiple_choice']:[]),
-          ...(document.getElementById('qtype-continue').checked? ['continue_verse']:[]),
-          ...(document.getElementById('qtype-mc-text').checked? ['multiple_choice_text']:[]),
-        ]
-      };
-      const res = await apiPost('/settings', st);
-      if (res && res.ok) alert('설정을 서버에 저장했습니다.');
-    }
-
-    // ------------------------------
-    // 문제 생성기
-    // ------------------------------
-    function makeQuestion(type, verse){
-      if (type==='identify_ref'){
-        return { qtype:'identify_ref', subj:true, verse, prompt:'다음 구절의 책/장/절을 입력하세요:' };
-      } else if (type==='cloze'){
-        const masked = maskWords(verse.text, 2 + randInt(2));
-        return { qtype:'cloze', subj:true, verse,
-          prompt:`${formatRef(verse)} — 빈칸에 들어갔던 단어를 복원하세요:`,
-          maskedHtml: masked.html, answers: masked.answers };
-      } else if (type==='continue_verse'){
-        return { qtype:'continue_verse', subj:true, verse, prompt:`${formatRef(verse)} — 구절 전체를 입력하세요:` };
-      } else if (type==='multiple_choice_text'){
-        const options = [verse];
-        while (options.length<4){
-          const candidate = VERSES[randInt(VERSES.length)];
-          const dupRef = options.some(o=>o.book===candidate.book && o.chapter===candidate.chapter && o.verse===candidate.verse);
-          const dupText = options.some(o=>o.text===candidate.text);
-          if (!dupRef && !dupText){ options.push(candidate); }
-        }
-        shuffle(options);
-        const correctIndex = options.findIndex(o=>o.text===verse.text && o.book===verse.book && o.chapter===verse.chapter && o.verse===verse.verse);
-        return {
-          qtype:'multiple_choice_text', subj:false, verse,
-          prompt:`다음 참조의 올바른 문구를 고르세요: ${formatRef(verse)}`,
-          options: options.map(o=>`“${o.text}”`),
-          correctIndex
-        };
-      } else { // multiple_choice (문구→참조)
-        const options = [verse];
-        while (options.length<4){
-          const candidate = VERSES[randInt(VERSES.length)];
-          if (!options.some(o=>o.book===candidate.book && o.chapter===candidate.chapter && o.verse===candidate.verse)){
-            options.push(candidate);
-          }
-        }
-        shuffle(options);
-        const correctIndex = options.findIndex(o=>o.book===verse.book && o.chapter===verse.chapter && o.verse===verse.verse);
-        return {
-          qtype:'multiple_choice', subj:false, verse,
-          prompt:`다음 구절의 참조(책/장/절)를 고르세요: “${verse.text}”`,
-          options: options.map(o=>`${o.book} ${o.chapter},${o.verse}`),
-          correctIndex
-        };
-      }
-    }
-
-    function maskWords(text, n=2){
-      const words = text.split(/(\s+)/); // 공백 유지
-      const idx = []
-      for (let i=0;i<words.length;i+=2){ if (words[i].trim().length>2) idx.push(i); }
-      shuffle(idx)
-      const chosen = idx.slice(0, Math.min(n, idx.length));
-      const blanks = [];
-      for (const i of chosen){ blanks.push(words[i]); words[i] = '<span class="cloze-blank">____</span>'; }
-      return {html: words.join(''), answers: blanks};
-    }
-
-    // ------------------------------
-    // 점수표시 토글
-    // ------------------------------
-    function setScoreVisibility(show){
-      const sw = document.getElementById('score-wrap');
-      const skw = document.getElementById('skip-wrap');
-      if (sw) sw.style.display = show ? '' : 'none';
-      if (skw) skw.style.display = show ? '' : 'none';
-    }
-
-    // ------------------------------
-    // 퀴즈(시험) 시작 / 재시험 시작 / TOP20 시작
-    // ------------------------------
-    async function startQuizInternal(){
-      if (!CURRENT_USER){ alert('시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
-      if (VERSES.length === 0){
-        await loadDefaultVersesFromServer(true);
-        if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
-      }
-
-      // 유니크 참조 수 산출
-      const uniqRefSet = new Set(VERSES.map(v=>verseKey(v)));
-      const uniqCapacity = uniqRefSet.size;
-
-      const d = await apiGet('/data');
-      const st = d.settings || {};
-      const desired = Math.max(5, Math.min(100, parseInt(document.getElementById('input-num-questions').value,10) || st.numQuestions || 30));
-      const num = Math.min(desired, uniqCapacity); // 세트 크기는 유니크 참조 수를 넘지 않음
-
-      const qtypes = [];
-      if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
-      if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
-      if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
-      if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
-      if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
-      if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); return; }
-
-      // ★ 시험은 순수 랜덤(균등) + 비복원 + 참조 유니크
-      const pickedIdx = pickUniqueIndicesUniform(num);
-
-      const questions = [];
-      for (let i=0;i<pickedIdx.length;i++){
-        const v = VERSES[pickedIdx[i]];
-        const t = qtypes[randInt(qtypes.length)];
-        questions.push(makeQuestion(t, v));
-      }
-
-      PRACTICE_MODE = false;
-      updatePracticeToggleUI(false);
-      setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
-
-      CURRENT_QUIZ = { questions, index: 0, score: 0, skip: 0, answered: new Array(questions.length).fill(false), practice:false, originSessionId:null };
-      LAST_RESULT = null;
-
-      document.getElementById('mode-badge').style.display = 'none';
-      document.getElementById('practice-acc').style.display = 'none';
-      document.getElementById('quiz-panel').classList.remove('hidden');
-      document.getElementById('result-panel').classList.add('hidden');
-      document.getElementById('total-count').textContent = questions.length;
-      document.getElementById('cur-score').textContent = '0';
-      document.getElementById('cur-skip').textContent = '0';
-      renderQuestion();
-      showView('quiz');
-    }
-
-    async function startTop20Quiz(){
-      if (!CURRENT_USER){ alert('시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
-      if (VERSES.length === 0){
-        await loadDefaultVersesFromServer(true);
-        if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
-      }
-
-      const d = await apiGet('/data');
-      const verseScores = d.verseScores || {};
-
-      // verseScores 상위 20(>0)만 가져오기
-      const tops = Object.entries(verseScores)
-        .filter(([,v]) => (v||0) > 0)
-        .sort((a,b) => b[1]-a[1])
-        .slice(0, 20);
-
-      if (tops.length === 0){
-        alert('오답 TOP20 항목이 없습니다. 먼저 문제를 풀어 데이터가 쌓여야 합니다.');
-        return;
-      }
-
-      // 메모리의 VERSES에서 존재하는 것만 골라 준비
-      const verseMap = new Map(VERSES.map(v => [verseKey(v), v]));
-      const selectedVerses = [];
-      const used = new Set();
-      for (const [key] of tops){
-        if (used.has(key)) continue;
-        const v = verseMap.get(key);
-        if (v) { selectedVerses.push(v); used.add(key); }
-      }
-      if (selectedVerses.length === 0){
-        alert('현재 로드된 CSV에 TOP20 참조가 존재하지 않습니다. CSV를 확인해주세요.');
-        return;
-      }
-
-      const qtypes = [];
-      if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
-      if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
-      if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
-      if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
-      if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
-      if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); return; }
-
-      // 선택된 구절들로 세트 구성(유형은 랜덤 배정)
-      const questions = selectedVerses.map(v => makeQuestion(qtypes[randInt(qtypes.length)], v));
-
-      PRACTICE_MODE = false;
-      updatePracticeToggleUI(false);
-      setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
-
-      CURRENT_QUIZ = { questions, index: 0, score: 0, skip: 0, answered: new Array(questions.length).fill(false), practice:false, originSessionId:null };
-      LAST_RESULT = null;
-
-      document.getElementById('mode-badge').style.display = 'none';
-      document.getElementById('practice-acc').style.display = 'none';
-      document.getElementById('quiz-panel').classList.remove('hidden');
-      document.getElementById('result-panel').classList.add('hidden');
-      document.getElementById('total-count').textContent = questions.length;
-      document.getElementById('cur-score').textContent = '0';
-      document.getElementById('cur-skip').textContent = '0';
-      renderQuestion();
-      showView('quiz');
-    }
-
-    async function retakeSession(sessionId){
-      if (!CURRENT_USER){ alert('재시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
-      const d = await apiGet('/data');
-      const se = (d.sessions||[]).find(x=> x.id===sessionId);
-      if (!se){ alert('저장된 세트를 찾을 수 없습니다.'); return; }
-
-      if (!se.questionsDump){
-        alert('이 세트에는 문제 덤프가 없어 재시험을 진행할 수 없습니다.');
-        return;
-      }
-      const questions = se.questionsDump.map(q=>({ ...q, verse: q.verse }));
-
-      PRACTICE_MODE = false;
-      updatePracticeToggleUI(false);
-      setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
-
-      CURRENT_QUIZ = { questions, index:0, score:0, skip:0, answered:new Array(questions.length).fill(false), practice:false, originSessionId: sessionId };
-      LAST_RESULT = null;
-
-      document.getElementById('mode-badge').style.display = 'none';
-      document.getElementById('practice-acc').style.display = 'none';
-      document.getElementById('quiz-panel').classList.remove('hidden');
-      document.getElementById('result-panel').classList.add('hidden');
-      document.getElementById('total-count').textContent = questions.length;
-      document.getElementById('cur-score').textContent = '0';
-      document.getElementById('cur-skip').textContent = '0';
-      renderQuestion();
-      showView('quiz');
-    }
-
-    // ★ 틀린 문제만 다시 풀기
-    async function retakeWrongOnly(sessionId){
-      if (!CURRENT_USER){ alert('재시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
-      const d = await apiGet('/data');
-      const se = (d.sessions||[]).find(x=> x.id===sessionId);
-      if (!se){ alert('저장된 세트를 찾을 수 없습니다.'); return; }
-      if (!se.questionsDump){
-        alert('이 세트에는 문제 덤프가 없어 틀린 문제만 재시험을 진행할 수 없습니다.');
-        return;
-      }
-      const qs = se.questionsDump || [];
-      const details = se.details || [];
-
-      const usedRef = new Set();
-      const wrongQuestions = [];
-      for (let i=0;i<qs.length;i++){
-        const drec = details[i] || {};
-        const isWrong = drec.skipped || !drec.correct;
-        if (!isWrong) continue;
-        const v = qs[i].verse;
-        const key = `${v.book}|${v.chapter}|${v.verse}`;
-        if (usedRef.has(key)) continue; // 참조 중복 방지
-        usedRef.add(key);
-        wrongQuestions.push({ ...qs[i], verse: qs[i].verse });
-      }
-
-      if (wrongQuestions.length===0){
-        alert('틀린 문제가 없습니다. 잘하셨어요!');
-        return;
-      }
-
-      PRACTICE_MODE = false;
-      updatePracticeToggleUI(false);
-      setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
-
-      CURRENT_QUIZ = { questions: wrongQuestions, index:0, score:0, skip:0, answered:new Array(wrongQuestions.length).fill(false), practice:false, originSessionId: null };
-      LAST_RESULT = null;
-
-      document.getElementById('mode-badge').style.display = 'none';
-      document.getElementById('practice-acc').style.display = 'none';
-      document.getElementById('quiz-panel').classList.remove('hidden');
-      document.getElementById('result-panel').classList.add('hidden');
-      document.getElementById('total-count').textContent = wrongQuestions.length;
-      document.getElementById('cur-score').textContent = '0';
-      document.getElementById('cur-skip').textContent = '0';
-      renderQuestion();
-      showView('quiz');
-    }
+  <script src="{{app.js}}" data-chart="{{vendor/chart.umd.min.js}}" data-csv="{{csv.js}}"></script>
+</body>
+</html>
+"""
 
-    // ------------------------------
-    // 학습(무한) 모드
-    // ------------------------------
-    function updatePracticeToggleUI(isOn){
-      const btn = document.getElementById('btn-practice-toggle');
-      if (isOn){
-        btn.classList.remove('btn-success'); btn.classList.add('btn-danger');
-        btn.textContent = '학습하기 중지';
-        document.getElementById('mode-badge').style.display = '';
-        document.getElementById('practice-acc').style.display = '';
-        document.getElementById('total-count').textContent = '∞';
-        setScoreVisibility(true); // 학습 중에는 점수/스킵 표시
-      } else {
-        btn.classList.remove('btn-danger'); btn.classList.add('btn-success');
-        btn.textContent = '학습하기 시작';
-        document.getElementById('mode-badge').style.display = 'none';
-        document.getElementById('practice-acc').style.display = 'none';
-        setScoreVisibility(false); // 학습 중지 시 숨김(시험 대비)
-      }
-    }
+# ------------------------------
+# 정적 자산 / 캐시 응답 (콘텐츠 해시 파일명 + 사전 압축 + ETag/304)
+# ------------------------------
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_MIMETYPES = {
+    ".js": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".json": "application/json",
+    ".webmanifest": "application/manifest+json",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"  # 캐시는 하되 매번 ETag로 재검증
+STATIC_ASSETS = {}  # /static/ 이하 경로 -> (캐시 엔트리, Cache-Control)
+ASSET_URLS = {}     # 원래 경로("app.js") -> 지문 URL("/static/app.1a2b3c4d5e6f.js")
+INDEX_PAGE = None
+SERVICE_WORKER = None  # static/sw.js 를 지문 URL로 치환한 결과 (/sw.js 로 제공)
+
+def make_cached_body(body, mimetype):
+    """응답 본문과 사전 압축본(gzip, 가능하면 br), ETag를 묶은 캐시 엔트리"""
+    variants = {"identity": body}
+    compressible = mimetype.startswith("text/") or "json" in mimetype or "svg" in mimetype
+    if compressible and len(body) > 512:
+        variants["gzip"] = gzip.compress(body, 9, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=11)
+    return {"etag": hashlib.sha256(body).hexdigest()[:16], "mimetype": mimetype, "variants": variants}
+
+def cached_response(entry, cache_control):
+    """If-None-Match가 맞으면 304, 아니면 Accept-Encoding에 맞는 사전 압축본을 그대로 전송"""
+    if request.if_none_match.contains_weak(entry["etag"]):
+        resp = Response(status=304)
+    else:
+        enc = "identity"
+        for cand in ("br", "gzip"):
+            if cand in entry["variants"] and request.accept_encodings[cand]:
+                enc = cand
+                break
+        resp = Response(entry["variants"][enc], content_type=entry["mimetype"])
+        if enc != "identity":
+            resp.headers["Content-Encoding"] = enc
+    # 인코딩별 본문이 달라도 의미상 동일하므로 약한 ETag 사용
+    resp.set_etag(entry["etag"], weak=True)
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+def build_static_assets():
+    """static/ 아래 파일을 읽어 지문 URL·압축본을 만들고 HTML 셸의 자리표시자를 치환"""
+    global INDEX_PAGE, SERVICE_WORKER
+    assets, urls = {}, {}
+    for root, _dirs, files in os.walk(STATIC_DIR):
+        for fn in files:
+            full = os.path.join(root, fn)
+            rel = os.path.relpath(full, STATIC_DIR).replace(os.sep, "/")
+            if rel == "sw.js":
+                continue  # 서비스 워커는 루트 범위가 필요하므로 아래에서 /sw.js 로 따로 만든다
+            stem, ext = os.path.splitext(rel)
+            with open(full, "rb") as f:
+                body = f.read()
+            entry = make_cached_body(body, STATIC_MIMETYPES.get(ext, "application/octet-stream"))
+            fingerprinted = f"{stem}.{entry['etag'][:12]}{ext}"
+            assets[fingerprinted] = (entry, IMMUTABLE_CACHE)
+            assets[rel] = (entry, REVALIDATE_CACHE)  # 지문 없는 경로도 재검증 캐시로 제공
+            urls[rel] = "/static/" + fingerprinted
+    STATIC_ASSETS.clear()
+    STATIC_ASSETS.update(assets)
+    ASSET_URLS.clear()
+    ASSET_URLS.update(urls)
+    INDEX_PAGE = make_cached_body(_fill_asset_urls(INDEX_HTML).encode("utf-8"), "text/html; charset=utf-8")
+    with open(os.path.join(STATIC_DIR, "sw.js"), "r", encoding="utf-8") as f:
+        SERVICE_WORKER = make_cached_body(_fill_asset_urls(f.read()).encode("utf-8"), STATIC_MIMETYPES[".js"])
+
+def _fill_asset_urls(text):
+    return re.sub(r"\{\{([\w./-]+)\}\}", lambda m: ASSET_URLS.get(m.group(1), m.group(0)), text)
+
+build_static_assets()
+
+_VERSES_CACHE = None  # (SERVER_VERSES 객체 id, 캐시 엔트리) — 재로딩 시 자동 무효화
+
+def server_verses_entry():
+    global _VERSES_CACHE
+    verses = SERVER_VERSES
+    if _VERSES_CACHE is None or _VERSES_CACHE[0] is not verses:
+        body = dumps_json({"ok": True, "verses": verses,
+                           "meta": {"count": len(verses), "source": SERVER_VERSES_SOURCE,
+                                    "version": SERVER_CORPUS_VERSION}})
+        _VERSES_CACHE = (verses, make_cached_body(body, "application/json"))
+    return _VERSES_CACHE[1]
 
-    async function togglePractice(){
-      if (!CURRENT_USER){ alert('학습하려면 로그인하세요.'); showView('auth'); return; }
-      if (VERSES.length === 0){
-        await loadDefaultVersesFromServer(true);
-        if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
-      }
-      PRACTICE_MODE = !PRACTICE_MODE;
-      if (PRACTICE_MODE){
-        const d = await apiGet('/data');
-        const qtypes = [];
-        if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
-        if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
-        if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
-        if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
-        if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
-        if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); PRACTICE_MODE=false; return; }
-
-        // 학습 모드 선택기 초기화 (랜덤↔가중치 번갈아 + 재출제큐)
-        const sel = initPracticeSelector(d, qtypes);
-
-        const firstQ = sel.makeOne(); // CURRENT_QUIZ 생성 전에 호출해도 안전
-
-        CURRENT_QUIZ = {
-          questions:[firstQ], index:0, score:0, skip:0, answered:[false],
-          practice:true, makeOne: sel.makeOne, practiceStats:{attempts:0, correct:0},
-          practiceRetryQueue: sel.retryQueue,
-          practiceRecent: sel.recentKeys,
-          scheduleRetryForVerse: sel.scheduleRetryForVerse,
-          discardFromRetryByKey: sel.discardFromRetryByKey,
-          onAttempt: sel.onAttempt
-        };
-        LAST_RESULT = null;
-
-        updatePracticeToggleUI(true);
-        document.getElementById('quiz-panel').classList.remove('hidden');
-        document.getElementById('result-panel').classList.add('hidden');
-        renderQuestion();
-        showView('quiz');
-        updatePracticeAccuracyLabel();
-      } else {
-        updatePracticeToggleUI(false);
-      }
-    }
+# ------------------------------
+# 사용자 업로드 코퍼스 (내용 주소 저장 — 같은 내용은 한 부만)
+# ------------------------------
+# 설정 화면에서 올린 CSV는 서버가 파싱해 정규화한 구절 목록의 해시(corpus id)로 저장하고, 사용자 레코드에는
+# u["corpus"] = {"id", "name", "count", "uploadedAt"} 포인터만 둔다 — 여러 사용자·기기가 같은 파일을 올려도 한 부.
+# 파일 저장소는 QUIZ_CORPUS_DIR/<id>.json.gz, 공유 KV는 ucorpus:<id>. 내용이 id로 고정되므로 노드마다 처음 쓸 때
+# 한 번만 읽어 색인(참조 키 / 단락 비트맵 / 책 이름 / 응답 캐시)을 만들고 최근 QUIZ_CORPUS_CACHE 개를 메모리에 둔다.
+# 포인터를 지워도 본문은 남는다(다른 사용자가 같은 id를 쓰고 있을 수 있음).
+CORPUS_DIR = os.environ.get("QUIZ_CORPUS_DIR", "quiz_corpora")
+CORPUS_MAX_BYTES = int(os.environ.get("QUIZ_CORPUS_MAX_BYTES", str(20 * 1024 * 1024)))
+CORPUS_CACHE_SIZE = max(1, int(os.environ.get("QUIZ_CORPUS_CACHE", "8")))
+USER_CORPUS_CACHE = "private, max-age=31536000, immutable"  # URL이 내용 해시라 바뀌지 않는다
+_CORPUS_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def corpus_id(verses):
+    return hashlib.sha256(dumps_json(verses)).hexdigest()[:32]
+
+def parse_corpus_csv(text):
+    """CSV 본문 → 구절 목록 (verses.csv 와 같은 컬럼 규칙, 잘못된 행은 건너뜀)"""
+    verses = []
+    for row in csv.DictReader(io.StringIO(text, newline="")):
+        v = _parse_row_to_verse(row)
+        if v:
+            verses.append(v)
+    return verses
 
-    function updatePracticeAccuracyLabel(){
-      if (!CURRENT_QUIZ || !CURRENT_QUIZ.practice || !CURRENT_QUIZ.practiceStats) return;
-      const a = CURRENT_QUIZ.practiceStats.attempts || 0;
-      const c = CURRENT_QUIZ.practiceStats.correct || 0;
-      const pct = a ? Math.round(c/a*100) : 0;
-      const el = document.getElementById('practice-acc');
-      el.textContent = `정확도: ${pct}% (${c}/${a})`;
-    }
+def _corpus_path(cid):
+    return os.path.join(CORPUS_DIR, f"{cid}.json.gz")
 
-    // ------------------------------
-    // 렌더링
-    // ------------------------------
-    function renderQuestion(){
-      const q = CURRENT_QUIZ.questions[CURRENT_QUIZ.index];
-      const box = document.getElementById('question-content');
-      const btnPrev = document.getElementById('btn-prev');
-      const btnNext = document.getElementById('btn-next');
-      const btnSubmit = document.getElementById('btn-submit');
-
-      if (CURRENT_QUIZ.practice){
-        btnPrev.disabled = true;
-        btnNext.textContent = '다음 문제';
-        btnNext.disabled = !CURRENT_QUIZ.answered[CURRENT_QUIZ.index];
-      } else {
-        btnPrev.disabled = CURRENT_QUIZ.index===0;
-        btnNext.textContent = '다음';
-        btnNext.disabled = CURRENT_QUIZ.index>=CURRENT_QUIZ.questions.length-1;
-      }
-      btnSubmit.disabled = CURRENT_QUIZ.answered[CURRENT_QUIZ.index];
-
-      document.getElementById('cur-index').textContent = CURRENT_QUIZ.index+1;
-
-      const headerType = `<div class="text-muted small">유형: <span class="mono">${q.qtype}</span></div>`;
-      const headerRef = `<div class="text-muted small">참조: <span class="mono">${formatRef(q.verse)}</span></div>`;
-      const showRefInQuestion = (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='multiple_choice_text');
-
-      if (q.qtype==='identify_ref'){
-        box.innerHTML = `
-          <div class="mb-2">${q.prompt}</div>
-          ${headerType}
-          <blockquote class="border-start border-3 ps-3">${q.verse.text}</blockquote>
-          <div class="row g-2 mt-2">
-            <div class="col-12 col-md-4">
-              <label class="form-label">책</label>
-              <input class="form-control" id="ans-book" placeholder="예: 요한복음" />
-            </div>
-            <div class="col-6 col-md-4">
-              <label class="form-label">장</label>
-              <input type="number" class="form-control" id="ans-chapter" />
-            </div>
-            <div class="col-6 col-md-4">
-              <label class="form-label">절</label>
-              <input type="number" class="form-control" id="ans-verse" />
-            </div>
-          </div>`;
-      } else if (q.qtype==='cloze'){
-        box.innerHTML = `
-          <div class="mb-2">${q.prompt}</div>
-          ${headerType} ${showRefInQuestion?headerRef:''}
-          <blockquote class="border-start border-3 ps-3">${q.maskedHtml}</blockquote>
-          <label class="form-label mt-2">복원한 문장(원문과 최대한 일치):</label>
-          <textarea class="form-control" id="ans-cloze" rows="2" placeholder="띄어쓰기 무시: 정확히 쓰면 더 유리합니다"></textarea>`;
-      } else if (q.qtype==='continue_verse'){
-        box.innerHTML = `
-          <div class="mb-2">${q.prompt}</div>
-          ${headerType} ${showRefInQuestion?headerRef:''}
-          <label class="form-label">구절 전체:</label>
-          <textarea class="form-control" id="ans-continue" rows="3" placeholder="띄어쓰기 무시: 원문과 최대한 일치하게 입력"></textarea>`;
-      } else if (q.qtype==='multiple_choice_text'){
-        const opts = q.options.map((o,idx)=>{
-          return `<div class="form-check"><input class="form-check-input" type="radio" name="mc2" id="mc2_${idx}" value="${idx}"><label class="form-check-label" for="mc2_${idx}">${o}</label></div>`
-        }).join('');
-        box.innerHTML = `
-          <div class="mb-2">${q.prompt}</div>
-          ${headerType} ${showRefInQuestion?headerRef:''}
-          <div class="mt-2">${opts}</div>`;
-      } else {
-        const opts = q.options.map((o,idx)=>{
-          return `<div class="form-check"><input class="form-check-input" type="radio" name="mc" id="mc${idx}" value="${idx}"><label class="form-check-label" for="mc${idx}">${o}</label></div>`
-        }).join('');
-        box.innerHTML = `
-          <div class="mb-2">${q.prompt}</div>
-          ${headerType}
-          <blockquote class="border-start border-3 ps-3">${q.verse.text}</blockquote>
-          <div class="mt-2">${opts}</div>`;
-      }
-    }
+def _corpus_file_get(cid):
+    try:
+        with gzip.open(_corpus_path(cid), "rb") as f:
+            return loads_json(f.read())
+    except FileNotFoundError:
+        return None
 
-    // ------------------------------
-    // 채점 + 기록
-    // ------------------------------
-    function submitAnswer(){
-      const i = CURRENT_QUIZ.index;
-      if (CURRENT_QUIZ.answered[i]) return;
-      const q = CURRENT_QUIZ.questions[i];
-      let correct = false; let userAnswerDisplay = '';
-
-      if (q.qtype==='identify_ref'){
-        const b = document.getElementById('ans-book').value;
-        const c = parseInt(document.getElementById('ans-chapter').value,10);
-        const v = parseInt(document.getElementById('ans-verse').value,10);
-        userAnswerDisplay = `${b||'-'} ${Number.isFinite(c)?c:'-'}:${Number.isFinite(v)?v:'-'}`;
-        const bookOK = normalizeLabel(b)===normalizeLabel(q.verse.book);
-        correct = bookOK && c===q.verse.chapter && v===q.verse.verse;
-      } else if (q.qtype==='cloze'){
-        const t = document.getElementById('ans-cloze').value;
-        userAnswerDisplay = t;
-        const ratio = charSimIgnoreSpaces(q.verse.text, t); // 띄어쓰기 무시
-        correct = ratio >= 0.70;
-      } else if (q.qtype==='continue_verse'){
-        const t = document.getElementById('ans-continue').value;
-        userAnswerDisplay = t;
-        const ratio = charSimIgnoreSpaces(q.verse.text, t); // 띄어쓰기 무시
-        correct = ratio >= 0.85;
-      } else if (q.qtype==='multiple_choice_text'){
-        const sel = document.querySelector('input[name="mc2"]:checked');
-        if (!sel){ alert('보기를 선택하세요.'); return; }
-        const ans = parseInt(sel.value,10);
-        userAnswerDisplay = q.options[ans];
-        correct = (ans === q.correctIndex);
-      } else {
-        const sel = document.querySelector('input[name="mc"]:checked');
-        if (!sel){ alert('보기를 선택하세요.'); return; }
-        const ans = parseInt(sel.value,10);
-        userAnswerDisplay = q.options[ans];
-        correct = (ans === q.correctIndex);
-      }
-
-      q.userAnswerDisplay = userAnswerDisplay;
-      q.correct = !!correct;
-      q.skipped = false;
-      CURRENT_QUIZ.answered[i] = true;
-      if (correct) CURRENT_QUIZ.score++;
-      document.getElementById('cur-score').textContent = CURRENT_QUIZ.score;
-
-      if (CURRENT_QUIZ.practice){
-        // 오답/스킵은 재출제 큐에 스케줄
-        if (!q.correct && typeof CURRENT_QUIZ.scheduleRetryForVerse === 'function'){
-          const attemptsSoFar = (CURRENT_QUIZ.practiceStats?.attempts||0);
-          CURRENT_QUIZ.scheduleRetryForVerse(q.verse, attemptsSoFar);
-        } else if (q.correct && typeof CURRENT_QUIZ.discardFromRetryByKey === 'function'){
-          CURRENT_QUIZ.discardFromRetryByKey(verseKey(q.verse));
-        }
-
-        revealImmediateAnswer(q);
-        document.getElementById('btn-next').disabled = false;
-        document.getElementById('btn-submit').disabled = true;
-        // 누적 정확도 업데이트
-        if (!CURRENT_QUIZ.practiceStats) CURRENT_QUIZ.practiceStats = {attempts:0, correct:0};
-        CURRENT_QUIZ.practiceStats.attempts++;
-        if (typeof CURRENT_QUIZ.onAttempt === 'function') CURRENT_QUIZ.onAttempt(); // ← selector 시도수 증가
-        if (q.correct) CURRENT_QUIZ.practiceStats.correct++;
-        updatePracticeAccuracyLabel();
-        // 학습 모드: 개별 문항 자동 저장 (사용자별)
-        autoLogPracticeAttempt(q);
-      } else {
-        if (i < CURRENT_QUIZ.questions.length-1){ CURRENT_QUIZ.index++; renderQuestion(); }
-        else { showResult(true); } // 시험 종료 자동 저장
-      }
-    }
+def _corpus_file_put(cid, corpus):
+    path = _corpus_path(cid)
+    if os.path.exists(path):
+        return  # 같은 id = 같은 내용
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    tmp = f"{path}.{secrets.token_hex(4)}.tmp"  # 같은 파일을 동시에 올려도 서로 덮어쓰지 않게
+    try:
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(dumps_json(corpus))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+class UserCorpus:
+    """업로드 코퍼스 하나와 그 색인 — 응답 본문(압축본 포함)은 처음 요청될 때 한 번 만든다"""
+    def __init__(self, cid, verses):
+        self.id = cid
+        self.verses = verses
+        self.index = {verse_key(v): v for v in verses}
+        self.bitmaps = VerseBitmaps(verses)
+        self.books = corpus_books(verses)
+        self._entry = None
+
+    def entry(self):
+        if self._entry is None:
+            body = dumps_json({"ok": True, "verses": self.verses,
+                               "meta": {"count": len(self.verses), "source": "upload", "version": self.id}})
+            self._entry = make_cached_body(body, "application/json")
+        return self._entry
+
+_USER_CORPORA = OrderedDict()  # id -> UserCorpus (LRU)
+_USER_CORPORA_LOCK = threading.Lock()
+
+def _remember_corpus(uc):
+    with _USER_CORPORA_LOCK:
+        uc = _USER_CORPORA.setdefault(uc.id, uc)  # 동시에 만든 쪽이 있으면 그것을 쓴다
+        _USER_CORPORA.move_to_end(uc.id)
+        while len(_USER_CORPORA) > CORPUS_CACHE_SIZE:
+            _USER_CORPORA.popitem(last=False)
+    return uc
+
+def user_corpus(cid):
+    """id → UserCorpus (메모리 → 저장소 순), 없거나 잘못된 id면 None"""
+    if not isinstance(cid, str) or not _CORPUS_ID.match(cid):
+        return None
+    with _USER_CORPORA_LOCK:
+        uc = _USER_CORPORA.get(cid)
+        if uc is not None:
+            _USER_CORPORA.move_to_end(cid)
+            return uc
+    stored = STORE.get_user_corpus(cid)
+    if not stored:
+        return None
+    return _remember_corpus(UserCorpus(cid, stored["verses"]))
 
-    function skipQuestion(){
-      const i = CURRENT_QUIZ.index;
-      if (CURRENT_QUIZ.answered[i]) return;
-      const q = CURRENT_QUIZ.questions[i];
-      q.skipped = true; q.correct = false; q.userAnswerDisplay = '';
-      CURRENT_QUIZ.answered[i] = true;
-      CURRENT_QUIZ.skip++;
-      document.getElementById('cur-skip').textContent = CURRENT_QUIZ.skip;
-
-      if (CURRENT_QUIZ.practice){
-        // 스킵도 재출제 큐에 스케줄
-        if (typeof CURRENT_QUIZ.scheduleRetryForVerse === 'function'){
-          const attemptsSoFar = (CURRENT_QUIZ.practiceStats?.attempts||0);
-          CURRENT_QUIZ.scheduleRetryForVerse(q.verse, attemptsSoFar);
-        }
-
-        revealImmediateAnswer(q, true);
-        document.getElementById('btn-next').disabled = false;
-        document.getElementById('btn-submit').disabled = true;
-        if (!CURRENT_QUIZ.practiceStats) CURRENT_QUIZ.practiceStats = {attempts:0, correct:0};
-        CURRENT_QUIZ.practiceStats.attempts++;
-        if (typeof CURRENT_QUIZ.onAttempt === 'function') CURRENT_QUIZ.onAttempt(); // ← selector 시도수 증가
-        updatePracticeAccuracyLabel();
-        autoLogPracticeAttempt(q);
-      } else {
-        if (i < CURRENT_QUIZ.questions.length-1){ CURRENT_QUIZ.index++; renderQuestion(); }
-        else { showResult(true); }
-      }
-    }
+def store_user_corpus(verses):
+    """구절 목록을 내용 해시로 저장(이미 있으면 건너뜀)하고 UserCorpus 반환"""
+    cid = corpus_id(verses)
+    uc = user_corpus(cid)
+    if uc is None:
+        STORE.put_user_corpus(cid, {"verses": verses})
+        uc = _remember_corpus(UserCorpus(cid, verses))
+    return uc
 
-    function autoLogPracticeAttempt(q){
-      // 로그인 필요
-      if (!CURRENT_USER) return;
-      const session = {
-        id: 'sess_'+Date.now()+'_'+Math.floor(Math.random()*1e6),
-        type: 'practice',
-        dateISO: new Date().toISOString(),
-        total: 1,
-        correct: q.correct ? 1 : 0,
-        skip: q.skipped ? 1 : 0,
-        score: q.correct ? 1 : 0,
-        details: [{
-          qtype: q.qtype,
-          subj: q.qtype!=='multiple_choice' && q.qtype!=='multiple_choice_text',
-          book: q.verse.book, chapter: q.verse.chapter, verse: q.verse.verse,
-          text: q.verse.text,
-          correct: !!q.correct,
-          skipped: !!q.skipped
-        }]
-      };
-      apiPost('/save', { session }).then(()=>{ buildDashboard(); });
-    }
+# ------------------------------
+# 로그인 보호 (비밀번호 해시 오프로딩 + 동시성 제한 + 속도 제한)
+# ------------------------------
+# scrypt 해시는 요청 스레드 대신 별도 프로세스 풀에서 계산한다.
+# QUIZ_HASH_WORKERS=0 이면 풀 없이 요청 스레드에서 계산(테스트/디버그용)
+HASH_WORKERS = int(os.environ.get("QUIZ_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 동시에 계산 중이거나 대기 중인 해시 요청 상한, 초과분은 QUIZ_HASH_QUEUE_TIMEOUT초 기다린 뒤 503
+HASH_MAX_INFLIGHT = int(os.environ.get("QUIZ_HASH_MAX_INFLIGHT", str(max(1, HASH_WORKERS) * 4)))
+HASH_QUEUE_TIMEOUT = float(os.environ.get("QUIZ_HASH_QUEUE_TIMEOUT", "5"))
+
+_HASH_POOL = None
+_HASH_POOL_PID = None
+_HASH_POOL_LOCK = threading.Lock()
+_HASH_SLOTS = threading.BoundedSemaphore(HASH_MAX_INFLIGHT)
+_AUTH_STATS_LOCK = threading.Lock()
+# 해시 작업 통계(누적): 대기 시간 = 슬롯 대기 + 풀 내부 큐 대기
+AUTH_STATS = {"hashed": 0, "rejected": 0, "queue_ms_total": 0.0, "queue_ms_max": 0.0, "hash_ms_total": 0.0}
+
+class HashBusy(Exception):
+    """해시 동시성 상한에 걸려 대기 시간 안에 슬롯을 얻지 못함"""
+
+def _timed_hash_call(kind, args, submitted):
+    # 풀 워커 프로세스에서 실행: (결과, 큐 대기초, 계산초)
+    started = time.time()
+    fn = check_password_hash if kind == "check" else generate_password_hash
+    result = fn(*args)
+    return result, max(0.0, started - submitted), time.time() - started
+
+def _hash_pool():
+    global _HASH_POOL, _HASH_POOL_PID
+    with _HASH_POOL_LOCK:
+        # fork 이후 부모의 풀은 쓸 수 없으므로 프로세스마다 새로 만든다
+        if _HASH_POOL is None or _HASH_POOL_PID != os.getpid():
+            _HASH_POOL = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            _HASH_POOL_PID = os.getpid()
+        return _HASH_POOL
+
+def run_password_hash(kind, *args):
+    """kind: "check"(check_password_hash) | "generate"(generate_password_hash)"""
+    global _HASH_POOL
+    t0 = time.time()
+    if not _HASH_SLOTS.acquire(timeout=HASH_QUEUE_TIMEOUT):
+        with _AUTH_STATS_LOCK:
+            AUTH_STATS["rejected"] += 1
+        raise HashBusy()
+    try:
+        submitted = time.time()
+        if HASH_WORKERS > 0:
+            try:
+                result, pool_wait, hash_s = _hash_pool().submit(_timed_hash_call, kind, args, submitted).result()
+            except BrokenProcessPool:
+                with _HASH_POOL_LOCK:
+                    _HASH_POOL = None  # 다음 요청에서 풀 재생성
+                result, pool_wait, hash_s = _timed_hash_call(kind, args, submitted)
+        else:
+            result, pool_wait, hash_s = _timed_hash_call(kind, args, submitted)
+    finally:
+        _HASH_SLOTS.release()
+    queue_ms = ((submitted - t0) + pool_wait) * 1000.0
+    with _AUTH_STATS_LOCK:
+        AUTH_STATS["hashed"] += 1
+        AUTH_STATS["queue_ms_total"] += queue_ms
+        AUTH_STATS["queue_ms_max"] = max(AUTH_STATS["queue_ms_max"], queue_ms)
+        AUTH_STATS["hash_ms_total"] += hash_s * 1000.0
+    return result
+
+# 자격 증명 캐시: username -> (pw_hash, 만료 시각) — 미존재 사용자는 캐시하지 않음.
+# 시점 복원(/admin/restore)·가져오기가 사용자 레코드를 통째로 바꿀 수 있고, 이를 처리한 노드/워커만 바로 비우므로
+# 다른 워커·노드는 QUIZ_CRED_CACHE_TTL초(기본 30) 안에 저장소에서 다시 읽는다
+CRED_CACHE_TTL = float(os.environ.get("QUIZ_CRED_CACHE_TTL", "30"))
+_CRED_CACHE = {}
+
+def lookup_pw_hash(username):
+    hit = _CRED_CACHE.get(username)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+    with STORE.process_lock():
+        user = STORE.get_user(username)
+        pw_hash = user.get("pw_hash") if isinstance(user, dict) else None
+    if pw_hash:
+        remember_pw_hash(username, pw_hash)
+    else:
+        forget_pw_hash(username)
+    return pw_hash
+
+def remember_pw_hash(username, pw_hash):
+    if CRED_CACHE_TTL > 0:
+        _CRED_CACHE[username] = (pw_hash, time.monotonic() + CRED_CACHE_TTL)
+
+def forget_pw_hash(username):
+    _CRED_CACHE.pop(username, None)
+
+class RateLimiter:
+    """키별 슬라이딩 윈도우 속도 제한 (메모리 사용은 max_keys개 키로 제한, 오래된 키부터 제거)"""
+    def __init__(self, spec, max_keys=10000):
+        limit, _, window = spec.partition("/")
+        self.limit = int(limit)
+        self.window = float(window or 60)
+        self.max_keys = max_keys
+        self._hits = OrderedDict()  # key -> deque[timestamp]
+        self._lock = threading.Lock()
+
+    def retry_after(self, key):
+        """제한에 걸렸으면 다시 시도까지 남은 초, 아니면 0"""
+        now = time.time()
+        with self._lock:
+            q = self._hits.get(key)
+            if not q:
+                return 0
+            while q and q[0] <= now - self.window:
+                q.popleft()
+            return (q[0] + self.window - now) if len(q) >= self.limit else 0
+
+    def hit(self, key):
+        now = time.time()
+        with self._lock:
+            q = self._hits.get(key)
+            if q is None:
+                q = self._hits[key] = deque()
+                while len(self._hits) > self.max_keys:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            q.append(now)
 
-    function revealImmediateAnswer(q, wasSkipped=false){
-      const box = document.getElementById('question-content');
-      let correctAnswer;
-      if (q.qtype==='multiple_choice') correctAnswer = formatRef(q.verse);
-      else if (q.qtype==='multiple_choice_text') correctAnswer = `“${q.verse.text}”`;
-      else if (q.qtype==='identify_ref') correctAnswer = formatRef(q.verse);
-      else if (q.qtype==='cloze' || q.qtype==='continue_verse') correctAnswer = q.verse.text;
-      else correctAnswer = formatRef(q.verse);
-
-      const status = wasSkipped ? '스킵' : (q.correct ? '정답' : '오답');
-      const html = `
-        <div class="answer-reveal">
-          <div><strong>채점:</strong> ${status}</div>
-          <div class="mt-1"><strong>정답:</strong> ${correctAnswer}</div>
-          <div class="mt-1"><strong>참조:</strong> <span class="mono">${formatRef(q.verse)}</span></div>
-          <div class="mt-1"><strong>문구:</strong> “${q.verse.text}”</div>
-          <div class="mt-1"><strong>내 답:</strong> ${wasSkipped ? '(스킵)' : (q.userAnswerDisplay||'-')}</div>
-        </div>`;
-      box.insertAdjacentHTML('beforeend', html);
-    }
+# QUIZ_LOGIN_RATE_IP: IP당 로그인/가입 시도 수, QUIZ_LOGIN_RATE_USER: 아이디당 로그인 실패 수 ("횟수/초")
+LOGIN_LIMIT_IP = RateLimiter(os.environ.get("QUIZ_LOGIN_RATE_IP", "30/60"))
+LOGIN_LIMIT_USER = RateLimiter(os.environ.get("QUIZ_LOGIN_RATE_USER", "10/60"))
 
-    function prevQuestion(){ if (!CURRENT_QUIZ || CURRENT_QUIZ.practice) return; if (CURRENT_QUIZ.index>0){ CURRENT_QUIZ.index--; renderQuestion(); } }
-    function nextQuestion(){
-      if (!CURRENT_QUIZ) return;
-      if (CURRENT_QUIZ.practice){
-        if (!CURRENT_QUIZ.answered[CURRENT_QUIZ.index]) return;
-        const nextQ = CURRENT_QUIZ.makeOne();
-        CURRENT_QUIZ.questions = [nextQ];
-        CURRENT_QUIZ.answered = [false];
-        CURRENT_QUIZ.index = 0;
-        renderQuestion();
-        return;
-      }
-      if (CURRENT_QUIZ.index<CURRENT_QUIZ.questions.length-1){
-        CURRENT_QUIZ.index++; renderQuestion();
-      }
-    }
+def _too_many(retry_after):
+    resp = jsonify({"ok": False, "error": "시도가 너무 많습니다. 잠시 후 다시 시도하세요."})
+    resp.headers["Retry-After"] = str(int(retry_after) + 1)
+    return resp, 429
 
-    // ------------------------------
-    // 결과/요약 및 저장 (저장 완료 보장)
-    // ------------------------------
-    async function showResult(autoSave=false){
-      const total = CURRENT_QUIZ.questions.length;
-      const correct = CURRENT_QUIZ.score;
-      const skip = CURRENT_QUIZ.skip;
-      document.getElementById('res-total').textContent = total;
-      document.getElementById('res-correct').textContent = correct;
-      document.getElementById('res-skip').textContent = skip;
-      document.getElementById('res-score').textContent = `${correct}/${total}`;
-
-      const list = document.getElementById('result-list');
-      list.innerHTML = '';
-      CURRENT_QUIZ.questions.forEach((q,idx)=>{
-        const typeLabel = (q.qtype==='multiple_choice' || q.qtype==='multiple_choice_text') ? '객관식' : '주관식';
-        const badge = q.skipped ? '<span class="badge text-bg-warning">스킵</span>' : (q.correct ? '<span class="badge text-bg-success">정답</span>' : '<span class="badge text-bg-danger">오답</span>');
-        let correctAnswer;
-        if (q.qtype==='multiple_choice') correctAnswer = formatRef(q.verse);
-        else if (q.qtype==='multiple_choice_text') correctAnswer = `“${q.verse.text}”`;
-        else if (q.qtype==='identify_ref') correctAnswer = formatRef(q.verse);
-        else if (q.qtype==='cloze' || q.qtype==='continue_verse') correctAnswer = q.verse.text;
-        else correctAnswer = formatRef(q.verse);
-
-        const card = document.createElement('div');
-        card.className = 'col-12';
-        card.innerHTML = `
-          <div class="card question-card ${q.correct?'correct':(q.skipped?'':'incorrect')}">
-            <div class="card-body">
-              <div class="d-flex justify-content-between align-items-start">
-                <h6 class="mb-2">Q${idx+1} <small class="text-muted">(${typeLabel} / ${q.qtype})</small></h6>
-                ${badge}
-              </div>
-              <div class="mb-2"><strong>참조:</strong> <span class="mono">${formatRef(q.verse)}</span></div>
-              <div class="mb-2"><strong>문구:</strong> “${q.verse.text}”</div>
-              <div class="mb-2"><strong>문제:</strong> ${q.prompt}</div>
-              <div><strong>정답:</strong> ${correctAnswer}</div>
-              <div class="mt-1"><strong>내 답:</strong> ${q.skipped ? '(스킵)' : (q.userAnswerDisplay||'-')}</div>
-            </div>
-          </div>`;
-        list.appendChild(card);
-      });
-
-      LAST_RESULT = summarizeCurrent(true); // 세트 저장 포함
-      LAST_RESULT.type = 'exam';
-
-      // 재시험이면 기존 세트 id로 덮어쓰기
-      let replaceId = null;
-      if (CURRENT_QUIZ.originSessionId){
-        LAST_RESULT.id = CURRENT_QUIZ.originSessionId;
-        replaceId = CURRENT_QUIZ.originSessionId;
-      }
-
-      document.getElementById('quiz-panel').classList.add('hidden');
-      document.getElementById('result-panel').classList.remove('hidden');
-
-      if (autoSave && LAST_RESULT){
-        const payload = replaceId ? { session: LAST_RESULT, replaceId } : { session: LAST_RESULT };
-        const res = await apiPost('/save', payload);
-        if (!(res && res.ok)) { alert(res?.error || '저장 중 오류가 발생했습니다.'); }
-        await buildDashboard(); // 저장 완료 후 대시보드 동기화
-      }
-    }
+def _hash_busy():
+    resp = jsonify({"ok": False, "error": "로그인 요청이 많습니다. 잠시 후 다시 시도하세요."})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
 
-    function summarizeCurrent(includeDump=false){
-      const details = CURRENT_QUIZ.questions.map(q=>({
-        qtype: q.qtype,
-        subj: q.qtype!=='multiple_choice' && q.qtype!=='multiple_choice_text',
-        book: q.verse.book, chapter: q.verse.chapter, verse: q.verse.verse,
-        text: q.verse.text,
-        correct: !!q.correct,
-        skipped: !!q.skipped
-      }));
-      const uniq = Date.now()+'_'+Math.floor(Math.random()*1e6);
-      const base = {
-        id: 'sess_'+uniq,
-        dateISO: new Date().toISOString(),
-        total: CURRENT_QUIZ.questions.length,
-        correct: CURRENT_QUIZ.score,
-        skip: CURRENT_QUIZ.skip,
-        score: CURRENT_QUIZ.score,
-        originSessionId: CURRENT_QUIZ.originSessionId || null,
-        details
-      };
-      if (includeDump){
-        // 재시험을 위한 세트 덤프(문항 그대로)
-        base["questionsDump"] = CURRENT_QUIZ.questions.map(q=>({
-          qtype: q.qtype,
-          subj: q.subj,
-          verse: {book:q.verse.book, chapter:q.verse.chapter, verse:q.verse.verse, text:q.verse.text},
-          prompt: q.prompt,
-          options: q.options || null,
-          correctIndex: (typeof q.correctIndex==='number') ? q.correctIndex : null,
-          maskedHtml: q.maskedHtml || null
-        }));
-      }
-      return base;
-    }
+# ------------------------------
+# 계측: 라우트 지연 시간, DB 로드/저장 시간·바이트, 응답 크기, 활성 사용자 → /metrics (Prometheus 텍스트 형식)
+# ------------------------------
+# QUIZ_METRICS=0 이면 요청 훅을 등록하지 않으며, 계측 지점은 플래그 하나만 확인하고 넘어간다
+METRICS_ENABLED = os.environ.get("QUIZ_METRICS", "1") != "0"
+METRICS_TOKEN = os.environ.get("QUIZ_METRICS_TOKEN")  # 설정 시 Authorization: Bearer <토큰> 필요
+ACTIVE_USER_WINDOW = 300  # 최근 5분 안에 요청한 로그인 사용자를 활성으로 집계
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256B ~ 64MB
+
+METRIC_HELP = {
+    "quiz_http_request_duration_seconds": ("histogram", "라우트별 요청 처리 시간"),
+    "quiz_http_requests_total": ("counter", "라우트/상태 코드별 요청 수"),
+    "quiz_http_response_bytes": ("histogram", "라우트별 응답 본문 크기"),
+    "quiz_db_load_seconds": ("histogram", "quiz_stats.json 읽기+파싱 시간"),
+    "quiz_db_load_bytes": ("histogram", "quiz_stats.json 읽은 크기"),
+    "quiz_db_save_seconds": ("histogram", "quiz_stats.json 기록(fsync 포함) 시간"),
+    "quiz_db_save_bytes": ("histogram", "quiz_stats.json 기록 크기"),
+    "quiz_json_encode_seconds": ("histogram", "JSON 인코딩 시간(response | storage)"),
+    "quiz_snapshot_seconds": ("histogram", "스냅샷 작성 시간(inc | full)"),
+}
+_METRICS_LOCK = threading.Lock()
+_HISTOGRAMS = {}    # (이름, 라벨 튜플) -> [버킷 경계, 버킷별 개수(+Inf 포함), 합계]
+_COUNTERS = {}      # (이름, 라벨 튜플) -> 값
+_ACTIVE_USERS = {}  # username -> 마지막 요청 시각
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """히스토그램에 값 하나 기록 (비활성 시 즉시 반환)"""
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    idx = bisect.bisect_left(buckets, value)  # value <= 경계인 첫 버킷
+    with _METRICS_LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = _HISTOGRAMS[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+        h[1][idx] += 1
+        h[2] += value
+
+def inc(name, n=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + n
+
+def _metric_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def _fmt_num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def render_metrics():
+    """누적 계측 + 현재 상태(활성 사용자, 해시 통계 등)를 Prometheus 텍스트 형식으로"""
+    now = time.time()
+    for uname, seen in list(_ACTIVE_USERS.items()):
+        if now - seen > ACTIVE_USER_WINDOW:
+            _ACTIVE_USERS.pop(uname, None)
+    with STORE.process_lock():
+        registered = STORE.user_count()
+        dirty = int(_DB_DIRTY)
+    with _AUTH_STATS_LOCK:
+        auth = dict(AUTH_STATS)
+    gauges = [
+        ("quiz_active_users", "gauge", f"최근 {ACTIVE_USER_WINDOW}초 안에 요청한 로그인 사용자 수", len(_ACTIVE_USERS)),
+        ("quiz_registered_users", "gauge", "가입 사용자 수", registered),
+        ("quiz_db_dirty", "gauge", "아직 파일에 기록되지 않은 변경 여부(write-behind)", dirty),
+        ("quiz_password_hash_total", "counter", "비밀번호 해시 계산 수", auth["hashed"]),
+        ("quiz_password_hash_rejected_total", "counter", "동시성 상한으로 거절된 해시 요청 수", auth["rejected"]),
+        ("quiz_password_hash_seconds_total", "counter", "해시 계산 시간 합계", auth["hash_ms_total"] / 1000.0),
+        ("quiz_password_hash_queue_seconds_total", "counter", "해시 대기 시간 합계", auth["queue_ms_total"] / 1000.0),
+        ("quiz_password_hash_queue_seconds_max", "gauge", "해시 대기 시간 최댓값", auth["queue_ms_max"] / 1000.0),
+    ]
+    with _METRICS_LOCK:
+        hists = sorted((k, (h[0], list(h[1]), h[2])) for k, h in _HISTOGRAMS.items())
+        counters = sorted(_COUNTERS.items())
+
+    lines = []
+    for name, mtype, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {mtype}", f"{name} {_fmt_num(value)}"]
+    declared = set()
+    def _declare(name):
+        if name not in declared:
+            declared.add(name)
+            mtype, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {mtype}"])
+    for (name, labels), value in counters:
+        _declare(name)
+        lines.append(f"{name}{_metric_labels(labels)} {_fmt_num(value)}")
+    for (name, labels), (buckets, counts, total) in hists:
+        _declare(name)
+        cum = 0
+        for bound, c in zip(buckets, counts):
+            cum += c
+            lines.append(f"{name}_bucket{_metric_labels(labels, [('le', _fmt_num(bound))])} {cum}")
+        cum += counts[-1]
+        lines.append(f"{name}_bucket{_metric_labels(labels, [('le', '+Inf')])} {cum}")
+        lines.append(f"{name}_sum{_metric_labels(labels)} {_fmt_num(total)}")
+        lines.append(f"{name}_count{_metric_labels(labels)} {cum}")
+    return "\n".join(lines) + "\n"
+
+def _metrics_before_request():
+    g.metrics_t0 = time.perf_counter()
+
+def _metrics_after_request(resp):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is None:
+        return resp
+    # 라벨은 URL 규칙(/static/<path:name> 등) 단위 — 실제 경로를 쓰면 시계열이 끝없이 늘어난다
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    observe("quiz_http_request_duration_seconds", time.perf_counter() - t0, route=route, method=request.method)
+    inc("quiz_http_requests_total", route=route, method=request.method, status=resp.status_code)
+    if not resp.is_streamed:
+        observe("quiz_http_response_bytes", resp.content_length or 0, SIZE_BUCKETS, route=route)
+    return resp
+
+if METRICS_ENABLED:
+    app.before_request(_metrics_before_request)
+    app.after_request(_metrics_after_request)
+
+# 기동 단계: 저장소를 현재 스키마로 올려 저장 — 모듈 import 만으로는 파일을 쓰지 않는다(벤치·CLI·REPL).
+# serve / 개발 서버 / ASGI lifespan 이 기동 시 부르고, 그 밖의 진입점(gunicorn bible_quiz_app:app 등)은 첫 요청 전에.
+# 올리지 않은 레코드도 읽을 때 메모리에서 올리므로(load_db, ensure_user) 늦어져도 동작은 같다
+_MIGRATED = False
+_MIGRATE_LOCK = threading.Lock()
+
+def run_startup_migration():
+    global _MIGRATED
+    if _MIGRATED:
+        return
+    with _MIGRATE_LOCK:
+        if _MIGRATED:
+            return
+        upgraded = STORE.migrate()
+        if upgraded:
+            app.logger.warning("저장소 스키마를 v%d 로 올렸습니다 (사용자 %d명)", SCHEMA_VERSION, upgraded)
+        _MIGRATED = True
+
+@app.before_request
+def _migrate_before_first_request():
+    run_startup_migration()
 
-    async function clearAll(){
-      if (!CURRENT_USER){ alert('기록을 초기화하려면 로그인하세요.'); showView('auth'); return; }
-      if (!confirm('서버에 저장된 (내) 모든 기록과 설정을 초기화할까요?')) return;
-      const res = await apiPost('/reset', {});
-      if (res && res.ok){
-        alert('초기화되었습니다.');
-        buildDashboard();
-        refreshMeta();
-        await loadSettings(); // 기본 설정으로 반영
-      }
-    }
+# ------------------------------
+# 관리자 인증 (QUIZ_ADMIN_TOKEN 미설정 시 관리자 기능 전체 비활성)
+# ------------------------------
+ADMIN_TOKEN = os.environ.get("QUIZ_ADMIN_TOKEN")
+
+def is_admin_request():
+    """X-Admin-Token 또는 Authorization: Bearer 헤더가 QUIZ_ADMIN_TOKEN 과 일치하는지"""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get("X-Admin-Token")
+    if token is None:
+        auth = request.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else ""
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+def admin_required(fn):
+    """관리자 라우트: 토큰 미설정이면 404(존재 자체를 숨김), 불일치면 403"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return Response("not found", status=404, mimetype="text/plain")
+        if not is_admin_request():
+            return jsonify({"ok": False, "error": "forbidden"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
 
-    // ------------------------------
-    // 대시보드 구축 (+ 과거 시험/재시험/틀린만 재시험, TOP20, 랭킹, 최근 오답율)
-    // ------------------------------
-    async function buildDashboard(){
-      const d = await apiGet('/data');
-      if (!d) return;
-      const sessions = (d.sessions||[]).slice();
-
-      // 1) 과거 시험 표 (시험 성격 세트만 표시)
-      try {
-        const tb = document.getElementById('table-past-sessions');
-        if (tb){ tb.innerHTML = ''; }
-        const examSessions = sessions.filter(se=> se?.type==='exam' || (se?.total||0) > 1);
-        examSessions.forEach((se,idx)=>{
-          const dt = new Date(se.dateISO || Date.now());
-          const name = `세트 ${idx+1}`;
-          const accuracy = se.total ? Math.round((se.correct||0)/se.total*100) : 0;
-          const canRetake = !!se.questionsDump;
-          const tr = document.createElement('tr');
-          tr.innerHTML = `
-            <td class="nowrap">${name}</td>
-            <td class="nowrap">${dt.toLocaleString()}</td>
-            <td class="text-end">${se.total||0}</td>
-            <td class="text-end">${se.correct||0}</td>
-            <td class="text-end">${accuracy}%</td>
-            <td>
-              <div class="btn-group btn-group-sm">
-                <button class="btn btn-outline-primary" data-sid="${se.id}" ${canRetake?'':'disabled'}>재시험</button>
-                <button class="btn btn-outline-danger" data-sid="${se.id}" data-retake-wrong="1" ${canRetake?'':'disabled'}>틀린문제만</button>
-                <button class="btn btn-outline-secondary" data-sid="${se.id}" data-review="1">결과보기</button>
-                <button class="btn btn-outline-dark" data-sid="${se.id}" data-delete="1">삭제</button>
-              </div>
-            </td>`;
-          if (tb) tb.appendChild(tr);
-        });
-
-        // 버튼 바인딩
-        if (tb){
-          tb.querySelectorAll('button').forEach(btn=>{
-            btn.addEventListener('click', async (ev)=>{
-              const sid = ev.target.getAttribute('data-sid');
-              const isReview = ev.target.getAttribute('data-review');
-              const isWrongOnly = ev.target.getAttribute('data-retake-wrong');
-              const isDelete = ev.target.getAttribute('data-delete');
-              if (isDelete){
-                if (!confirm('이 시험 세트를 삭제할까요?')) return;
-                const res = await apiPost('/delete_session', {id: sid});
-                if (res && res.ok){ buildDashboard(); }
-                return;
-              }
-
-              const d2 = await apiGet('/data');
-              const se = (d2.sessions||[]).find(x=> x.id===sid);
-              if (!se){ alert('결과 데이터를 찾을 수 없습니다.'); return; }
-
-              if (isReview){
-                // 과거 결과 보기
-                const list = document.getElementById('result-list');
-                list.innerHTML = '';
-                const qs = se.questionsDump || [];
-                const details = se.details || [];
-                if (qs.length === 0){
-                  const msg = document.createElement('div');
-                  msg.className = 'alert alert-warning';
-                  msg.textContent = '이 세트에는 문제 덤프가 없어 상세 결과를 표시할 수 없습니다.';
-                  list.appendChild(msg);
-                } else {
-                  qs.forEach((q,idx)=>{
-                    const verse = q.verse;
-                    const typeLabel = (q.qtype==='multiple_choice' || q.qtype==='multiple_choice_text') ? '객관식' : '주관식';
-
-                    const drec = details[idx] || {}
-                    const badge = drec.skipped ? '<span class="badge text-bg-warning">스킵</span>' : (drec.correct ? '<span class="badge text-bg-success">정답</span>' : '<span class="badge text-bg-danger">오답</span>');
-
-                    let correctAnswer;
-                    if (q.qtype==='multiple_choice') correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
-                    else if (q.qtype==='multiple_choice_text') correctAnswer = `“${verse.text}”`;
-                    else if (q.qtype==='identify_ref') correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
-                    else if (q.qtype==='cloze' || q.qtype==='continue_verse') correctAnswer = verse.text;
-                    else correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
-
-                    const card = document.createElement('div');
-                    card.className = 'col-12';
-                    card.innerHTML = `
-                      <div class="card question-card ${drec.correct?'correct':(drec.skipped?'':'incorrect')}">
-                        <div class="card-body">
-                          <div class="d-flex justify-content-between align-items-start">
-                            <h6 class="mb-2">Q${idx+1} <small class="text-muted">(${typeLabel} / ${q.qtype})</small></h6>
-                            ${badge}
-                          </div>
-                          <div class="mb-2"><strong>참조:</strong> <span class="mono">${verse.book} ${verse.chapter},${verse.verse}</span></div>
-                          <div class="mb-2"><strong>문구:</strong> “${verse.text}”</div>
-                          <div class="mb-2"><strong>문제:</strong> ${q.prompt}</div>
-                          <div><strong>정답:</strong> ${correctAnswer}</div>
-                        </div>
-                      </div>`;
-                    list.appendChild(card);
-                  });
-                }
-                document.getElementById('res-total').textContent = se.total||0;
-                document.getElementById('res-correct').textContent = se.correct||0;
-                document.getElementById('res-skip').textContent = se.skip||0;
-                document.getElementById('res-score').textContent = `${se.correct||0}/${se.total||0}`;
-                document.getElementById('quiz-panel').classList.add('hidden');
-                document.getElementById('result-panel').classList.remove('hidden');
-                showView('quiz');
-              } else if (isWrongOnly){
-                retakeWrongOnly(sid);
-              } else {
-                retakeSession(sid);
-              }
-            });
-          });
-        }
-      } catch(e){ console.warn('past-sessions build error', e); }
-
-      // 2) 요약/차트: 시험 세션만 반영 (practice 제외)
-      try {
-        const exams = sessions.filter(se => se.type === 'exam' || (se?.total||0) > 1);
-        document.getElementById('stat-total-tests').textContent = exams.length;
-        document.getElementById('stat-last-score').textContent = exams.length ? `${exams[exams.length-1].correct||0}/${exams[exams.length-1].total||0}` : '-';
-        const avg = exams.length ? (exams.reduce((acc,x)=>acc + (x.correct||0)/(x.total||1)*30,0)/exams.length) : 0;
-        document.getElementById('stat-avg-score').textContent = exams.length ? avg.toFixed(1)+'/30' : '-';
-
-        let subjC=0, subjT=0, objC=0, objT=0, skipC=0, skipT=0;
-        for (const se of exams){
-          for (const d0 of (se.details||[])){
-            const d = d0||{};
-            if (d.subj){subjT++; if (d.correct) subjC++;} else {objT++; if (d.correct) objC++;}
-            skipT++; if (d.skipped) skipC++;
-          }
-        }
-        document.getElementById('stat-subj-acc').textContent = subjT? ((subjC/subjT*100).toFixed(1)+'%') : '-';
-        document.getElementById('stat-obj-acc').textContent = objT? ((objC/objT*100).toFixed(1)+'%') : '-';
-        document.getElementById('stat-skip-rate').textContent = skipT? ((skipC/skipT*100).toFixed(1)+'%') : '-';
-
-        const labels = exams.map((_,i)=> i+1);
-        const scores = exams.map(se=> Math.round((se.correct||0)/(se.total||1)*30));
-        const ctx = document.getElementById('chart-scores').getContext('2d');
-        if (chartScores) { chartScores.destroy(); }
-        chartScores = new Chart(ctx, {
-          type: 'line',
-          data: { labels, datasets: [{ label: '점수(30점 만점 환산)', data: scores }] },
-          options: { responsive: true, scales: { y: { beginAtZero: true, suggestedMax: 30 } } }
-        });
-
-        // 3) 오답 TOP20: verseScores 기반
-        const verseScores = d.verseScores || {};
-        const entries = Object.entries(verseScores).filter(([,v])=> (v||0)>0).sort((a,b)=> (b[1] - a[1])).slice(0,20);
-
-        const textIndex = new Map();
-        for (const v of VERSES){
-          textIndex.set(`${v.book}|${v.chapter}|${v.verse}`, v.text);
-        }
-
-        const ul = document.getElementById('wrong-top'); if (ul) ul.innerHTML = '';
-        for (const [key, cnt] of entries){
-          const [book, chapter, verse] = key.split('|');
-          const numC = parseInt(chapter,10), numV = parseInt(verse,10);
-          const verseText = textIndex.get(key) || '(텍스트 로드 전 또는 미상)';
-          const li = document.createElement('li');
-          li.className = 'list-group-item d-flex justify-content-between align-items-center';
-          li.innerHTML = `
-            <span>[${book} ${numC},${numV}] ${verseText}</span>
-            <span class="d-flex align-items-center gap-2">
-              <span class="badge bg-danger">${cnt}</span>
-              <button class="btn btn-sm btn-outline-dark" data-del-key="${key}">삭제</button>
-            </span>`;
-          ul?.appendChild(li);
-        }
-        // TOP20 삭제 버튼 바인딩
-        if (ul){
-          ul.querySelectorAll('button[data-del-key]').forEach(btn=>{
-            btn.addEventListener('click', async (ev)=>{
-              const key = ev.target.getAttribute('data-del-key');
-              if (!confirm('이 항목을 TOP20에서 제거(카운트 리셋)할까요?')) return;
-              const res = await apiPost('/delete_verse_score', {key});
-              if (res && res.ok){ buildDashboard(); }
-            });
-          });
-        }
-
-        // 4) 책별 최근 오답율 (최근 100문항, 시험+학습 모두 포함)
-        try {
-          const recentWindow = 100;
-          const flattened = []; // [{book, correct, skipped, dateISO}]
-          // 세션을 최신순으로 훑으면서 details를 최신순으로 채우기
-          const sorted = sessions.slice().sort((a,b)=> new Date(b.dateISO||0) - new Date(a.dateISO||0));
-          for (const se of sorted){
-            const det = (se.details||[]).slice(); // 원본 보존
-            // 세트 내부 문항도 뒤에서부터(최신) 넣자
-            for (let i=det.length-1; i>=0; i--){
-              if (flattened.length >= recentWindow) break;
-              const d0 = det[i];
-              flattened.push({ book: d0.book, correct: !!d0.correct, skipped: !!d0.skipped, dateISO: se.dateISO });
-            }
-            if (flattened.length >= recentWindow) break;
-          }
-          const byBook = new Map();
-          for (const r of flattened){
-            const b = r.book || '(미상)';
-            if (!byBook.has(b)) byBook.set(b, {t:0,w:0});
-            byBook.get(b).t++;
-            if (r.skipped || !r.correct) byBook.get(b).w++;
-          }
-          const rows = Array.from(byBook.entries()).map(([book,st])=>{
-            const rate = st.t? (st.w/st.t*100) : 0;
-            return {book, t:st.t, w:st.w, rate};
-          }).sort((a,b)=> b.rate - a.rate || b.t - a.t || a.book.localeCompare(b.book));
-          const tbody = document.getElementById('table-recent-wrong-by-book');
-          if (tbody){
-            tbody.innerHTML = '';
-            for (const r of rows){
-              const tr = document.createElement('tr');
-              tr.innerHTML = `<td>${r.book}</td><td class="text-end">${r.t}</td><td class="text-end">${r.w}</td><td class="text-end">${r.rate.toFixed(1)}%</td>`;
-              tbody.appendChild(tr);
-            }
-            const rangeEl = document.getElementById('recent-window-range');
-            if (rangeEl){
-              if (flattened.length>0){
-                const lastDate = new Date(flattened[flattened.length-1].dateISO||Date.now());
-                const firstDate = new Date(flattened[0].dateISO||Date.now());
-                rangeEl.textContent = `${flattened.length}문항 · ${lastDate.toLocaleDateString()} – ${firstDate.toLocaleDateString()}`;
-              } else {
-                rangeEl.textContent = '';
-              }
-            }
-          }
-        } catch(e){ console.warn('recent wrong by book error', e); }
-
-        // 5) 랭킹 불러오기
-        try {
-          const lb = await apiGet('/leaderboard');
-          const tbody = document.getElementById('table-leaderboard');
-          if (tbody){
-            tbody.innerHTML = '';
-            (lb?.leaders||[]).forEach((row, idx)=>{
-              const tr = document.createElement('tr');
-              tr.innerHTML = `<td class="text-center">${idx+1}</td><td>${row.username}</td><td class="text-end">${row.avgPercent.toFixed(1)}%</td><td class="text-end">${row.sampleCount}</td>`;
-              tbody.appendChild(tr);
-            });
-          }
-        } catch(e){ console.warn('leaderboard error', e); }
-
-      } catch(e){ console.warn('summary/stats build error', e); }
+# ------------------------------
+# 느린 요청 프로파일링 (옵트인)
+# ------------------------------
+# QUIZ_PROFILE=1: 모든 요청을 cProfile로 측정하고 QUIZ_PROFILE_THRESHOLD_MS(기본 500ms) 이상 걸린 것만 저장
+# 관리자 헤더 X-Quiz-Profile: 1 (+ 관리자 토큰): 해당 요청만 측정하고 임계값과 무관하게 저장
+# 저장 위치 QUIZ_PROFILE_DIR(기본 quiz_profiles), 최근 QUIZ_PROFILE_KEEP개(기본 100)만 유지
+#   <id>.prof: pstats 원본(snakeviz 등으로 열람), <id>.txt: 누적 시간순 요약, <id>.json: 라우트/사용자/크기 메타
+PROFILE_ALL = os.environ.get("QUIZ_PROFILE") == "1"
+PROFILE_THRESHOLD = float(os.environ.get("QUIZ_PROFILE_THRESHOLD_MS", "500")) / 1000.0
+PROFILE_DIR = os.environ.get("QUIZ_PROFILE_DIR", "quiz_profiles")
+PROFILE_KEEP = int(os.environ.get("QUIZ_PROFILE_KEEP", "100"))
+_PROFILE_ID = re.compile(r"^[0-9T]+-[0-9]+ms-[0-9a-f]+$")
+_PROFILE_WRITE_LOCK = threading.Lock()
+
+def _profile_before_request():
+    forced = request.headers.get("X-Quiz-Profile") == "1" and is_admin_request()
+    if not (PROFILE_ALL or forced):
+        return
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        return  # 다른 프로파일러가 이미 동작 중(3.12+ 에서는 인터프리터당 하나) — 이번 요청은 건너뜀
+    g.profile = (prof, time.perf_counter(), forced)
+
+def _profile_after_request(resp):
+    item = g.pop("profile", None)
+    if item is None:
+        return resp
+    prof, t0, forced = item
+    prof.disable()
+    elapsed = time.perf_counter() - t0
+    if forced or elapsed >= PROFILE_THRESHOLD:
+        try:
+            _save_profile(prof, elapsed, resp)
+        except OSError as e:
+            app.logger.error("프로파일 저장 실패: %s", e)
+    return resp
+
+def _profile_teardown(exc):
+    # 예외로 after_request 가 건너뛰어진 경우에도 프로파일러는 반드시 끈다
+    item = g.pop("profile", None)
+    if item is not None:
+        item[0].disable()
+
+def _save_profile(prof, elapsed, resp):
+    now = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+    pid = f"{stamp}-{int(elapsed * 1000)}ms-{secrets.token_hex(3)}"
+    meta = {
+        "id": pid,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+        "route": request.url_rule.rule if request.url_rule is not None else request.path,
+        "path": request.path,
+        "method": request.method,
+        "status": resp.status_code,
+        "user": session.get("username"),
+        "durationMs": round(elapsed * 1000.0, 1),
+        "requestBytes": request.content_length or 0,
+        "responseBytes": None if resp.is_streamed else resp.content_length,
     }
+    out = io.StringIO()
+    out.write("".join(f"# {k}: {v}\n" for k, v in meta.items()) + "\n")
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+    with _PROFILE_WRITE_LOCK:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, pid)
+        prof.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        with open(base + ".json", "wb") as f:
+            f.write(dumps_json(meta))  # 메타는 마지막에 기록 — 목록에는 완성된 항목만 보인다
+        # 회전: 이름이 시각으로 시작하므로 정렬 순서 = 생성 순서
+        metas = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+        for name in metas[:max(0, len(metas) - PROFILE_KEEP)]:
+            for ext in (".json", ".prof", ".txt"):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, name[:-5] + ext))
+                except OSError:
+                    pass
+
+def list_profiles():
+    try:
+        names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)
+    except OSError:
+        return []
+    out = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "rb") as f:
+                out.append(loads_json(f.read()))
+        except (OSError, ValueError):
+            continue
+    return out
 
-    // 초기 로드
-    document.addEventListener('DOMContentLoaded', async ()=>{
-      bindAuthUI();
-      await refreshWhoAmI();
-      // 서버 기본 verses.csv 자동 로드
-      await loadDefaultVersesFromServer(false);
-      showView('home');
-      buildDashboard();
-      // 첫 로드 시 점수 표시 기본 숨김(시험 디폴트 가정)
-      setScoreVisibility(false);
-      refreshMeta();
-    });
-
-    // 인라인 onclick에서 쓰는 함수들을 전역(window)에 노출
-    window.showView = showView;
-    window.saveSettings = saveSettings;
-    window.loadSettings = loadSettings;
-    window.clearAll = clearAll;
-    window.prevQuestion = prevQuestion;
-    window.nextQuestion = nextQuestion;
-    window.submitAnswer = submitAnswer;
-    window.skipQuestion = skipQuestion;
-    window.retakeSession = retakeSession;
-    window.retakeWrongOnly = retakeWrongOnly;
-    window.startTop20Quiz = startTop20Quiz;
-  </script>
-  <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js"></script>
-</body>
-</html>
-"""
+if PROFILE_ALL or ADMIN_TOKEN:
+    app.before_request(_profile_before_request)
+    app.after_request(_profile_after_request)
+    app.teardown_request(_profile_teardown)
 
 # ------------------------------
 # Flask 라우트 (API)
 # ------------------------------
 @app.route("/")
 def index():
-    return Response(INDEX_HTML, mimetype="text/html; charset=utf-8")
+    return cached_response(INDEX_PAGE, REVALIDATE_CACHE)
+
+@app.route("/sw.js")
+def service_worker():
+    return cached_response(SERVICE_WORKER, REVALIDATE_CACHE)
+
+@app.route("/static/<path:name>")
+def static_asset(name):
+    item = STATIC_ASSETS.get(name)
+    if item is None:
+        return Response("not found", status=404, mimetype="text/plain")
+    entry, cache_control = item
+    return cached_response(entry, cache_control)
 
 @app.route("/whoami")
 def whoami():
@@ -1910,12 +2741,24 @@ def signup():
     password = payload.get("password") or ""
     if not username or not password:
         return jsonify({"ok": False, "error": "missing username/password"}), 400
-    db = load_db()
-    if username in db["users"] and db["users"][username].get("pw_hash"):
+    ip = request.remote_addr or "-"
+    wait = LOGIN_LIMIT_IP.retry_after(ip)
+    if wait:
+        return _too_many(wait)
+    LOGIN_LIMIT_IP.hit(ip)
+    if lookup_pw_hash(username):
         return jsonify({"ok": False, "error": "이미 존재하는 아이디입니다."}), 400
-    ensure_user(db, username)
-    db["users"][username]["pw_hash"] = generate_password_hash(password)
-    save_db(db)
+    try:
+        pw_hash = run_password_hash("generate", password)  # 해시 생성은 락 밖에서
+    except HashBusy:
+        return _hash_busy()
+    with STORE.process_lock(), STORE.user_lock(username):
+        u = ensure_user(username)
+        if u.get("pw_hash"):
+            return jsonify({"ok": False, "error": "이미 존재하는 아이디입니다."}), 400
+        u["pw_hash"] = pw_hash
+        save_user(username, u)
+    remember_pw_hash(username, pw_hash)
     session["username"] = username
     return jsonify({"ok": True, "username": username})
 
@@ -1926,9 +2769,18 @@ def login():
     password = payload.get("password") or ""
     if not username or not password:
         return jsonify({"ok": False, "error": "missing username/password"}), 400
-    db = load_db()
-    user = db["users"].get(username)
-    if not user or not user.get("pw_hash") or not check_password_hash(user["pw_hash"], password):
+    ip = request.remote_addr or "-"
+    wait = max(LOGIN_LIMIT_IP.retry_after(ip), LOGIN_LIMIT_USER.retry_after(username))
+    if wait:
+        return _too_many(wait)
+    LOGIN_LIMIT_IP.hit(ip)
+    pw_hash = lookup_pw_hash(username)
+    try:
+        ok = bool(pw_hash) and run_password_hash("check", pw_hash, password)
+    except HashBusy:
+        return _hash_busy()
+    if not ok:
+        LOGIN_LIMIT_USER.hit(username)
         return jsonify({"ok": False, "error": "아이디 또는 비밀번호가 올바르지 않습니다."}), 400
     session["username"] = username
     return jsonify({"ok": True, "username": username})
@@ -1939,20 +2791,24 @@ def logout():
     return jsonify({"ok": True})
 
 @app.route("/data")
+@db_locked
 def data():
-    db = load_db()
     uname = current_username()
     if not uname:
         # 비로그인: 빈 사용자 데이터 형태 반환
-        return jsonify({"sessions": [], "settings": DEFAULT_SETTINGS.copy(), "verseScores": {}})
-    u = ensure_user(db, uname)
+        return jsonify({"sessions": [], "settings": default_settings(), "verseScores": {}, "verseStats": {},
+                        "corpus": None})
+    u = ensure_user(uname)
     return jsonify({
-        "sessions": u.get("sessions", []),
-        "settings": u.get("settings", DEFAULT_SETTINGS.copy()),
-        "verseScores": u.get("verseScores", {})
+        "sessions": [expand_session(se) for se in u.get("sessions", [])],
+        "settings": u.get("settings") or default_settings(),
+        "verseScores": u.get("verseScores", {}),
+        "verseStats": u.get("verseStats", {}),
+        "corpus": u.get("corpus")
     })
 
 @app.route("/save", methods=["POST"])
+@db_locked
 def save():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -1961,25 +2817,81 @@ def save():
     if not payload or "session" not in payload:
         return jsonify({"ok": False, "error": "missing session"}), 400
 
-    uname = current_username()
-    db = load_db()
-    u = ensure_user(db, uname)
+    # 멱등 키(선택): 헤더 Idempotency-Key 또는 본문 idempotencyKey — 같은 키의 재전송은 처음 결과를 그대로 돌려준다
+    key = request.headers.get("Idempotency-Key") or payload.get("idempotencyKey")
+    if key is not None and (not isinstance(key, str) or not key or len(key) > IDEMPOTENCY_KEY_MAX):
+        return jsonify({"ok": False, "error": "invalid idempotency key"}), 400
 
+    uname = current_username()
+    u = ensure_user(uname)
+    if key:
+        prev = idempotent_lookup(u, key)
+        if prev is not None:
+            resp = jsonify(prev)
+            resp.headers["Idempotent-Replayed"] = "true"
+            return resp
     session_obj = payload["session"]
-    replace_id = payload.get("replaceId")  # ← 덮어쓰기 대상 id (선택)
+    if key and isinstance(session_obj, dict):
+        session_obj["attemptId"] = key
+    changed, scores, stats = apply_session_save(uname, u, session_obj, payload.get("replaceId"))  # replaceId: 덮어쓰기 대상 id (선택)
+    result = {"ok": True}
+    if key:
+        idempotent_remember(u, key, result)
+    save_user(uname, u)
+    publish_user_change(uname, sessions=changed, verseScores=scores, verseStats=stats)
+    return jsonify(result)
+
+# ------------------------------
+# 멱등 처리: 사용자별 최근 시도 id 인덱스 (LRU)
+# ------------------------------
+# u["recentAttempts"]: 시도 id -> 처음 처리 결과. dict의 삽입 순서를 LRU 순서로 사용해
+# 조회/기록/축출 모두 O(1)이며, 사용자 데이터와 함께 저장되므로 재시작 후에도 유지된다.
+IDEMPOTENCY_KEEP = int(os.environ.get("QUIZ_IDEMPOTENCY_KEEP", "2000"))
+IDEMPOTENCY_KEY_MAX = 128
+
+def _recent_attempts(u):
+    ra = u.get("recentAttempts")
+    if not isinstance(ra, dict):
+        ra = u["recentAttempts"] = {}
+    return ra
+
+def idempotent_lookup(u, key):
+    ra = _recent_attempts(u)
+    result = ra.pop(key, None)
+    if result is not None:
+        ra[key] = result  # 최근 사용 위치로 이동
+    return result
+
+def idempotent_remember(u, key, result):
+    ra = _recent_attempts(u)
+    ra.pop(key, None)
+    ra[key] = result
+    while len(ra) > IDEMPOTENCY_KEEP:
+        del ra[next(iter(ra))]
+
+def apply_session_save(uname, u, session_obj, replace_id=None):
+    """세션 하나를 사용자 데이터에 반영 (/save, /sync_attempts 공용)
+
+    반환: (추가/교체된 세션 목록 — 보존 정책으로 집계로 바뀐 세션 포함, 바뀐 verseScores 항목, 바뀐 verseStats 항목)
+    """
+    session_obj = compact_session(session_obj)
+    scores, stats = {}, {}
 
     u.setdefault("sessions", [])
     u.setdefault("verseScores", {})
+    u.setdefault("verseStats", {})
 
-    # verseScores 업데이트: 정답 -1, 오답/스킵 +1 (최소 0 보장)
+    # verseScores 업데이트: 정답 -1, 오답/스킵 +1 (최소 0 보장) — 단락 문항(verseEnd)은 단락의 구절마다
     for d in session_obj.get("details", []):
-        key = f"{d.get('book')}|{d.get('chapter')}|{d.get('verse')}"
-        cur = int(u["verseScores"].get(key, 0))
-        if d.get("skipped") or not d.get("correct"):
-            cur += 1
-        else:
-            cur = max(0, cur - 1)
-        u["verseScores"][key] = cur
+        for key in _detail_keys(d):
+            cur = int(u["verseScores"].get(key, 0))
+            if d.get("skipped") or not d.get("correct"):
+                cur += 1
+            else:
+                cur = max(0, cur - 1)
+            u["verseScores"][key] = cur
+            scores[key] = cur
+            stats[key] = u["verseStats"][key] = _update_verse_stat(u["verseStats"].get(key), d)
 
     # 세션 저장(덮어쓰기 or append)
     if replace_id:
@@ -1992,40 +2904,341 @@ def save():
     else:
         u["sessions"].append(session_obj)
 
-    save_db(db)
-    return jsonify({"ok": True})
+    return [session_obj] + apply_retention(uname, u), scores, stats
+
+def _detail_keys(d):
+    first, last = d.get("verse"), d.get("verseEnd")
+    if isinstance(first, int) and isinstance(last, int) and first < last <= first + PASSAGE_VERSES_MAX:
+        return [f"{d.get('book')}|{d.get('chapter')}|{v}" for v in range(first, last + 1)]
+    return [f"{d.get('book')}|{d.get('chapter')}|{first}"]
+
+# 구절별 부분 점수: 서술형은 /grade 의 credit(없으면 정답 1/오답 0), 스킵 0 — 최근 시도에 무게를 둔 지수이동평균
+VERSE_CREDIT_ALPHA = 0.3
+
+def _update_verse_stat(prev, d):
+    credit = d.get("credit")
+    if d.get("skipped"):
+        credit = 0.0
+    elif not isinstance(credit, (int, float)) or isinstance(credit, bool):
+        credit = 1.0 if d.get("correct") else 0.0
+    credit = min(1.0, max(0.0, float(credit)))
+    if not (isinstance(prev, list) and len(prev) == 2):
+        return [1, round(credit, 3)]
+    return [int(prev[0]) + 1, round(prev[1] + VERSE_CREDIT_ALPHA * (credit - prev[1]), 3)]
+
+SYNC_BATCH_MAX = 500  # /sync_attempts 한 번에 받는 시도 수 상한
+
+@app.route("/sync_attempts", methods=["POST"])
+@db_locked
+def sync_attempts():
+    """오프라인 큐 일괄 동기화: attempts=[{id, session, replaceId?}] — 시도 id 기준 멱등
+
+    같은 id가 다시 와도(재전송) 한 번만 반영된다(/save 의 멱등 키와 같은 인덱스 사용). verseScores는 시도 시각(dateISO) 순서로 적용해
+    여러 배치/기기에서 온 기록도 같은 결과로 합쳐지게 한다.
+    """
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    payload = request.get_json(force=True) or {}
+    attempts = payload.get("attempts")
+    if not isinstance(attempts, list) or len(attempts) > SYNC_BATCH_MAX:
+        return jsonify({"ok": False, "error": "invalid attempts"}), 400
+    uname = current_username()
+    u = ensure_user(uname)
+    applied, duplicates, valid, rejected = [], [], [], []
+    changed, scores, stats = {}, {}, {}
+    for a in attempts:
+        if (isinstance(a, dict) and isinstance(a.get("id"), str) and 0 < len(a["id"]) <= IDEMPOTENCY_KEY_MAX
+                and isinstance(a.get("session"), dict)):
+            valid.append(a)
+        else:
+            rejected.append(a.get("id") if isinstance(a, dict) else None)
+    valid.sort(key=lambda a: a["session"].get("dateISO") or "")
+    for a in valid:
+        aid = a["id"]
+        if idempotent_lookup(u, aid) is not None:
+            duplicates.append(aid)
+            continue
+        session_obj = dict(a["session"])
+        session_obj["attemptId"] = aid
+        sessions, touched, touched_stats = apply_session_save(uname, u, session_obj, a.get("replaceId"))
+        changed.update((se.get("id"), se) for se in sessions)
+        scores.update(touched)
+        stats.update(touched_stats)
+        idempotent_remember(u, aid, {"ok": True})
+        applied.append(aid)
+    if applied:
+        save_user(uname, u)
+        publish_user_change(uname, sessions=list(changed.values()), verseScores=scores, verseStats=stats)
+    return jsonify({"ok": True, "applied": applied, "duplicates": duplicates, "rejected": rejected})
 
 @app.route("/settings", methods=["POST"])
+@db_locked
 def set_settings():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
     st = request.get_json(force=True)
-    db = load_db()
-    u = ensure_user(db, current_username())
+    uname = current_username()
+    u = ensure_user(uname)
     # ★ 사용자가 보낸 enabledQTypes를 그대로 저장(강제 추가 금지)
     u["settings"] = {
         "numQuestions": int(st.get("numQuestions", 30)),
         "enabledQTypes": list(st.get("enabledQTypes", []))
     }
-    save_db(db)
+    save_user(uname, u)
     return jsonify({"ok": True})
 
 @app.route("/reset", methods=["POST"])
+@db_locked
 def reset():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
-    db = load_db()
-    u = ensure_user(db, current_username())
+    uname = current_username()
+    u = ensure_user(uname)
     u["sessions"] = []
-    u["settings"] = DEFAULT_SETTINGS.copy()
+    u["settings"] = default_settings()
     u["verseScores"] = {}
-    save_db(db)
+    u["verseStats"] = {}
+    save_user(uname, u)
+    STORE.archive_remove_user(uname)
+    publish_user_change(uname, reset=True)
+    return jsonify({"ok": True})
+
+@app.route("/session_dump")
+@db_locked
+def session_dump():
+    """세션 상세(details/questionsDump) 조회 — 아카이브된 세션은 압축 파일에서 꺼내온다"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    sid = request.args.get("id")
+    if not sid:
+        return jsonify({"ok": False, "error": "missing id"}), 400
+    uname = current_username()
+    u = ensure_user(uname)
+    se = next((s for s in u["sessions"] if s.get("id") == sid), None)
+    if se is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    if se.get("archived"):
+        se = STORE.archive_fetch(uname, se["archived"], sid)
+        if se is None:
+            return jsonify({"ok": False, "error": "archive missing"}), 404
+    se = expand_session(se)
+    return jsonify({"ok": True, "details": se.get("details", []), "questionsDump": se.get("questionsDump")})
+
+# ------------------------------
+# 학습 세트 (사용자 정의 출제 범위)
+# ------------------------------
+# u["studySets"][id] = {"id", "name", "rules", "createdAt", "updatedAt"}
+# rules = {"include": [소스...](합집합, 비면 전체 코퍼스), "within": [소스...](각각과 교집합),
+#          "exclude": [소스...](차집합), "excludeMastered": 숙달 구절 제외}
+# 소스 = {"book", "chapters": [시작, 끝]?} | {"refs": [참조...]} | {"search": 검색어} | {"set": 다른 세트 id}
+# 숙달 = verseScores 에 있고(시도한 적 있음) 값이 0(오답 누적이 정답으로 모두 상쇄)
+# 서버 코퍼스 비트맵으로 풀어 계산하고, 클라이언트에는 참조 키로 돌려준다(업로드 코퍼스에서도 키로 거른다)
+STUDY_SETS_MAX = 50
+STUDY_SET_SOURCES_MAX = 20
+STUDY_SET_REFS_MAX = 5000
+_REF_SIMPLE = re.compile(r"^\s*(.+?)\s*(\d+)\s*[:,.]\s*(\d+)\s*$")
+_SOURCE_BITS_CACHE = OrderedDict()  # (코퍼스 버전, 소스 JSON) -> 비트맵 — 사용자 무관 소스만
+_SOURCE_BITS_KEEP = 256
+_SOURCE_BITS_LOCK = threading.Lock()
+
+def parse_ref_key(text):
+    """"요한|3|16", "요한 3:16", "누가 2:1", "1 John 4:8" → 현재 코퍼스의 참조 키 (형식이 아니면 None)"""
+    text = (text or "").strip()
+    parts = text.split("|")
+    if len(parts) == 3 and parts[1].strip().isdigit() and parts[2].strip().isdigit():
+        return f"{parts[0].strip()}|{int(parts[1])}|{int(parts[2])}"
+    ref = parse_reference(text, fuzzy=True)
+    if ref and ref[2] is not None and ref[0] in CORPUS_BOOKS:
+        return f"{CORPUS_BOOKS[ref[0]]}|{ref[1]}|{ref[2]}"
+    mt = _REF_SIMPLE.match(text)  # 별칭 표에 없는 책(업로드 코퍼스 등)은 이름 그대로
+    if mt:
+        return f"{mt.group(1)}|{int(mt.group(2))}|{int(mt.group(3))}"
+    return None
+
+def _clean_source(src):
+    if not isinstance(src, dict):
+        raise ValueError("소스 형식이 잘못되었습니다")
+    if isinstance(src.get("book"), str) and src["book"].strip():
+        out = {"book": corpus_book(src["book"], fuzzy=True)}
+        ch = src.get("chapters")
+        if ch:
+            try:
+                lo, hi = int(ch[0]), int(ch[1])
+            except (TypeError, ValueError, IndexError, KeyError):
+                raise ValueError("장 범위는 [시작, 끝]")
+            out["chapters"] = [min(lo, hi), max(lo, hi)]
+        return out
+    if isinstance(src.get("refs"), list):
+        keys = []
+        for r in src["refs"][:STUDY_SET_REFS_MAX]:
+            k = parse_ref_key(r) if isinstance(r, str) else None
+            if k is None:
+                raise ValueError(f"참조를 해석할 수 없습니다: {r!r}")
+            keys.append(k)
+        return {"refs": list(dict.fromkeys(keys))}
+    if isinstance(src.get("search"), str) and src["search"].strip():
+        return {"search": src["search"].strip()[:200]}
+    if isinstance(src.get("set"), str) and src["set"]:
+        return {"set": src["set"]}
+    raise ValueError("소스는 book / refs / search / set 중 하나")
+
+def clean_study_rules(rules):
+    """입력 rules 검증·정리 (잘못되면 ValueError)"""
+    if not isinstance(rules, dict):
+        raise ValueError("rules 가 없습니다")
+    out = {}
+    for part in ("include", "within", "exclude"):
+        srcs = rules.get(part) or []
+        if not isinstance(srcs, list) or len(srcs) > STUDY_SET_SOURCES_MAX:
+            raise ValueError(f"{part} 는 소스 {STUDY_SET_SOURCES_MAX}개 이하의 목록")
+        out[part] = [_clean_source(src) for src in srcs]
+    out["excludeMastered"] = bool(rules.get("excludeMastered"))
+    return out
+
+def _source_bits(u, src, depth):
+    if "set" in src:
+        other = (u.get("studySets") or {}).get(src["set"])
+        # 다른 세트 참조는 깊이 제한으로 순환을 끊는다
+        return resolve_study_rules(u, other["rules"], depth + 1) if other and depth < 4 else 0
+    bm = VERSE_BITMAPS
+    ck = (SERVER_CORPUS_VERSION, dumps_json(src))
+    with _SOURCE_BITS_LOCK:
+        bits = _SOURCE_BITS_CACHE.get(ck)
+        if bits is not None:
+            _SOURCE_BITS_CACHE.move_to_end(ck)
+            return bits
+    if "book" in src:
+        bits = bm.book(src["book"], src.get("chapters"))
+    elif "refs" in src:
+        bits = bm.refs(src["refs"])
+    else:
+        bits = bits_from_indices(SEARCH_INDEX.matching(src["search"]), bm.n)
+    with _SOURCE_BITS_LOCK:
+        _SOURCE_BITS_CACHE[ck] = bits
+        while len(_SOURCE_BITS_CACHE) > _SOURCE_BITS_KEEP:
+            _SOURCE_BITS_CACHE.popitem(last=False)
+    return bits
+
+def verse_score_bits(u):
+    """(시도한 구절, 숙달 구절) 비트맵 — verseScores 기준"""
+    vs = u.get("verseScores") or {}
+    bm = VERSE_BITMAPS
+    return bm.refs(vs), bm.refs(k for k, v in vs.items() if not v)
+
+def resolve_study_rules(u, rules, depth=0):
+    bits = 0
+    for src in rules.get("include") or ():
+        bits |= _source_bits(u, src, depth)
+    if not rules.get("include"):
+        bits = VERSE_BITMAPS.all
+    for src in rules.get("within") or ():
+        bits &= _source_bits(u, src, depth)
+    for src in rules.get("exclude") or ():
+        bits &= ~_source_bits(u, src, depth)
+    if rules.get("excludeMastered"):
+        bits &= ~verse_score_bits(u)[1]
+    return bits
+
+def sample_keys(bits, k):
+    """비트맵에서 서로 다른 참조 k개를 균등 비복원 추출"""
+    idxs = indices_from_bits(bits)
+    random.shuffle(idxs)
+    seen, out = set(), []
+    for i in idxs:
+        key = verse_key(VERSE_BITMAPS.verses[i])
+        if key not in seen:
+            seen.add(key)
+            out.append(key)
+            if len(out) == k:
+                break
+    return out
+
+def study_set_summary(u, st, attempted=None, mastered=None):
+    bits = resolve_study_rules(u, st["rules"])
+    if attempted is None:
+        attempted, mastered = verse_score_bits(u)
+    return {**st, "count": bits.bit_count(), "attempted": (bits & attempted).bit_count(),
+            "mastered": (bits & mastered).bit_count()}
+
+@app.route("/study_sets", methods=["GET", "POST"])
+@db_locked
+def study_sets():
+    """GET: 세트 목록(구절/시도/숙달 수 포함), POST {id?, name, rules}: 만들기/고치기"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    uname = current_username()
+    u = ensure_user(uname)
+    sets = u["studySets"]
+    if request.method == "GET":
+        attempted, mastered = verse_score_bits(u)
+        out = [study_set_summary(u, st, attempted, mastered)
+               for st in sorted(sets.values(), key=lambda st: st.get("createdAt", ""))]
+        return jsonify({"ok": True, "sets": out, "corpusVersion": SERVER_CORPUS_VERSION})
+    payload = request.get_json(force=True, silent=True) or {}
+    name = (payload.get("name") or "").strip()[:100]
+    if not name:
+        return jsonify({"ok": False, "error": "이름을 입력하세요"}), 400
+    try:
+        rules = clean_study_rules(payload.get("rules"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    sid = payload.get("id") or secrets.token_hex(6)
+    if sid not in sets and len(sets) >= STUDY_SETS_MAX:
+        return jsonify({"ok": False, "error": f"학습 세트는 {STUDY_SETS_MAX}개까지 만들 수 있습니다"}), 400
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    st = {"id": sid, "name": name, "rules": rules,
+          "createdAt": sets.get(sid, {}).get("createdAt", now), "updatedAt": now}
+    sets[sid] = st
+    save_user(uname, u)
+    return jsonify({"ok": True, "set": study_set_summary(u, st)})
+
+@app.route("/study_sets/preview", methods=["POST"])
+@db_locked
+def study_set_preview():
+    """저장 전 미리보기: {rules} → 구절 수와 앞쪽 참조 20개"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    u = ensure_user(current_username())
+    try:
+        rules = clean_study_rules((request.get_json(force=True, silent=True) or {}).get("rules"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    bits = resolve_study_rules(u, rules)
+    return jsonify({"ok": True, "count": bits.bit_count(), "keys": VERSE_BITMAPS.unique_keys(bits)[:20]})
+
+@app.route("/study_sets/<sid>/verses")
+@db_locked
+def study_set_verses(sid):
+    """세트의 참조 키 — ?sample=N 이면 서로 다른 참조 N개 무작위(시험 출제용), 없으면 전체(학습 모드용)"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    u = ensure_user(current_username())
+    st = u["studySets"].get(sid)
+    if st is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    bits = resolve_study_rules(u, st["rules"])
+    sample = request.args.get("sample", type=int)
+    keys = sample_keys(bits, max(1, sample)) if sample else VERSE_BITMAPS.unique_keys(bits)
+    return jsonify({"ok": True, "count": bits.bit_count(), "keys": keys})
+
+@app.route("/study_sets/delete", methods=["POST"])
+@db_locked
+def study_set_delete():
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    sid = (request.get_json(force=True, silent=True) or {}).get("id")
+    uname = current_username()
+    u = ensure_user(uname)
+    if u["studySets"].pop(sid, None) is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    save_user(uname, u)
     return jsonify({"ok": True})
 
 # ------------------------------
 # 삭제/정리 API
 # ------------------------------
 @app.route("/delete_session", methods=["POST"])
+@db_locked
 def delete_session():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -2033,14 +3246,20 @@ def delete_session():
     sid = payload.get("id")
     if not sid:
         return jsonify({"ok": False, "error":"missing id"}), 400
-    db = load_db()
-    u = ensure_user(db, current_username())
+    uname = current_username()
+    u = ensure_user(uname)
     before = len(u["sessions"])
+    removed = [s for s in u["sessions"] if s.get("id") == sid]
     u["sessions"] = [s for s in u["sessions"] if s.get("id") != sid]
-    save_db(db)
+    # 보존 정책으로 상세가 아카이브로 옮겨진 세션이면 그 상세도 지운다(내보내기/재시험으로 되살아나지 않게)
+    for month in {s["archived"] for s in removed if s.get("archived")}:
+        STORE.archive_delete(uname, month, sid)
+    save_user(uname, u)
+    publish_user_change(uname, removedSessions=[sid])
     return jsonify({"ok": True, "deleted": before - len(u["sessions"])})
 
 @app.route("/delete_verse_score", methods=["POST"])
+@db_locked
 def delete_verse_score():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -2048,62 +3267,199 @@ def delete_verse_score():
     key = payload.get("key")
     if not key:
         return jsonify({"ok": False, "error":"missing key"}), 400
-    db = load_db()
-    u = ensure_user(db, current_username())
-    if key in u["verseScores"]:
-        # 0으로 리셋하거나 완전 삭제
-        u["verseScores"].pop(key, None)
-    save_db(db)
+    uname = current_username()
+    u = ensure_user(uname)
+    # 카운트와 함께 가중치용 통계도 지워야 출제 빈도가 실제로 초기화된다
+    u["verseScores"].pop(key, None)
+    u["verseStats"].pop(key, None)
+    save_user(uname, u)
+    publish_user_change(uname, removedVerseScores=[key], removedVerseStats=[key])
     return jsonify({"ok": True})
 
 @app.route("/clear_top20", methods=["POST"])
+@db_locked
 def clear_top20():
     if not require_login():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
-    db = load_db()
-    u = ensure_user(db, current_username())
+    uname = current_username()
+    u = ensure_user(uname)
     u["verseScores"] = {}  # 전체 초기화
-    save_db(db)
+    u["verseStats"] = {}
+    save_user(uname, u)
+    publish_user_change(uname, replaceVerseScores={}, replaceVerseStats={})
     return jsonify({"ok": True})
 
 # ------------------------------
 # 리더보드 API
 # ------------------------------
 @app.route("/leaderboard")
+@db_locked
 def leaderboard():
-    db = load_db()
-    leaders = []
-    for uname, u in db.get("users", {}).items():
-      # u가 dict인지, sessions가 list인지 확인
-      if not isinstance(u, dict):
-          continue
-      sessions = u.get("sessions", [])
-      # 시험 세션만, 그리고 10문항 이상
-      exams = [se for se in sessions if (se.get("type")=='exam' or (se.get("total",0)>1)) and (se.get("total",0) >= 10)]
-      if not exams:
-          continue
-      # 날짜 최신순
-      exams.sort(key=lambda x: x.get("dateISO",""), reverse=True)
-      recent5 = exams[:5]
-      if not recent5:
-          continue
-      # 평균 퍼센트
-      total_pct = 0.0
-      cnt = 0
-      for se in recent5:
-          t = max(1, se.get("total",1))
-          c = se.get("correct",0)
-          total_pct += (c/t)*100.0
-          cnt += 1
-      if cnt == 0:
-          continue
-      avg_pct = total_pct / cnt
-      leaders.append({"username": uname, "avgPercent": avg_pct, "sampleCount": cnt})
+    return jsonify({"ok": True, "leaders": leaderboard_top()})
+
+def _leader_entry(uname, u):
+    """사용자 한 명의 랭킹 항목: 10문항 이상 시험 최근 5개 평균 (해당 없으면 None)"""
+    # u가 dict인지, sessions가 list인지 확인
+    if not isinstance(u, dict):
+        return None
+    sessions = u.get("sessions", [])
+    # 시험 세션만, 그리고 10문항 이상
+    exams = [se for se in sessions if (se.get("type")=='exam' or (se.get("total",0)>1)) and (se.get("total",0) >= 10)]
+    if not exams:
+        return None
+    # 날짜 최신순
+    exams.sort(key=lambda x: x.get("dateISO",""), reverse=True)
+    recent5 = exams[:5]
+    # 평균 퍼센트
+    total_pct = 0.0
+    cnt = 0
+    for se in recent5:
+        t = max(1, se.get("total",1))
+        c = se.get("correct",0)
+        total_pct += (c/t)*100.0
+        cnt += 1
+    if cnt == 0:
+        return None
+    return {"username": uname, "avgPercent": total_pct / cnt, "sampleCount": cnt}
+
+def leaderboard_top():
+    # 사용자별 항목은 저장 시(save_user) 갱신되어 있으므로 여기서는 상위 10만 고른다
     # 정렬: 평균 내림차순, 그 다음 샘플수, 그 다음 이름
-    leaders.sort(key=lambda r: (-r["avgPercent"], -r["sampleCount"], r["username"]))
-    # 상위 10만
-    leaders = leaders[:10]
-    return jsonify({"ok": True, "leaders": leaders})
+    return heapq.nsmallest(10, STORE.leader_entries(),
+                           key=lambda r: (-r["avgPercent"], -r["sampleCount"], r["username"]))
+
+# ------------------------------
+# 실시간 푸시 (Server-Sent Events): GET /events
+# ------------------------------
+# event: user        — 본인 기록 변경분 {sessions(추가/교체), removedSessions, verseScores·verseStats(바뀐 항목),
+#                      removedVerseScores, replaceVerseScores, reset}
+# event: leaderboard — 상위 10이 바뀌었을 때만 {leaders}
+# 구독은 프로세스 단위(워커가 여러 개면 같은 워커의 변경만 받음 — write-behind 기본은 워커 1개), 로그인 사용자만.
+# WSGI(스레드) 서버에서는 스트림 하나가 끝날 때까지 스레드 하나를 쥐므로 프로세스당 동시 스트림을
+# SSE_WSGI_MAX_STREAMS 개로 제한하고, 넘으면 503 — 클라이언트는 실시간 갱신 없이 /data 를 다시 받는 방식으로 동작한다.
+# serve 는 QUIZ_SSE_MAX_STREAMS 가 없으면 스레드 수의 1/4 로 맞춘다. asgi_app 은 이벤트 루프가 들고 있어 제한 없음
+SSE_HEARTBEAT = 15.0  # 초, 프록시가 유휴 연결을 끊지 않도록 주석 줄 전송
+SSE_QUEUE_MAX = 100   # 구독자별 대기 이벤트 상한 — 넘치면 연결을 끊어 재접속(전체 재동기화)하게 한다
+SSE_WSGI_MAX_STREAMS = int(os.environ.get("QUIZ_SSE_MAX_STREAMS", "8"))
+SSE_RETRY_AFTER = 60  # 초, 상한에 걸린 클라이언트가 다시 연결을 시도하기까지
+_SSE_WSGI_OPEN = 0
+_SSE_WSGI_LOCK = threading.Lock()
+
+class EventHub:
+    """구독자 목록과 이벤트 발행. deliver(payload bytes | None)는 발행 스레드에서 호출되므로 블로킹하면 안 된다"""
+    def __init__(self):
+        self._subs = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def subscribe(self, username, deliver):
+        token = object()
+        with self._lock:
+            self._subs[token] = (username, deliver)
+        return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subs.pop(token, None)
+
+    def __len__(self):
+        return len(self._subs)
+
+    def publish(self, event, data, username=None):
+        """username=None 이면 전체, 아니면 그 사용자의 연결에만"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            targets = [d for u, d in self._subs.values() if username is None or u == username]
+        if not targets:
+            return
+        payload = b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, event.encode("ascii"), dumps_json(data))
+        for deliver in targets:
+            deliver(payload)
+
+EVENTS = EventHub()
+_LAST_LEADERS = None
+
+def publish_user_change(uname, **delta):
+    """변경 커밋(save_user) 직후 호출: 본인 연결에 변경분, 상위 10이 바뀌었으면 전체에 리더보드"""
+    global _LAST_LEADERS
+    leaders = leaderboard_top()
+    if not len(EVENTS):
+        _LAST_LEADERS = leaders
+        return
+    if delta.get("sessions"):
+        delta["sessions"] = [expand_session(se) for se in delta["sessions"]]
+    EVENTS.publish("user", delta, username=uname)
+    if leaders != _LAST_LEADERS:
+        _LAST_LEADERS = leaders
+        EVENTS.publish("leaderboard", {"leaders": leaders})
+
+class _SubscriberQueue:
+    """WSGI 연결용 구독자: 스레드 큐 (넘치면 비우고 종료 표시 None)"""
+    def __init__(self):
+        self.q = queue.Queue(SSE_QUEUE_MAX)
+
+    def __call__(self, payload):
+        try:
+            self.q.put_nowait(payload)
+        except queue.Full:
+            while True:
+                try:
+                    self.q.get_nowait()
+                except queue.Empty:
+                    break
+            self.q.put_nowait(None)
+
+def _sse_stream(sub):
+    yield b"retry: 3000\n\n"
+    while True:
+        try:
+            payload = sub.q.get(timeout=SSE_HEARTBEAT)
+        except queue.Empty:
+            yield b": ping\n\n"
+            continue
+        if payload is None:
+            return
+        yield payload
+
+def _sse_wsgi_take():
+    """WSGI 스트림 자리 하나 (상한이면 False)"""
+    global _SSE_WSGI_OPEN
+    with _SSE_WSGI_LOCK:
+        if _SSE_WSGI_OPEN >= SSE_WSGI_MAX_STREAMS:
+            return False
+        _SSE_WSGI_OPEN += 1
+        return True
+
+def _sse_wsgi_release():
+    global _SSE_WSGI_OPEN
+    with _SSE_WSGI_LOCK:
+        _SSE_WSGI_OPEN -= 1
+
+def _sse_headers():
+    return [("Content-Type", "text/event-stream; charset=utf-8"), ("Cache-Control", "no-cache"),
+            ("X-Accel-Buffering", "no")]  # nginx 버퍼링 끄기
+
+@app.route("/events")
+def events():
+    """SSE 스트림 (WSGI: 연결마다 스레드 하나라 SSE_WSGI_MAX_STREAMS 까지 — asgi_app 은 이벤트 루프에서 직접 처리)"""
+    uname = current_username()
+    if not uname:
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    if not _sse_wsgi_take():
+        resp = jsonify({"ok": False, "error": "too many streams"})
+        resp.headers["Retry-After"] = str(SSE_RETRY_AFTER)
+        return resp, 503
+    sub = _SubscriberQueue()
+    token = EVENTS.subscribe(uname, sub)
+    resp = Response(_sse_stream(sub), headers=_sse_headers())
+
+    def _closed():
+        EVENTS.unsubscribe(token)
+        _sse_wsgi_release()
+    # 제너레이터 finally 는 첫 조각 전에 끊긴 연결에서는 돌지 않는다 — 서버가 반드시 부르는 close() 에서 정리
+    resp.call_on_close(_closed)
+    return resp
 
 # ------------------------------
 # 서버 verses.csv API
@@ -2113,17 +3469,949 @@ def get_verses():
     reload_flag = request.args.get("reload")
     if reload_flag:
         load_server_verses_file()
-    return jsonify({
-        "ok": True,
-        "verses": SERVER_VERSES,
-        "meta": {
-            "count": len(SERVER_VERSES),
-            "source": SERVER_VERSES_SOURCE
-        }
-    })
+    # 다른 노드가 reload 로 코퍼스를 바꿨으면 여기서 따라간다 (공유 저장소: 버전 포인터 GET 한 번)
+    sync_corpus(publish=bool(reload_flag))
+    # 본문은 코퍼스가 바뀔 때만 다시 직렬화/압축, 변경이 없으면 304
+    resp = cached_response(server_verses_entry(), REVALIDATE_CACHE)
+    resp.headers["X-Corpus-Version"] = SERVER_CORPUS_VERSION
+    return resp
+
+@app.route("/book_aliases")
+def get_book_aliases():
+    """채점용 책 이름 별칭 표 {접힌 별칭: 책 id} — 내용이 고정이라 ETag 재검증(304)"""
+    return cached_response(book_aliases_entry(), REVALIDATE_CACHE)
+
+@app.route("/search")
+def search_verses():
+    """GET /search?q=검색어[&book=책&limit=20] → 점수순 구절 + 원문 기준 일치 구간(highlights)
+    book 은 별칭("누가", "Luke")도 받고, q 가 참조 꼴이면 그 장/절을 돌려준다(reference 필드)"""
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "missing q"}), 400
+    try:
+        limit = max(1, min(SEARCH_LIMIT_MAX, int(request.args.get("limit", "20"))))
+    except ValueError:
+        limit = 20
+    sync_corpus()
+    idx = SEARCH_INDEX  # 검색 도중 재로딩되어도 같은 색인으로 끝까지
+    book = request.args.get("book")
+    book = corpus_book(book, fuzzy=True) if book else None
+    t0 = time.perf_counter()
+    # 질의 전체가 참조("요한 3:16", "시 23", "고전 13:4-7")로 읽히면 본문 검색 대신 그 구절들
+    ref = parse_reference(q, fuzzy=True)
+    if ref and ref[1] is not None and ref[0] in CORPUS_BOOKS:
+        bid, ch, vs, ve = ref
+        idxs = sorted(VERSE_BITMAPS.by_chapter.get((CORPUS_BOOKS[bid], ch), ()), key=lambda i: idx.verses[i]["verse"])
+        if vs is not None:
+            idxs = [i for i in idxs if vs <= idx.verses[i]["verse"] <= (ve or vs)]
+        results = [dict(idx.verses[i], key=verse_key(idx.verses[i]), score=0.0, highlights=[])
+                   for i in idxs[:limit]]
+        return jsonify({"ok": True, "q": q, "total": len(idxs), "results": results,
+                        "reference": {"book": CORPUS_BOOKS[bid], "chapter": ch, "verse": vs, "verseEnd": ve},
+                        "tookMs": round((time.perf_counter() - t0) * 1000.0, 2)})
+    total, hits = idx.search(q, limit, book)
+    results = [dict(idx.verses[i], key=verse_key(idx.verses[i]), score=round(score, 4),
+                    highlights=idx.highlights(i, q)) for score, i in hits]
+    return jsonify({"ok": True, "q": q, "total": total, "results": results,
+                    "tookMs": round((time.perf_counter() - t0) * 1000.0, 2)})
+
+@app.route("/grade", methods=["POST"])
+def grade():
+    """서술형 답안 채점: {qtype, answer, key 또는 expected[, corpus]} → {similarity, credit, correct, diff, words}
+    key(구절 키 또는 단락 키 "책|장|시작-끝")가 코퍼스(corpus 가 있으면 그 업로드 코퍼스, 없으면 서버 코퍼스)에 있으면
+    그 본문, 아니면(서버가 모르는 업로드 코퍼스) expected 를 정답으로 쓴다"""
+    payload = request.get_json(force=True, silent=True) or {}
+    qtype = payload.get("qtype")
+    if qtype not in GRADE_PASS:
+        return jsonify({"ok": False, "error": "unsupported qtype"}), 400
+    key = payload.get("key") or ""
+    if payload.get("corpus"):
+        uc = user_corpus(payload["corpus"])
+        index, bm = (uc.index, uc.bitmaps) if uc else ({}, _NO_BITMAPS)
+    else:
+        index, bm = SERVER_VERSE_INDEX, None
+    v = index.get(key)
+    expected = v["text"] if v else (passage_key_text(key, bm) or payload.get("expected"))
+    answer = payload.get("answer") or ""
+    if not isinstance(expected, str) or not isinstance(answer, str):
+        return jsonify({"ok": False, "error": "missing expected/answer"}), 400
+    if len(expected) > GRADE_TEXT_MAX or len(answer) > GRADE_TEXT_MAX:
+        return jsonify({"ok": False, "error": "too long"}), 413
+    return jsonify({"ok": True, **grade_text(expected, answer, qtype)})
+
+@app.route("/passage")
+def get_passage():
+    """GET /passage?ref=시편 23,1-6 | 시편 23(장 전체, 최대 PASSAGE_VERSES_MAX 절) | 시편 23,1(그 절 하나)
+    [&corpus=업로드 코퍼스 id] → {passage: {key, book, chapter, start, end, verses}}"""
+    if request.args.get("corpus"):
+        uc = user_corpus(request.args["corpus"])
+        if uc is None:
+            return jsonify({"ok": False, "error": "corpus not found"}), 404
+        books, bm = uc.books, uc.bitmaps
+    else:
+        sync_corpus()
+        books, bm = CORPUS_BOOKS, None
+    ref = parse_reference(request.args.get("ref") or "", fuzzy=True)
+    if not ref or ref[1] is None or ref[0] not in books:
+        return jsonify({"ok": False, "error": "참조를 해석할 수 없습니다 (예: 시편 23,1-6)"}), 400
+    bid, ch, vs, ve = ref
+    book = books[bid]
+    verses = corpus_passage(book, ch, vs, ve or vs, bm)
+    if not verses:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    start, end = verses[0]["verse"], verses[-1]["verse"]
+    return jsonify({"ok": True, "passage": {"key": f"{book}|{ch}|{start}-{end}", "book": book, "chapter": ch,
+                                            "start": start, "end": end, "verses": verses}})
+
+# ------------------------------
+# 업로드 코퍼스 API
+# ------------------------------
+@app.route("/corpus", methods=["POST"])
+def upload_corpus():
+    """POST /corpus?name=파일명 (본문: CSV) → 서버에 저장하고 내 코퍼스로 지정 {corpus: 포인터}
+    파싱·해시·저장은 잠금 밖에서 하고, 사용자 잠금은 포인터를 바꾸는 동안만 쥔다"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    if (request.content_length or 0) > CORPUS_MAX_BYTES:
+        return jsonify({"ok": False, "error": "too large"}), 413
+    raw = request.get_data(cache=False)
+    if len(raw) > CORPUS_MAX_BYTES:
+        return jsonify({"ok": False, "error": "too large"}), 413
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return jsonify({"ok": False, "error": "UTF-8 CSV만 올릴 수 있습니다"}), 400
+    verses = parse_corpus_csv(text)
+    if not verses:
+        return jsonify({"ok": False, "error": "Book, Chapter, Verse, Text 컬럼의 구절이 없습니다"}), 400
+    uc = store_user_corpus(verses)
+    pointer = {"id": uc.id, "name": (request.args.get("name") or "").strip()[:200], "count": len(verses),
+               "uploadedAt": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    uname = current_username()
+    with STORE.process_lock(), STORE.user_lock(uname):
+        u = ensure_user(uname)
+        u["corpus"] = pointer
+        save_user(uname, u)
+        publish_user_change(uname, corpus=pointer)
+    return jsonify({"ok": True, "corpus": pointer})
+
+@app.route("/corpus/<cid>")
+def corpus_verses(cid):
+    """업로드 코퍼스 본문 — /verses 와 같은 형식·같은 캐시 경로(사전 압축 + ETag), URL이 내용 해시라 immutable"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    uc = user_corpus(cid)
+    if uc is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    resp = cached_response(uc.entry(), USER_CORPUS_CACHE)
+    resp.headers["X-Corpus-Version"] = uc.id
+    return resp
+
+@app.route("/corpus/clear", methods=["POST"])
+@db_locked
+def clear_corpus():
+    """서버 기본 코퍼스로 돌아가기 (저장된 본문은 다른 사용자가 쓸 수 있어 지우지 않는다)"""
+    if not require_login():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    uname = current_username()
+    u = ensure_user(uname)
+    if u.get("corpus") is not None:
+        u["corpus"] = None
+        save_user(uname, u)
+        publish_user_change(uname, corpus=None)
+    return jsonify({"ok": True})
+
+@app.route("/metrics")
+def metrics():
+    if not METRICS_ENABLED:
+        return Response("not found", status=404, mimetype="text/plain")
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return Response("unauthorized", status=401, mimetype="text/plain")
+    resp = Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+# ------------------------------
+# 일괄 내보내기/가져오기 (gzip JSON Lines)
+# ------------------------------
+# 첫 줄 머리: {"kind":"quiz-export","version":1,"exportedAt","corpusVersion"}
+# 이후 사용자마다 {"type":"user","username","user"} 한 줄, 이어서 그 사용자의 아카이브 월마다
+# {"type":"archive","username","month","records"} 한 줄. 업로드 코퍼스를 쓰는 사용자 앞에는 그 본문
+# {"type":"corpus","id","verses"} 한 줄(같은 id는 파일에 한 번). 세션/아카이브 상세는 복원(expand_session)된 형태로 내보내고
+# 가져올 때 가져오는 쪽 코퍼스로 다시 압축하므로 코퍼스가 다른 설치 사이에서도 옮길 수 있다.
+# 양쪽 모두 사용자 하나(아카이브는 한 달치)씩만 메모리에 두고, 잠금도 그동안만 쥔다 — 운영 중 백업/이전 가능
+EXPORT_KIND = "quiz-export"
+EXPORT_VERSION = 1
+
+def export_records(usernames=None):
+    """내보낼 레코드(dict)를 차례로 돌려주는 제너레이터 — usernames 가 None 이면 전체 사용자"""
+    yield {"kind": EXPORT_KIND, "version": EXPORT_VERSION, "exportedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "corpusVersion": SERVER_CORPUS_VERSION}
+    with STORE.process_lock():
+        names = sorted(STORE.usernames()) if usernames is None else list(usernames)
+    corpora = set()
+    for uname in names:
+        with STORE.process_lock():
+            u = STORE.get_user(uname)
+            if not isinstance(u, dict):
+                continue
+            u = dict(u, sessions=[expand_session(se) for se in u.get("sessions") or []])
+            line = {"type": "user", "username": uname, "user": u}
+            months = STORE.archive_months(uname)
+        cid = (u.get("corpus") or {}).get("id")
+        if cid and cid not in corpora:
+            corpora.add(cid)
+            uc = user_corpus(cid)
+            if uc is not None:
+                yield {"type": "corpus", "id": cid, "verses": uc.verses}
+        yield line
+        for month in months:
+            with STORE.process_lock():
+                records = [expand_session(r) for r in STORE.archive_records(uname, month)]
+            yield {"type": "archive", "username": uname, "month": month, "records": records}
+
+def export_stream(usernames=None):
+    """export_records 를 gzip 스트림 조각(bytes)으로 — 응답 본문이나 파일에 그대로 이어 쓴다"""
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip 헤더
+    for rec in export_records(usernames):
+        chunk = comp.compress(dumps_json(rec) + b"\n")
+        if chunk:
+            yield chunk
+    yield comp.flush()
+
+def _merge_user(uname, data, scores_mode):
+    """가져온 사용자 하나를 병합해 저장. 반환: (새 사용자 여부, 추가된 세션 id 집합, 건너뛴 세션 수)
+    세션은 id 기준 중복 제거(기존 우선), verseScores 는 키별 합(sum) 또는 최댓값(max),
+    비밀번호 해시/설정은 기존 사용자에게 없을 때만 가져온다"""
+    with STORE.process_lock(), STORE.user_lock(uname):
+        created = not isinstance(STORE.get_user(uname), dict)
+        u = ensure_user(uname)
+        have = {se.get("id") for se in u["sessions"] if isinstance(se, dict)}
+        added, skipped = set(), 0
+        for se in data.get("sessions") or []:
+            if not isinstance(se, dict):
+                continue
+            sid = se.get("id")
+            if sid is not None and sid in have:
+                skipped += 1
+                continue
+            have.add(sid)
+            added.add(sid)
+            u["sessions"].append(compact_session(dict(se)))
+        for key, val in (data.get("verseScores") or {}).items():
+            try:
+                val = max(0, int(val))
+            except (TypeError, ValueError):
+                continue
+            cur = u["verseScores"].get(key)
+            if cur is None:
+                u["verseScores"][key] = val
+            else:
+                u["verseScores"][key] = int(cur) + val if scores_mode == "sum" else max(int(cur), val)
+        if not u.get("pw_hash") and data.get("pw_hash"):
+            u["pw_hash"] = data["pw_hash"]
+        if created and isinstance(data.get("settings"), dict):
+            u["settings"] = data["settings"]
+        for key, st in (data.get("verseStats") or {}).items():
+            cur = u["verseStats"].get(key)
+            if isinstance(st, list) and len(st) == 2 and (not cur or st[0] > cur[0]):
+                u["verseStats"][key] = st  # 시도가 더 많이 쌓인 쪽
+        for sid, st in (data.get("studySets") or {}).items():
+            if isinstance(st, dict):
+                u["studySets"].setdefault(sid, st)
+        if u.get("corpus") is None and isinstance(data.get("corpus"), dict):
+            u["corpus"] = data["corpus"]
+        ra = data.get("recentAttempts")
+        if isinstance(ra, dict):
+            mine = _recent_attempts(u)
+            for key, result in ra.items():
+                if key not in mine:
+                    idempotent_remember(u, key, result)
+        apply_retention(uname, u)
+        save_user(uname, u)
+        publish_user_change(uname, reset=True)
+    forget_pw_hash(uname)
+    return created, added, skipped
+
+def import_stream(fileobj, scores_mode="max"):
+    """export_stream 형식의 gzip 스트림을 읽어 사용자 단위로 병합 — 요약 dict 반환 (형식 오류는 ValueError)"""
+    if scores_mode not in ("sum", "max"):
+        raise ValueError("scores 는 sum 또는 max")
+    summary = {"users": 0, "created": 0, "merged": 0, "sessionsAdded": 0, "sessionsSkipped": 0,
+               "archivedRecords": 0, "corpora": 0, "corpusVersion": None}
+    uname, added = None, set()
+    try:
+        with gzip.GzipFile(fileobj=fileobj, mode="rb") as gz:
+            header = loads_json(gz.readline() or b"{}")
+            if header.get("kind") != EXPORT_KIND or header.get("version", 0) > EXPORT_VERSION:
+                raise ValueError("내보내기 파일 형식이 아닙니다")
+            summary["corpusVersion"] = header.get("corpusVersion")
+            for line in gz:
+                if not line.strip():
+                    continue
+                rec = loads_json(line)
+                kind = rec.get("type")
+                if kind == "corpus":
+                    verses = rec.get("verses")
+                    if isinstance(verses, list) and verses and corpus_id(verses) == rec.get("id"):
+                        store_user_corpus(verses)
+                        summary["corpora"] += 1
+                elif kind == "user":
+                    uname = rec.get("username")
+                    if not isinstance(uname, str) or not uname.strip() or not isinstance(rec.get("user"), dict):
+                        raise ValueError(f"잘못된 사용자 레코드: {rec.get('username')!r}")
+                    created, added, skipped = _merge_user(uname, rec["user"], scores_mode)
+                    summary["users"] += 1
+                    summary["created" if created else "merged"] += 1
+                    summary["sessionsAdded"] += len(added)
+                    summary["sessionsSkipped"] += skipped
+                elif kind == "archive" and rec.get("username") == uname:
+                    # 이번에 추가된 세션의 상세만 — 기존 세션의 아카이브는 그대로 둔다
+                    records = [compact_session(r) for r in rec.get("records") or []
+                               if isinstance(r, dict) and r.get("id") in added]
+                    if records:
+                        with STORE.process_lock(), STORE.user_lock(uname):
+                            STORE.archive_append(uname, str(rec.get("month")), records)
+                        summary["archivedRecords"] += len(records)
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"압축 해제 실패: {e}")
+    return summary
+
+# ------------------------------
+# 온라인 스냅샷 / 시점 복원
+# ------------------------------
+# quiz_stats.json 은 통째로 덮어쓰므로 잘못된 기록이나 /reset 은 되돌릴 수 없다 — 그래서 주기적으로 스냅샷을 뜬다.
+# - 증분(inc): 마지막 스냅샷 이후 save_user 된 사용자만, 사용자 레코드 전체를 한 줄씩
+# - 전체(full): QUIZ_SNAPSHOT_FULL_EVERY 번째마다(또는 전체가 아직 없으면) 모든 사용자
+# 사용자 하나를 읽어 직렬화하는 동안만 잠금을 쥐므로 기록을 막지 않는다(일관성 단위 = 사용자 레코드).
+# 모든 스냅샷 줄이 "그 시점의 사용자 레코드 전체"이므로, 시점 T 복원 = T 이전에서 그 사용자가 담긴 가장 최근 스냅샷.
+# 보존: 최근 QUIZ_SNAPSHOT_KEEP_FULL 개의 전체 스냅샷과, 그중 가장 오래된 것 이후의 증분을 모두 유지
+# 파일: QUIZ_SNAPSHOT_DIR/<시각>-inc|full.jsonl.gz, 첫 줄 머리 {"kind":"quiz-snapshot","full","createdAt","users"}
+# 여러 노드(공유 저장소)면 한 노드만 뜨고(KV 잠금) 디렉터리는 공유 볼륨이어야 모든 노드에서 복원할 수 있다.
+# 아카이브(월별 상세)는 스냅샷에 넣지 않는다 — 복원된 세션의 아카이브가 /reset 으로 지워졌다면 집계만 돌아온다
+SNAPSHOT_DIR = os.environ.get("QUIZ_SNAPSHOT_DIR", "quiz_snapshots")
+SNAPSHOT_INTERVAL = float(os.environ.get("QUIZ_SNAPSHOT_INTERVAL", "300"))  # 초, 0 이면 주기 스냅샷 끔
+SNAPSHOT_FULL_EVERY = int(os.environ.get("QUIZ_SNAPSHOT_FULL_EVERY", "12"))
+SNAPSHOT_KEEP_FULL = int(os.environ.get("QUIZ_SNAPSHOT_KEEP_FULL", "48"))
+_SNAPSHOT_NAME = re.compile(r"^(\d{8}T\d{9})-(inc|full)\.jsonl\.gz$")
+_SNAPSHOT_LOCK = threading.Lock()
+_SNAPSHOTTER = None
+
+def list_snapshots():
+    """[(id, full 여부, 경로)] 오래된 순"""
+    try:
+        names = os.listdir(SNAPSHOT_DIR)
+    except FileNotFoundError:
+        return []
+    out = []
+    for n in names:
+        mt = _SNAPSHOT_NAME.match(n)
+        if mt:
+            out.append((mt.group(1), mt.group(2) == "full", os.path.join(SNAPSHOT_DIR, n)))
+    out.sort()
+    return out
+
+def _snapshot_header(path):
+    with gzip.open(path, "rb") as f:
+        return loads_json(f.readline() or b"{}")
+
+def take_snapshot(full=None):
+    """스냅샷 하나를 뜬다. full=None 이면 주기에 따라 결정. 반환: 정보 dict (다른 노드가 뜨는 중이거나 바뀐 것이 없으면 None)"""
+    with _SNAPSHOT_LOCK, STORE.snapshot_lock() as got:
+        if not got:
+            return None
+        snaps = list_snapshots()
+        if full is None:
+            since_full = 0
+            for _, is_full, _ in reversed(snaps):
+                if is_full:
+                    break
+                since_full += 1
+            full = not any(f for _, f, _ in snaps) or since_full >= SNAPSHOT_FULL_EVERY
+        dirty = STORE.take_dirty()
+        if full:
+            with STORE.process_lock():
+                names = sorted(STORE.usernames())
+        else:
+            names = sorted(dirty)
+            if not names:
+                return None
+        t0 = time.perf_counter()
+        now = time.time()
+        sid = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        path = os.path.join(SNAPSHOT_DIR, f"{sid}-{'full' if full else 'inc'}.jsonl.gz")
+        tmp = path + ".tmp"
+        written = []
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(dumps_json({"kind": "quiz-snapshot", "full": full,
+                                    "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+                                    "users": names}) + b"\n")
+                for uname in names:
+                    with STORE.process_lock():
+                        u = STORE.get_user(uname)
+                        line = dumps_json({"username": uname, "user": u}) if isinstance(u, dict) else None
+                    if line is not None:
+                        f.write(line + b"\n")
+                        written.append(uname)
+            os.replace(tmp, path)
+        except Exception:
+            for uname in dirty:
+                STORE.mark_dirty(uname)  # 다음 주기에 다시
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        observe("quiz_snapshot_seconds", time.perf_counter() - t0, kind="full" if full else "inc")
+        _prune_snapshots()
+        return {"id": sid, "full": full, "users": len(written), "bytes": os.path.getsize(path)}
+
+def _prune_snapshots():
+    snaps = list_snapshots()
+    fulls = [i for i, (_, is_full, _) in enumerate(snaps) if is_full]
+    if len(fulls) <= SNAPSHOT_KEEP_FULL:
+        return
+    oldest_kept = fulls[-SNAPSHOT_KEEP_FULL]
+    for _, _, path in snaps[:oldest_kept]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _snapshot_key(at):
+    """복원 시점 → 스냅샷 id 비교 키. 스냅샷 id 또는 ISO 시각(2025-01-31T09:00[:00]) 허용, 그 초의 끝까지 포함"""
+    digits = re.sub(r"[^0-9T]", "", at or "")
+    if not re.match(r"^\d{8}(T\d{0,9})?$", digits):
+        raise ValueError("at 은 스냅샷 id 또는 YYYY-MM-DDTHH:MM:SS")
+    if "T" not in digits:
+        digits += "T"
+    return digits.ljust(18, "9")
+
+def find_user_snapshot(username, at=None):
+    """시점 at(없으면 최신) 이전에서 username 이 담긴 가장 최근 스냅샷 → (id, 사용자 레코드) 또는 None"""
+    key = _snapshot_key(at) if at else None
+    for sid, _, path in reversed(list_snapshots()):
+        if key is not None and sid > key:
+            continue
+        if username not in (_snapshot_header(path).get("users") or ()):
+            continue
+        needle = dumps_json(username)
+        with gzip.open(path, "rb") as f:
+            next(f, None)
+            for line in f:
+                if needle not in line:
+                    continue
+                rec = loads_json(line)
+                if rec.get("username") == username:
+                    return sid, rec["user"]
+    return None
+
+def user_snapshot_versions(username):
+    """username 이 담긴 스냅샷 id 목록 (복원 가능한 시점들, 최신 순)"""
+    return [sid for sid, _, path in reversed(list_snapshots())
+            if username in (_snapshot_header(path).get("users") or ())]
+
+def restore_user(username, at=None):
+    """사용자 한 명을 시점 at 의 스냅샷 상태로 되돌린다. 되돌리기 직전 상태도 증분 스냅샷으로 남긴다(복원 취소 가능)"""
+    found = find_user_snapshot(username, at)
+    if found is None:
+        return None
+    sid, rec = found
+    migrate_user(rec)
+    take_snapshot(full=False)
+    with STORE.process_lock(), STORE.user_lock(username):
+        save_user(username, rec)
+        publish_user_change(username, reset=True)
+    forget_pw_hash(username)
+    return sid
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        try:
+            take_snapshot()
+        except Exception as e:
+            app.logger.error("스냅샷 실패: %s", e)
+
+def _ensure_snapshotter():
+    # 첫 기록 시 지연 시작 (fork 이후 프로세스마다 — writer 스레드와 같은 이유)
+    global _SNAPSHOTTER
+    if SNAPSHOT_INTERVAL <= 0:
+        return
+    if _SNAPSHOTTER is None or not _SNAPSHOTTER.is_alive():
+        with _WRITER_START_LOCK:
+            if _SNAPSHOTTER is None or not _SNAPSHOTTER.is_alive():
+                _SNAPSHOTTER = threading.Thread(target=_snapshot_loop, name="quiz-snapshot", daemon=True)
+                _SNAPSHOTTER.start()
+
+# ------------------------------
+# 관리자 API
+# ------------------------------
+@app.route("/admin/profiles")
+@admin_required
+def admin_profiles():
+    return jsonify({"ok": True, "profiles": list_profiles()})
+
+@app.route("/admin/profiles/<pid>")
+@admin_required
+def admin_profile_download(pid):
+    fmt = request.args.get("format", "prof")
+    if not _PROFILE_ID.match(pid) or fmt not in ("prof", "txt"):
+        return jsonify({"ok": False, "error": "not found"}), 404
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{pid}.{fmt}"), "rb") as f:
+            body = f.read()
+    except OSError:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    if fmt == "txt":
+        return Response(body, content_type="text/plain; charset=utf-8")
+    resp = Response(body, mimetype="application/octet-stream")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{pid}.prof"'
+    return resp
+
+@app.route("/admin/snapshots", methods=["GET", "POST"])
+@admin_required
+def admin_snapshots():
+    """GET: 스냅샷 목록(?username= 이면 그 사용자를 복원할 수 있는 시점들), POST: 지금 하나 뜨기(?full=1)"""
+    if request.method == "POST":
+        info = take_snapshot(full=True if request.args.get("full") else None)
+        return jsonify({"ok": True, "snapshot": info})
+    username = request.args.get("username")
+    if username:
+        return jsonify({"ok": True, "username": username, "versions": user_snapshot_versions(username)})
+    snaps = [{"id": sid, "full": full, "bytes": os.path.getsize(path)} for sid, full, path in reversed(list_snapshots())]
+    return jsonify({"ok": True, "snapshots": snaps})
+
+@app.route("/admin/restore", methods=["POST"])
+@admin_required
+def admin_restore():
+    """{"username", "at": 스냅샷 id 또는 ISO 시각(없으면 최신)} → 그 시점의 사용자 데이터로 되돌림"""
+    payload = request.get_json(force=True, silent=True) or {}
+    username = payload.get("username")
+    if not isinstance(username, str) or not username:
+        return jsonify({"ok": False, "error": "missing username"}), 400
+    try:
+        sid = restore_user(username, payload.get("at"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if sid is None:
+        return jsonify({"ok": False, "error": "해당 시점 이전의 스냅샷이 없습니다"}), 404
+    return jsonify({"ok": True, "username": username, "restoredFrom": sid})
+
+@app.route("/admin/export")
+@admin_required
+def admin_export():
+    """GET /admin/export[?users=a,b] → gzip JSON Lines 스트림 (사용자 단위로 읽어 바로 전송)"""
+    users = request.args.get("users")
+    names = [n for n in users.split(",") if n] if users else None
+    resp = Response(export_stream(names), mimetype="application/gzip")
+    resp.headers["Content-Disposition"] = f'attachment; filename="quiz-export-{time.strftime("%Y%m%dT%H%M%S")}.jsonl.gz"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/admin/import", methods=["POST"])
+@admin_required
+def admin_import():
+    """POST /admin/import[?scores=max|sum], 본문 = /admin/export 결과 → 사용자 단위 병합 요약"""
+    try:
+        summary = import_stream(request.stream, request.args.get("scores", "max"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": True, **summary})
+# ------------------------------
+# ASGI 진입점: uvicorn bible_quiz_app:asgi_app (또는 hypercorn 등 ASGI 서버)
+# ------------------------------
+# 같은 Flask 라우트를 그대로 쓰되, 연결 유지·본문 수신·응답 전송은 이벤트 루프가 맡고
+# 라우트 실행(저장소 I/O 포함)만 스레드 풀에서 돌린다 — 대기 중인 연결은 스레드를 점유하지 않는다.
+# 비밀번호 해시는 라우트 안에서 다시 프로세스 풀로 넘어간다(run_password_hash).
+ASGI_THREADS = int(os.environ.get("QUIZ_ASGI_THREADS", str(max(8, (os.cpu_count() or 1) * 4))))
+ASGI_MAX_BODY = int(os.environ.get("QUIZ_ASGI_MAX_BODY", str(32 * 1024 * 1024)))
+_ASGI_EXECUTOR = None
+_ASGI_EXECUTOR_LOCK = threading.Lock()
+_ASGI_DONE = object()
+
+def _asgi_executor():
+    # lifespan 시작 시 미리 만들지만, lifespan 없이 도는 서버에선 첫 요청들이 동시에 들어올 수 있다
+    global _ASGI_EXECUTOR
+    with _ASGI_EXECUTOR_LOCK:
+        if _ASGI_EXECUTOR is None:
+            _ASGI_EXECUTOR = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="quiz-asgi")
+        return _ASGI_EXECUTOR
+
+def _asgi_executor_shutdown():
+    """lifespan 종료 시: 진행 중인 라우트가 끝나길 기다렸다가 풀을 닫는다(다시 기동하면 새로 만든다)"""
+    global _ASGI_EXECUTOR
+    with _ASGI_EXECUTOR_LOCK:
+        pool, _ASGI_EXECUTOR = _ASGI_EXECUTOR, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+def _asgi_environ(scope, body):
+    """ASGI http scope → WSGI environ (PEP 3333: 경로는 UTF-8 바이트를 latin-1 문자열로)"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue  # 실제로 받은 본문 길이를 쓴다
+        key = "HTTP_" + name
+        if key in environ:
+            value = environ[key] + ("; " if key == "HTTP_COOKIE" else ",") + value
+        environ[key] = value
+    return environ
+
+def _asgi_call_wsgi(environ):
+    # 스레드 풀에서 실행: (상태 코드, 헤더, 본문 bytes 또는 스트리밍 iterable)
+    started = {}
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return lambda data: None  # write() 호출 방식은 Flask가 쓰지 않음
+    result = app(environ, start_response)
+    # Flask는 응답을 항상 ClosingIterator로 감싸므로 타입으로는 구별되지 않는다 — 본문이 이미 메모리에 있는
+    # 응답에만 Werkzeug가 Content-Length를 붙이므로, 그런 응답은 이 스레드에서 다 읽어 bytes로 넘긴다
+    if any(k.lower() == "content-length" for k, _ in started["headers"]):
+        try:
+            return started["status"], started["headers"], b"".join(result)
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+    return started["status"], started["headers"], result
+
+async def _asgi_http(scope, receive, send):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            await send({"type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": b"request body too large"})
+            return
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    loop = asyncio.get_running_loop()
+    pool = _asgi_executor()
+    status, headers, result = await loop.run_in_executor(pool, _asgi_call_wsgi, _asgi_environ(scope, b"".join(chunks)))
+    try:
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        if isinstance(result, bytes):
+            # 일반 응답(_asgi_call_wsgi 가 이미 다 읽음): 스레드 왕복 없이 한 번에 전송
+            await send({"type": "http.response.body", "body": result})
+            return
+        # 스트리밍 응답: 다음 조각 생성은 블로킹일 수 있으므로 스레드 풀에서
+        it = iter(result)
+        while True:
+            chunk = await loop.run_in_executor(pool, next, it, _ASGI_DONE)
+            if chunk is _ASGI_DONE:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(result, "close", None)
+        if close is not None:
+            await loop.run_in_executor(pool, close)
+
+async def _asgi_events(scope, receive, send):
+    """/events 를 이벤트 루프에서 직접 처리 — 연결이 수백 개여도 스레드를 점유하지 않는다"""
+    with app.request_context(_asgi_environ(scope, b"")):
+        uname = current_username()
+    if not uname:
+        await send({"type": "http.response.start", "status": 401,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"ok":false,"error":"unauthorized"}'})
+        return
+    loop = asyncio.get_running_loop()
+    aq = asyncio.Queue(SSE_QUEUE_MAX)
+
+    def _put(payload):
+        try:
+            aq.put_nowait(payload)
+        except asyncio.QueueFull:
+            while not aq.empty():
+                aq.get_nowait()
+            aq.put_nowait(None)
+
+    token = EVENTS.subscribe(uname, lambda payload: loop.call_soon_threadsafe(_put, payload))
+    await receive()  # 요청 본문(GET이므로 비어 있음)
+    disconnect = asyncio.ensure_future(receive())
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in _sse_headers()]})
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        while True:
+            get = asyncio.ensure_future(aq.get())
+            done, _ = await asyncio.wait({get, disconnect}, timeout=SSE_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                get.cancel()
+                return
+            if get not in done:
+                get.cancel()
+                await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                continue
+            payload = get.result()
+            if payload is None:
+                break
+            await send({"type": "http.response.body", "body": payload, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        EVENTS.unsubscribe(token)
+        disconnect.cancel()
+
+async def asgi_app(scope, receive, send):
+    """ASGI 3 애플리케이션 (http + lifespan)"""
+    if scope["type"] == "http":
+        if scope["path"] == "/events" and scope["method"] == "GET":
+            await _asgi_events(scope, receive, send)
+            return
+        await _asgi_http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                _asgi_executor()
+                await asyncio.get_running_loop().run_in_executor(None, run_startup_migration)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, _asgi_executor_shutdown)
+                await asyncio.get_running_loop().run_in_executor(None, flush_db)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    else:
+        raise ValueError(f"지원하지 않는 ASGI scope: {scope['type']}")
+
+# ------------------------------
+# 운영 서버 진입점: python bible_quiz_app.py serve [--host] [--port] [--workers] [--threads] [--server]
+# ------------------------------
+# uvicorn이 설치되어 있으면 asgi_app 으로 실행 — /events 같은 오래 가는 연결은 이벤트 루프가 들고 있고 스레드는
+# 라우트 실행에만 쓰인다(gunicorn도 있으면 preload + UvicornWorker, 없으면 uvicorn 단일 프로세스).
+# uvicorn이 없으면(또는 --server wsgi) 고정 크기 스레드 풀로 실행: gunicorn이 있으면 preload + gthread 워커,
+# 없으면 스레드 풀 기반 단일 프로세스 서버(debug 끔). 이때는 연결 하나가 스레드 하나를 쥐므로 SSE 스트림을
+# 워커당 스레드 수의 1/4(QUIZ_SSE_MAX_STREAMS 로 변경)까지만 받아 나머지 스레드를 일반 요청에 남긴다.
+# 코퍼스·인덱스·정적 자산·/verses 응답 본문은 마스터에서 한 번만 준비하고 워커는 copy-on-write로 공유한다.
+# SIGHUP: 코퍼스/정적 자산을 다시 읽고 (gunicorn이면) 워커를 차례로 교체하는 무중단 재시작
+def default_worker_count():
+    """write-behind 파일 저장소는 프로세스마다 메모리 DB를 따로 가지므로(동시 수정 시 마지막 기록이 이김)
+    워커 1개, 공유 저장소나 요청마다 파일을 읽는 sync 모드는 2×코어+1"""
+    if PERSIST_MODE == "writebehind" and not STORE.shared:
+        return 1
+    return 2 * (os.cpu_count() or 1) + 1
+
+def default_thread_count():
+    return min(32, (os.cpu_count() or 1) * 4 + 4)
+
+def preload_runtime(reload=False):
+    """포크 전 준비 작업. 끝나면 gc.freeze — 공유 객체를 GC 대상에서 빼서 워커에서 페이지 복사가 일어나지 않게"""
+    if reload:
+        gc.unfreeze()
+        load_server_verses_file()
+        sync_corpus()
+        build_static_assets()
+    server_verses_entry()
+    STORE.warm()
+    gc.collect()
+    gc.freeze()
+
+class PooledWSGIServer(BaseWSGIServer):
+    """gunicorn이 없을 때의 대체 서버: 연결을 고정 크기 스레드 풀에서 처리(연결마다 스레드를 만들지 않음)"""
+    def __init__(self, host, port, wsgi_app, threads):
+        super().__init__(host, port, wsgi_app)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="quiz-http")
+
+    def process_request(self, req, client_address):
+        self._pool.submit(self._process, req, client_address)
+
+    def _process(self, req, client_address):
+        try:
+            self.finish_request(req, client_address)
+        except Exception:
+            self.handle_error(req, client_address)
+        finally:
+            self.shutdown_request(req)
+
+def _serve_gunicorn(host, port, workers, threads, asgi=False):
+    from gunicorn.app.base import BaseApplication
+
+    class QuizApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "threads": threads,
+                "worker_class": "uvicorn.workers.UvicornWorker" if asgi else "gthread",
+                "preload_app": True,
+                "on_reload": lambda arbiter: preload_runtime(reload=True),
+                "worker_exit": lambda arbiter, worker: flush_db(),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return asgi_app if asgi else app
+
+    QuizApplication().run()
+
+def _install_sighup_reload():
+    # 단일 프로세스 서버용 (gunicorn은 on_reload 훅이 같은 일을 한다)
+    def _reload():
+        flush_db()
+        preload_runtime(reload=True)
+        print("[serve] SIGHUP: 코퍼스/정적 자산 다시 읽음", file=sys.stderr)
+
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=_reload, daemon=True).start())
+
+def _serve_uvicorn(host, port):
+    import uvicorn
+    _install_sighup_reload()
+    try:
+        uvicorn.run(asgi_app, host=host, port=port, lifespan="on")  # 종료 시 lifespan.shutdown 이 flush
+    finally:
+        flush_db()
+
+def _serve_fallback(host, port, threads):
+    server = PooledWSGIServer(host, port, app, threads)
+    _install_sighup_reload()
+    install_shutdown_flush()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        flush_db()
+
+def _installed(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+def serve(argv=None):
+    ap = argparse.ArgumentParser(prog="bible_quiz_app.py serve", description="운영 서버 실행")
+    ap.add_argument("--host", default=os.environ.get("QUIZ_HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", "10000")))
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("QUIZ_WORKERS", "0")), help="0: 자동")
+    ap.add_argument("--threads", type=int, default=int(os.environ.get("QUIZ_THREADS", "0")), help="0: 자동")
+    ap.add_argument("--server", choices=("auto", "asgi", "wsgi"), default=os.environ.get("QUIZ_SERVER", "auto"),
+                    help="auto: uvicorn 있으면 asgi")
+    args = ap.parse_args(argv)
+    global SSE_WSGI_MAX_STREAMS
+    workers = args.workers or default_worker_count()
+    threads = args.threads or default_thread_count()
+    if workers > 1 and PERSIST_MODE == "writebehind" and not STORE.shared:
+        print("[serve] 경고: write-behind 저장소에서 워커가 여러 개면 동시 수정이 유실될 수 있습니다", file=sys.stderr)
+
+    asgi = args.server == "asgi" or (args.server == "auto" and _installed("uvicorn"))
+    if asgi and not _installed("uvicorn"):
+        print("[serve] --server asgi 에는 uvicorn 이 필요합니다", file=sys.stderr)
+        return 2
+
+    app.debug = False
+    run_startup_migration()
+    preload_runtime()
+    gunicorn = _installed("gunicorn")
+    if asgi and gunicorn:
+        print(f"[serve] gunicorn+uvicorn(asgi) {args.host}:{args.port} workers={workers} "
+              f"route threads={ASGI_THREADS}", file=sys.stderr)
+        _serve_gunicorn(args.host, args.port, workers, threads, asgi=True)
+    elif asgi:
+        if workers > 1:
+            print("[serve] gunicorn 미설치 — 단일 프로세스로 실행", file=sys.stderr)
+        print(f"[serve] uvicorn(asgi) {args.host}:{args.port} route threads={ASGI_THREADS}", file=sys.stderr)
+        _serve_uvicorn(args.host, args.port)
+    else:
+        # 스레드 풀 서버: SSE 스트림이 스레드를 다 차지하지 않도록 (워커마다 적용)
+        if "QUIZ_SSE_MAX_STREAMS" not in os.environ:
+            SSE_WSGI_MAX_STREAMS = max(1, threads // 4)
+        if gunicorn:
+            print(f"[serve] gunicorn {args.host}:{args.port} workers={workers} threads={threads} "
+                  f"sse streams={SSE_WSGI_MAX_STREAMS}", file=sys.stderr)
+            _serve_gunicorn(args.host, args.port, workers, threads)
+        else:
+            if workers > 1:
+                print("[serve] gunicorn 미설치 — 단일 프로세스로 실행", file=sys.stderr)
+            print(f"[serve] {args.host}:{args.port} threads={threads} sse streams={SSE_WSGI_MAX_STREAMS}",
+                  file=sys.stderr)
+            _serve_fallback(args.host, args.port, threads)
+    return 0
+
+def export_cli(argv=None):
+    ap = argparse.ArgumentParser(prog="bible_quiz_app.py export", description="사용자 데이터 내보내기 (gzip JSON Lines)")
+    ap.add_argument("-o", "--output", default="-", help="출력 파일 (기본: 표준 출력)")
+    ap.add_argument("--users", default="", help="쉼표로 구분한 사용자 (기본: 전체)")
+    args = ap.parse_args(argv)
+    names = [n for n in args.users.split(",") if n] or None
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in export_stream(names):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return 0
+
+def import_cli(argv=None):
+    """file 저장소에 직접 가져오기는 서버가 꺼져 있을 때만 (실행 중이면 POST /admin/import 사용 — 두 프로세스가
+    같은 quiz_stats.json 을 따로 기록하게 된다). 공유 저장소(redis)는 운영 중에도 가능"""
+    ap = argparse.ArgumentParser(prog="bible_quiz_app.py import", description="내보낸 사용자 데이터 병합 가져오기")
+    ap.add_argument("input", help="입력 파일 (- : 표준 입력)")
+    ap.add_argument("--scores", choices=("max", "sum"), default="max", help="같은 구절 verseScores 병합 방식")
+    args = ap.parse_args(argv)
+    run_startup_migration()  # 파일을 기록하므로 서버 기동과 같이 먼저 올리고 원본을 .bak 으로 보관
+    src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        summary = import_stream(src, args.scores)
+    except ValueError as e:
+        print(f"[import] 실패: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+    flush_db()
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
 
 
 if __name__ == "__main__":
-    # 개발 편의: 시작 시 한번 더 로드(환경변수 경로 변경 반영)
-    load_server_verses_file()
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(serve(sys.argv[2:]))
+    if sys.argv[1:2] == ["export"]:
+        sys.exit(export_cli(sys.argv[2:]))
+    if sys.argv[1:2] == ["import"]:
+        sys.exit(import_cli(sys.argv[2:]))
+    # 개발 서버(디버그 모드) — 운영은 serve 사용. 코퍼스는 import 시 이미 로드됨
+    run_startup_migration()
+    install_shutdown_flush()
     app.run(host="0.0.0.0", port=10000, debug=True)
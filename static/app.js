@@ -0,0 +1,2113 @@
+// ------------------------------
+// 전역 상태(클라이언트)
+// ------------------------------
+// 지연 로드할 로컬 자산 URL (HTML 셸의 data-* 속성으로 지문 URL이 주입됨)
+const APP_SCRIPT = document.currentScript;
+const LAZY_ASSETS = {
+  chart: APP_SCRIPT?.dataset.chart,  // Chart.js: 대시보드 차트를 그릴 때만
+  csv: APP_SCRIPT?.dataset.csv       // CSV 파서: CSV 업로드를 시작할 때만
+};
+let VERSES = []; // {book, chapter, verse, text}
+let VERSES_SOURCE = 'server'; // 'server' | 'upload'
+let CORPUS_ID = null; // 서버에 저장된 업로드 코퍼스 id (이 브라우저에서만 파싱한 업로드면 null)
+let CURRENT_QUIZ = null; // {questions, index, score, skip, answered[], practice, ...}
+let LAST_RESULT = null; // 서버 저장용 캐시
+let PRACTICE_MODE = false;
+let chartScores = null;
+let CURRENT_USER = null;
+let USER_DATA = null;   // /data 캐시 — 실시간 연결(/events) 중에는 푸시된 변경분으로 갱신
+let LEADERBOARD = null; // /leaderboard 캐시 — 실시간 연결 중에는 푸시로 갱신
+let STUDY_SETS = [];    // /study_sets — 학습 세트 목록(구절/시도/숙달 수 포함)
+
+// ------------------------------
+// 스크립트 지연 로드 (같은 URL은 한 번만 요청)
+// ------------------------------
+const _scriptLoads = {};
+function loadScriptOnce(url){
+  if (!url) return Promise.reject(new Error('missing script url'));
+  if (!_scriptLoads[url]){
+    _scriptLoads[url] = new Promise((resolve, reject)=>{
+      const el = document.createElement('script');
+      el.src = url;
+      el.onload = ()=> resolve();
+      el.onerror = ()=>{ delete _scriptLoads[url]; reject(new Error('script load failed: '+url)); };
+      document.head.appendChild(el);
+    });
+  }
+  return _scriptLoads[url];
+}
+
+// ------------------------------
+// 서버 API
+// ------------------------------
+const OFFLINE = {ok:false, error:'offline', offline:true};
+function unauthorized(){
+  // 세션이 끝났으면 서비스 워커의 이전 사용자 데이터 캐시도 비운다
+  navigator.serviceWorker?.controller?.postMessage('logout');
+  alert('로그인이 필요합니다.');
+  showView('auth');
+  return {ok:false, error:'unauthorized'};
+}
+async function apiGet(path){
+  let r;
+  try { r = await fetch(path); } catch(e){ return OFFLINE; }
+  if (r.status === 401) return unauthorized();
+  return await r.json();
+}
+async function apiPost(path, data){
+  let r;
+  try {
+    r = await fetch(path, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(data||{})});
+  } catch(e){ return OFFLINE; }
+  if (r.status === 401) return unauthorized();
+  return await r.json();
+}
+
+// ------------------------------
+// 오프라인 시도 큐 (IndexedDB)
+// - 학습 시도/저장 실패한 시험을 먼저 로컬에 기록하고, 온라인일 때 /sync_attempts 로 묶어서 전송
+// - 시도 id로 서버가 중복을 걸러내므로 재전송해도 안전
+// ------------------------------
+function newAttemptId(){
+  if (window.crypto?.randomUUID) return 'att_' + crypto.randomUUID();
+  return 'att_' + Date.now() + '_' + Math.floor(Math.random()*1e9);
+}
+
+const AttemptQueue = (()=>{
+  const DB_NAME = 'bible-quiz', STORE = 'attempts', BATCH = 100;
+  let dbPromise = null;
+  let flushing = null;
+
+  function openDb(){
+    if (!('indexedDB' in window)) return Promise.resolve(null);
+    if (!dbPromise){
+      dbPromise = new Promise((resolve, reject)=>{
+        const req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = ()=>{ req.result.createObjectStore(STORE, { keyPath: 'id' }); };
+        req.onsuccess = ()=> resolve(req.result);
+        req.onerror = ()=> reject(req.error);
+      }).catch(()=> null);
+    }
+    return dbPromise;
+  }
+
+  function withStore(mode, fn){
+    return openDb().then(db => db && new Promise((resolve, reject)=>{
+      const tx = db.transaction(STORE, mode);
+      const result = fn(tx.objectStore(STORE));
+      tx.oncomplete = ()=> resolve(result && 'result' in result ? result.result : true);
+      tx.onerror = ()=> reject(tx.error);
+    }));
+  }
+
+  // item: {id, user, session, replaceId?}
+  async function add(item){
+    const ok = await withStore('readwrite', st => { st.put(item); });
+    if (!ok){
+      // IndexedDB를 쓸 수 없는 환경: 바로 서버로 보낸다
+      await apiPost('/sync_attempts', { attempts: [item] });
+    }
+  }
+
+  async function pendingFor(user){
+    const all = await withStore('readonly', st => st.getAll());
+    return (all || []).filter(it => it.user === user);
+  }
+
+  async function remove(ids){
+    if (!ids.length) return;
+    await withStore('readwrite', st => { for (const id of ids) st.delete(id); });
+  }
+
+  async function flushOnce(){
+    if (!CURRENT_USER || !navigator.onLine) return 0;
+    let sent = 0;
+    for (;;){
+      const items = (await pendingFor(CURRENT_USER)).slice(0, BATCH);
+      if (!items.length) break;
+      const res = await apiPost('/sync_attempts', {
+        attempts: items.map(it => ({ id: it.id, session: it.session, replaceId: it.replaceId || null }))
+      });
+      if (!(res && res.ok)) break; // 오프라인/인증 만료: 다음 기회에 재시도
+      const done = [...(res.applied||[]), ...(res.duplicates||[]), ...(res.rejected||[]).filter(Boolean)];
+      await remove(done);
+      sent += (res.applied||[]).length;
+      if (items.length < BATCH) break;
+    }
+    return sent;
+  }
+
+  function flush(){
+    if (!flushing) flushing = flushOnce().catch(()=>0).finally(()=>{ flushing = null; });
+    return flushing;
+  }
+
+  return { add, flush, pendingFor };
+})();
+
+window.addEventListener('online', ()=>{ AttemptQueue.flush().then(n=>{ if (n) refreshAfterMutation(); }); });
+setInterval(()=>{ AttemptQueue.flush(); }, 30000);
+
+// ------------------------------
+// 사용자 데이터 캐시 + 실시간 갱신 (Server-Sent Events)
+// - 연결 중: /data 는 한 번만 받고, 이후 서버가 보내는 변경분(user/leaderboard 이벤트)만 반영
+// - 미연결(미지원/오프라인/재접속 중/서버 스트림 상한): 예전처럼 필요할 때마다 다시 받고, 홈 화면은 주기적으로 갱신
+// - 비로그인이면 연결하지 않는다
+// ------------------------------
+async function getUserData(){
+  if (!USER_DATA || !Live.connected){
+    const d = await apiGet('/data');
+    if (!d || d.ok === false) return d; // 오프라인/인증 오류 응답은 캐시하지 않음
+    USER_DATA = d;
+  }
+  return USER_DATA;
+}
+
+function invalidateUserData(){ USER_DATA = null; LEADERBOARD = null; }
+
+// 서버 변경 후 화면 갱신: 연결 중이면 푸시된 변경분이 반영하므로 다시 요청하지 않는다
+function refreshAfterMutation(){
+  if (Live.connected) return;
+  invalidateUserData();
+  buildDashboard();
+}
+
+const Live = (()=>{
+  let es = null, connected = false, opened = false, renderTimer = null;
+  let retryTimer = null, pollTimer = null, retryDelay = 60000;
+  const POLL_MS = 60000, RETRY_MAX = 600000;
+
+  function scheduleRender(){
+    clearTimeout(renderTimer);
+    renderTimer = setTimeout(()=>{
+      if (!document.getElementById('view-home')?.classList.contains('hidden')) buildDashboard();
+    }, 150);
+  }
+
+  function applyUserDelta(delta){
+    if (!USER_DATA) return; // 아직 캐시가 없으면 다음 조회 때 새로 받는다
+    if (delta.reset){ invalidateUserData(); scheduleRender(); return; }
+    let sessions = USER_DATA.sessions || [];
+    for (const se of (delta.sessions||[])){
+      const i = sessions.findIndex(x=> x.id===se.id);
+      if (i >= 0) sessions[i] = se; else sessions.push(se);
+    }
+    if (delta.removedSessions) sessions = sessions.filter(x=> !delta.removedSessions.includes(x.id));
+    USER_DATA.sessions = sessions;
+    if (delta.replaceVerseScores) USER_DATA.verseScores = { ...delta.replaceVerseScores };
+    const vs = USER_DATA.verseScores || (USER_DATA.verseScores = {});
+    Object.assign(vs, delta.verseScores || {});
+    for (const k of (delta.removedVerseScores||[])) delete vs[k];
+    if (delta.replaceVerseStats) USER_DATA.verseStats = { ...delta.replaceVerseStats };
+    const st = USER_DATA.verseStats || (USER_DATA.verseStats = {});
+    Object.assign(st, delta.verseStats || {});
+    for (const k of (delta.removedVerseStats||[])) delete st[k];
+    if ('corpus' in delta) USER_DATA.corpus = delta.corpus; // 다른 기기의 업로드는 다음 로드 때 반영
+    scheduleRender();
+  }
+
+  // 스트림을 못 쓰는 동안: 홈 화면이면 /data 를 주기적으로 다시 받아 다른 기기의 변경을 반영
+  function startPolling(){
+    if (pollTimer) return;
+    pollTimer = setInterval(()=>{
+      if (!CURRENT_USER || connected) return;
+      invalidateUserData(); scheduleRender();
+    }, POLL_MS);
+  }
+  function stopPolling(){ clearInterval(pollTimer); pollTimer = null; }
+
+  function connect(){
+    if (es || !CURRENT_USER || !('EventSource' in window)) return;
+    clearTimeout(retryTimer); retryTimer = null;
+    es = new EventSource('/events');
+    es.onopen = ()=>{
+      // 재접속: 끊긴 동안의 이벤트는 다시 오지 않으므로 전체 재동기화
+      if (opened || pollTimer){ invalidateUserData(); scheduleRender(); }
+      opened = true; connected = true; retryDelay = 60000;
+      stopPolling();
+    };
+    es.onerror = ()=>{
+      connected = false; // 네트워크 끊김은 EventSource가 알아서 재접속
+      startPolling();
+      if (es.readyState === EventSource.CLOSED){
+        // 200이 아닌 응답(스트림 상한 503, 401)은 재접속하지 않으므로 직접, 점점 드물게
+        es = null; opened = false;
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(RETRY_MAX, retryDelay * 2);
+      }
+    };
+    es.addEventListener('user', ev=> applyUserDelta(JSON.parse(ev.data)));
+    es.addEventListener('leaderboard', ev=>{ LEADERBOARD = JSON.parse(ev.data).leaders || []; renderLeaderboard(); });
+  }
+
+  function close(){
+    if (es){ es.close(); es = null; }
+    clearTimeout(retryTimer); retryTimer = null;
+    stopPolling();
+    connected = false; opened = false; retryDelay = 60000;
+  }
+
+  // 로그인/로그아웃: 구독 대상 사용자가 바뀌므로 다시 연결
+  function reconnect(){ close(); invalidateUserData(); connect(); }
+
+  return { connect, close, reconnect, get connected(){ return connected; } };
+})();
+
+// ------------------------------
+// 서버 verses.csv 기본 로드
+// ------------------------------
+async function loadDefaultVersesFromServer(forceReload=false){
+  const url = forceReload ? '/verses?reload=1' : '/verses';
+  const res = await apiGet(url);
+  if (res && res.ok){
+    VERSES = res.verses || [];
+    VERSES_SOURCE = 'server';
+    CORPUS_ID = null;
+    refreshMeta();
+    if ((res.meta?.count||0) > 0 && forceReload){
+      alert('서버 기본 구절 로딩 완료: ' + res.meta.count + '개');
+    }
+  } else {
+    console.warn('서버 구절 로드 실패', res?.error);
+  }
+}
+
+// 서버에 저장된 업로드 코퍼스 (/corpus/<id> — URL이 내용 해시라 한 번 받으면 캐시에서)
+async function loadUserCorpus(id){
+  const res = await apiGet('/corpus/' + encodeURIComponent(id));
+  if (!(res && res.ok)) return false;
+  VERSES = res.verses || [];
+  VERSES_SOURCE = 'upload';
+  CORPUS_ID = id;
+  refreshMeta();
+  return true;
+}
+
+// 로그인 사용자가 코퍼스를 올려 두었으면 그것, 아니면(또는 받지 못하면) 서버 기본 구절
+async function loadVerses(){
+  if (CURRENT_USER){
+    const d = await getUserData();
+    const id = d?.corpus?.id;
+    if (id && (id === CORPUS_ID || await loadUserCorpus(id))) return;
+  }
+  if (VERSES_SOURCE !== 'server' || !VERSES.length) await loadDefaultVersesFromServer(false);
+}
+
+// ------------------------------
+// 인증 UI
+// ------------------------------
+async function refreshWhoAmI(){
+  const info = await apiGet('/whoami');
+  if (!info) return;
+  CURRENT_USER = info.logged_in ? info.username : null;
+  updateAuthUI();
+  // ★ 로그인되어 있으면 저장된 서버 설정을 즉시 불러와 UI에 반영
+  if (CURRENT_USER){
+    await loadSettings();
+  }
+}
+function updateAuthUI(){
+  const hello = document.getElementById('hello-user');
+  const nameEl = document.getElementById('current-username');
+  const btnAuth = document.getElementById('btn-show-auth');
+  const btnLogout = document.getElementById('btn-logout');
+  if (CURRENT_USER){
+    if (hello) hello.classList.remove('hidden');
+    if (nameEl) nameEl.textContent = CURRENT_USER;
+    if (btnLogout) btnLogout.classList.remove('hidden');
+    if (btnAuth) btnAuth.classList.add('hidden');
+  } else {
+    if (hello) hello.classList.add('hidden');
+    if (nameEl) nameEl.textContent = '';
+    if (btnLogout) btnLogout.classList.add('hidden');
+    if (btnAuth) btnAuth.classList.remove('hidden');
+  }
+}
+function bindAuthUI(){
+  const tabLogin = document.getElementById('tab-login');
+  const tabSignup = document.getElementById('tab-signup');
+  const loginForm = document.getElementById('login-form');
+  const signupForm = document.getElementById('signup-form');
+  if (tabLogin) tabLogin.addEventListener('click', ()=>{ tabLogin.classList.add('active'); tabSignup.classList.remove('active'); loginForm.classList.remove('hidden'); signupForm.classList.add('hidden'); });
+  if (tabSignup) tabSignup.addEventListener('click', ()=>{ tabSignup.classList.add('active'); tabLogin.classList.remove('active'); signupForm.classList.remove('hidden'); loginForm.classList.add('hidden'); });
+
+  const btnAuth = document.getElementById('btn-show-auth');
+  if (btnAuth) btnAuth.addEventListener('click', ()=>{ showView('auth'); });
+
+  const btnLogout = document.getElementById('btn-logout');
+  if (btnLogout) btnLogout.addEventListener('click', async ()=>{
+    const res = await apiPost('/logout', {});
+    if (res && res.ok){
+      navigator.serviceWorker?.controller?.postMessage('logout');
+      CURRENT_USER = null;
+      Live.reconnect();
+      updateAuthUI();
+      if (CORPUS_ID) loadDefaultVersesFromServer(false); // 다른 사용자에게 이전 사용자의 코퍼스가 남지 않게
+      showView('auth');
+      buildDashboard(); // 비로그인 상태의 빈 대시보드
+    }
+  });
+
+  const btnLogin = document.getElementById('btn-login');
+  if (btnLogin) btnLogin.addEventListener('click', async ()=>{
+    const username = document.getElementById('login-username').value.trim();
+    const password = document.getElementById('login-password').value;
+    if (!username || !password){ alert('아이디와 비밀번호를 입력하세요.'); return; }
+    const res = await apiPost('/login', {username, password});
+    if (res && res.ok){
+      CURRENT_USER = res.username;
+      Live.reconnect();
+      updateAuthUI();
+      showView('home');
+      await loadSettings(); // ★ 로그인 직후 설정 반영
+      await loadVerses();   // 이 사용자가 올려 둔 코퍼스로
+      buildDashboard();
+    } else {
+      alert(res?.error || '로그인 실패');
+    }
+  });
+
+  const btnSignup = document.getElementById('btn-signup');
+  if (btnSignup) btnSignup.addEventListener('click', async ()=>{
+    const username = document.getElementById('signup-username').value.trim();
+    const password = document.getElementById('signup-password').value;
+    if (!username || !password){ alert('아이디와 비밀번호를 입력하세요.'); return; }
+    const res = await apiPost('/signup', {username, password});
+    if (res && res.ok){
+      CURRENT_USER = res.username;
+      Live.reconnect();
+      updateAuthUI();
+      showView('home');
+      await loadSettings(); // ★ 가입 직후 설정 반영
+      await loadVerses();
+      buildDashboard();
+    } else {
+      alert(res?.error || '가입 실패');
+    }
+  });
+}
+
+// ------------------------------
+// 버튼 바인딩
+// ------------------------------
+document.getElementById('btn-start-quiz').addEventListener('click', ()=>{ startQuizInternal(); });
+document.getElementById('btn-practice-toggle').addEventListener('click', ()=>{ togglePractice(); });
+document.getElementById('btn-start-top20').addEventListener('click', ()=>{ startTop20Quiz(); });
+document.getElementById('btn-start-top20-2').addEventListener('click', ()=>{ startTop20Quiz(); });
+document.getElementById('btn-load-server-verses').addEventListener('click', async ()=>{
+  // 서버에 저장한 업로드 코퍼스가 있으면 포인터도 지워야 다른 기기/다음 로드에서도 기본 구절
+  if (CURRENT_USER && (CORPUS_ID || USER_DATA?.corpus)){
+    const res = await apiPost('/corpus/clear', {});
+    if (res && res.ok && USER_DATA) USER_DATA.corpus = null;
+  }
+  await loadDefaultVersesFromServer(true);
+});
+document.getElementById('btn-ss-preview').addEventListener('click', ()=>{ previewStudySet(); });
+document.getElementById('btn-ss-save').addEventListener('click', ()=>{ saveStudySet(); });
+document.getElementById('btn-clear-top20').addEventListener('click', async ()=>{
+  if (!CURRENT_USER){ alert('로그인하세요.'); return; }
+  if (!confirm('TOP20(오답 카운트)을 모두 초기화할까요?')) return;
+  const res = await apiPost('/clear_top20', {});
+  if (res && res.ok){ refreshAfterMutation(); }
+});
+
+// ------------------------------
+// 뷰 전환
+// ------------------------------
+function showView(name){
+  for (const id of ['home','quiz','settings','auth']){
+    const el = document.getElementById('view-'+id);
+    if (el) el.classList.toggle('hidden', id!==name);
+  }
+  if (name==='home') buildDashboard();
+  if (name==='settings') refreshMeta();
+  if (name==='auth') { /* no-op */ }
+}
+
+// ------------------------------
+// CSV 로딩 (로그인 중이면 서버에 저장, 아니면/실패하면 클라이언트 파싱)
+// ------------------------------
+// 서버가 파싱해 내용 해시로 저장 — 같은 파일은 한 부만, 다른 기기에서도 같은 코퍼스
+async function uploadCorpus(file){
+  let r;
+  try {
+    r = await fetch('/corpus?name=' + encodeURIComponent(file.name), { method:'POST', headers:{'Content-Type':'text/csv'}, body: file });
+  } catch(e){ return OFFLINE; }
+  try { return await r.json(); } catch(e){ return {ok:false, error:'HTTP '+r.status}; }
+}
+
+// 파일 선택 창을 여는 순간 파서를 미리 받아 둔다 (비로그인/오프라인 대비)
+document.getElementById('csv-input').addEventListener('click', ()=>{ loadScriptOnce(LAZY_ASSETS.csv).catch(()=>{}); });
+document.getElementById('csv-input').addEventListener('change', async (ev)=>{
+  const file = ev.target.files?.[0];
+  if (!file) return;
+  if (CURRENT_USER){
+    const res = await uploadCorpus(file);
+    if (res && res.ok){
+      if (USER_DATA) USER_DATA.corpus = res.corpus;
+      if (await loadUserCorpus(res.corpus.id)){
+        alert('구절 로딩 완료: '+VERSES.length+'개 (사용자 업로드, 서버에 저장됨)');
+        return;
+      }
+    } else if (!res?.offline){
+      alert(res?.error || '업로드 실패'); return;
+    }
+  }
+  try {
+    await loadScriptOnce(LAZY_ASSETS.csv);
+  } catch(e){ alert('CSV 파서를 불러오지 못했습니다.'); return; }
+  const rows = QuizCsv.parse(await file.text()); VERSES = [];
+  for (const r of rows){
+    const book = (r.Book || r.book || '').trim();
+    const chapter = parseInt(r.Chapter || r.chapter, 10);
+    const verse = parseInt(r.Verse || r.verse, 10);
+    const text = (r.Text || r.text || '').trim();
+    if (book && Number.isFinite(chapter) && Number.isFinite(verse) && text){ VERSES.push({book, chapter, verse, text}); }
+  }
+  VERSES_SOURCE = 'upload';
+  CORPUS_ID = null;
+  alert('구절 로딩 완료: '+VERSES.length+'개 (사용자 업로드, 이 브라우저에만)');
+  refreshMeta();
+});
+
+function refreshMeta(){
+  const srcEl = document.getElementById('meta-source');
+  document.getElementById('meta-verse-count').textContent = VERSES.length;
+  getUserData().then(d=>{ document.getElementById('meta-saved-sessions').textContent = (d && d.sessions) ? d.sessions.length : 0; });
+  if (srcEl){
+    srcEl.textContent = (VERSES_SOURCE==='upload') ? (CORPUS_ID ? '사용자 업로드 (서버 저장)' : '사용자 업로드') : '서버 verses.csv';
+    srcEl.className = 'badge ' + ((VERSES_SOURCE==='upload')?'text-bg-warning':'text-bg-info');
+  }
+}
+
+// ------------------------------
+// 유틸리티 (정규화/유사도)
+// ------------------------------
+function randInt(n){ return Math.floor(Math.random()*n); }
+function shuffle(a){ for(let i=a.length-1;i>0;i--){ const j=randInt(i+1); [a[i],a[j]]=[a[j],a[i]]; } return a; }
+
+function normalizeText(s){
+  if (!s) return '';
+  const lowered = s.normalize('NFKC').toLowerCase();
+  const noPunct = lowered.replace(/[\u2000-\u206F\u2E00-\u2E7F\\'!"#$%&()*+,\-./:;<=>?@\[\]^_`{|}~]/g, ' ');
+  return noPunct.replace(/\s+/g,' ').trim();
+}
+function normalizeLabel(s){
+  if (!s) return '';
+  return s.normalize('NFKC').trim().toLowerCase().replace(/\s+/g,' ');
+}
+
+// ------------------------------
+// 책 이름 별칭 + 참조 파서: 서버 parse_reference 와 같은 규칙 ("누가", "테살로니카 1서", "1 Thess" → 같은 책)
+// ------------------------------
+let BOOK_TRIE = null; // /book_aliases 의 {접힌 별칭: 책 id} 로 만든 트라이 — 못 받으면 이름 그대로 비교
+const REF_SKIP = new Set([' ','\t','\r','\n','.','·']);
+const REF_TAIL = /^\s*(?:(\d+)(?:\s*[:,.]\s*|\s+)(\d+)(?:\s*[-~]\s*(\d+))?|(\d+))?\s*\.?\s*$/;
+
+async function loadBookAliases(){
+  const r = await apiGet('/book_aliases');
+  if (!(r && r.ok)) return;
+  const root = new Map();
+  for (const [alias, id] of Object.entries(r.aliases)){
+    let node = root;
+    for (const ch of alias){
+      if (!node.has(ch)) node.set(ch, new Map());
+      node = node.get(ch);
+    }
+    node.set('', id);
+  }
+  BOOK_TRIE = root;
+}
+
+function refTail(rest){
+  const m = rest.replace(/[장절]/g, ' ').match(REF_TAIL);
+  if (!m) return null;
+  if (m[4]) return {chapter:+m[4], verse:null, verseEnd:null};
+  if (m[1]) return {chapter:+m[1], verse:+m[2], verseEnd: m[3] ? +m[3] : null};
+  return {chapter:null, verse:null, verseEnd:null};
+}
+
+// 자유 형식 참조 → {book(id), chapter, verse, verseEnd} (없는 부분은 null), 책을 못 찾으면 null
+function parseReference(text){
+  if (!BOOK_TRIE || !text) return null;
+  const s = text.normalize('NFKC').toLowerCase();
+  const chars = Array.from(s);
+  let node = BOOK_TRIE, pos = 0;
+  const cands = [];
+  for (const ch of chars){
+    pos += ch.length;
+    if (REF_SKIP.has(ch)) continue;
+    node = node.get(ch);
+    if (!node) break;
+    if (node.has('')) cands.push([node.get(''), pos]);
+  }
+  let best = null, bestRank = -1;
+  for (let j=cands.length-1;j>=0;j--){ // 긴 일치부터, 절까지 읽히는 해석 > 장만 > 책만
+    const tail = refTail(s.slice(cands[j][1]));
+    if (!tail) continue;
+    const rank = (tail.chapter!==null) + (tail.verse!==null);
+    if (rank > bestRank){ best = {book:cands[j][0], ...tail}; bestRank = rank; }
+  }
+  return best;
+}
+
+// 책 이름 → 비교용 id (별칭 표에 없는 이름은 정규화한 이름 그대로)
+function bookIdOf(name){
+  const r = parseReference(name);
+  return (r && r.chapter===null) ? r.book : normalizeLabel(name);
+}
+
+// 공백 완전 무시 비교용 정규화 + LCS
+function normalizeForCompare(s){
+  if (!s) return '';
+  const lowered = s.normalize('NFKC').toLowerCase();
+  const noPunct = lowered.replace(/[\u2000-\u206F\u2E00-\u2E7F\\'!"#$%&()*+,\-./:;<=>?@\[\]^_`{|}~]/g, '');
+  return noPunct.replace(/\s+/g,'');
+}
+function lcsLen(a, b){
+  const n = a.length, m = b.length;
+  if (n===0 || m===0) return 0;
+  const prev = new Array(m+1).fill(0);
+  const curr = new Array(m+1).fill(0);
+  for (let i=1;i<=n;i++){
+    for (let j=1;j<=m;j++){
+      if (a[i-1] === b[j-1]) curr[j] = prev[j-1] + 1;
+      else curr[j] = Math.max(prev[j], curr[j-1]);
+    }
+    for (let j=0;j<=m;j++) prev[j] = curr[j], curr[j] = 0;
+  }
+  return prev[m];
+}
+// 서술형 채점: 서버 /grade (유사도 + 부분 점수 + 단어 diff). 오프라인이면 같은 유사도를 여기서 계산(diff 없음)
+const TEXT_PASS = { cloze:0.70, continue_verse:0.85, passage_next:0.85, passage_fill:0.80 };
+async function gradeTextAnswer(q, answer){
+  const whole = q.qtype==='passage_fill'; // 단락 채우기는 단락 본문 전체가 정답
+  const key = whole ? passageKey(q.passage) : verseKey(q.verse);
+  const expected = whole ? passageText(q.passage) : q.verse.text;
+  const r = await apiPost('/grade', { qtype:q.qtype, key, expected, answer, corpus: CORPUS_ID || undefined });
+  if (r && r.ok) return r;
+  const sim = charSimIgnoreSpaces(expected, answer); // 띄어쓰기 무시
+  return { similarity:sim, credit:Math.round(sim*1000)/1000, correct: sim >= TEXT_PASS[q.qtype], diff:null };
+}
+
+// 단어 diff → HTML: 빠진 단어는 취소선 없이 빨강, 추가한 단어는 취소선, 바뀐 단어는 "정답(내 답)"
+function renderDiffHtml(diff){
+  if (!diff || !diff.length) return '';
+  return diff.map(d=>{
+    const t = escapeHtml(d.text);
+    if (d.op==='equal') return `<span class="diff-equal">${t}</span>`;
+    if (d.op==='missing') return `<span class="diff-missing" title="빠짐">${t}</span>`;
+    if (d.op==='extra') return `<span class="diff-extra" title="추가">${t}</span>`;
+    return `<span class="diff-sub" title="바뀜">${t}<small>(${escapeHtml(d.answer)})</small></span>`;
+  }).join(' ');
+}
+function gradeFeedbackHtml(q){
+  if (typeof q.similarity !== 'number') return '';
+  const pct = Math.round(q.similarity*100);
+  const diff = renderDiffHtml(q.diff);
+  return `<div class="mt-1"><strong>유사도:</strong> ${pct}%</div>` + (diff ? `<div class="mt-1 diff-line"><strong>비교:</strong> ${diff}</div>` : '');
+}
+
+function charSimIgnoreSpaces(a, b){
+  const A = normalizeForCompare(a);
+  const B = normalizeForCompare(b);
+  const L = Math.max(A.length, B.length);
+  if (L === 0) return 0;
+  const lcs = lcsLen(A, B);
+  return lcs / L;
+}
+
+function formatRef(v){ return `${v.book} ${v.chapter},${v.verse}`; }
+function verseKey(v){ return `${v.book}|${v.chapter}|${v.verse}`; } // 참조 키
+
+// ------------------------------
+// 출제 가중치 (오답↑ 스킵↑ 정답↓ + verseScores 강화 + 부분 점수 낮을수록↑) — 학습 모드에서만 사용
+// ------------------------------
+function buildWeights(sessions, verseScores, pool=null, verseStats=null){
+  const statByRef = {};
+  for (const se of (sessions||[])){
+    for (const d of (se.details||[])){
+      const key = `${d.book}|${d.chapter}|${d.verse}`;
+      if (!statByRef[key]) statByRef[key] = {correct:0, wrong:0, skip:0};
+      if (d.correct) statByRef[key].correct++;
+      else { if (d.skipped) statByRef[key].skip++; else statByRef[key].wrong++; }
+    }
+  }
+  // 가중치 파라미터
+  const BASE=1, A=1, S=1, C=1, V=4, P=3;
+
+  const inPool = pool ? new Set(pool) : null; // 학습 세트 밖 구절은 가중치 0
+  const weights = new Array(VERSES.length).fill(1);
+  for (let i=0;i<VERSES.length;i++){
+    if (inPool && !inPool.has(i)){ weights[i] = 0; continue; }
+    const v = VERSES[i];
+    const key = verseKey(v);
+    const s = statByRef[key] || {correct:0, wrong:0, skip:0};
+    const vs = (verseScores && typeof verseScores[key]==='number') ? verseScores[key] : 0;
+    const st = verseStats && verseStats[key]; // [시도 수, 부분 점수 이동평균]
+    let w = BASE + A*s.wrong + S*s.skip - C*s.correct + V*vs + (st ? P*(1 - st[1]) : 0);
+    if (w < 1) w = 1;
+    weights[i] = w;
+  }
+  const prefix = [];
+  let acc=0;
+  for (let i=0;i<weights.length;i++){ acc+=weights[i]; prefix.push(acc); }
+  return { weights, prefix, total: acc };
+}
+
+function pickVerseWeighted(prefix, total){
+  if (!VERSES.length) return null;
+  if (total<=0) return VERSES[randInt(VERSES.length)];
+  const r = Math.random()*total;
+  let lo=0, hi=prefix.length-1, ans=hi;
+  while (lo<=hi){
+    const mid = (lo+hi)>>1;
+    if (prefix[mid] > r){ ans=mid; hi=mid-1; } // 가중치 0(세트 밖) 구절은 뽑히지 않음
+    else lo=mid+1;
+  }
+  return VERSES[ans];
+}
+
+// (시험 전용) 균등 랜덤 비복원 샘플링 + 참조 유니크 보장
+function pickUniqueIndicesUniform(want){
+  const idxs = Array.from({length: VERSES.length}, (_,i)=>i);
+  shuffle(idxs); // 균등 랜덤
+  const selected = [];
+  const usedRef = new Set();
+  for (const i of idxs){
+    const v = VERSES[i];
+    const k = verseKey(v);
+    if (usedRef.has(k)) continue; // 같은 참조 재출제 금지
+    usedRef.add(k);
+    selected.push(i);
+    if (selected.length === want) break;
+  }
+  return selected;
+}
+
+// ------------------------------
+// 학습 모드 전용: 선택 로직 초기화 (랜덤 ↔ 가중치 번갈아 + 재출제 큐 + 최근 버퍼)
+// ------------------------------
+function initPracticeSelector(dataForWeight, qtypes, pool=null){
+  const {prefix, total} = buildWeights(dataForWeight.sessions, dataForWeight.verseScores, pool, dataForWeight.verseStats);
+  const recentKeys = [];           // 최근 N개 버퍼
+  const RECENT_MAX = 10;
+  const retryQueue = [];           // {key, verse, dueAt, tries}
+  let altToggle = false;           // false: 균등 랜덤, true: 가중치
+  let attemptsCounter = 0;         // 현재까지 시도 수(학습 모드)
+
+  function onAttempt(){ attemptsCounter++; }
+
+  function pushRecent(key){
+    recentKeys.push(key);
+    if (recentKeys.length > RECENT_MAX) recentKeys.shift();
+  }
+  function inRecent(key){ return recentKeys.includes(key); }
+
+  function pickUniform(){
+    return pool ? VERSES[pool[randInt(pool.length)]] : VERSES[randInt(VERSES.length)];
+  }
+
+  function pickUniformAvoidRecent(maxTries=50){
+    if (!VERSES.length) return null;
+    for (let t=0;t<maxTries;t++){
+      const v = pickUniform();
+      const k = verseKey(v);
+      if (!inRecent(k)) return v;
+    }
+    return pickUniform(); // fallback
+  }
+
+  function pickWeightedAvoidRecent(maxTries=80){
+    if (!VERSES.length) return null;
+    for (let t=0;t<maxTries;t++){
+      const v = pickVerseWeighted(prefix, total);
+      const k = verseKey(v);
+      if (!inRecent(k)) return v;
+    }
+    return pickVerseWeighted(prefix, total); // fallback
+  }
+
+  function scheduleRetryForVerse(verse, currentAttempts){
+    const k = verseKey(verse);
+    const found = retryQueue.find(it => it.key === k);
+    const gap = 3 + randInt(3); // 3~5문항 뒤 무작위
+    const due = (currentAttempts||0) + gap;
+    if (found){
+      found.dueAt = Math.min(found.dueAt, due);
+      found.tries = (found.tries||0) + 1;
+    } else {
+      retryQueue.push({ key: k, verse, dueAt: due, tries: 1 });
+    }
+  }
+
+  function discardFromRetryByKey(k){
+    const idx = retryQueue.findIndex(it => it.key === k);
+    if (idx >= 0) retryQueue.splice(idx,1);
+  }
+
+  function chooseVerse(){
+    // 1) 재출제 큐 우선
+    const idx = retryQueue.findIndex(it => it.dueAt <= attemptsCounter);
+    if (idx >= 0){
+      const it = retryQueue.splice(idx,1)[0];
+      pushRecent(it.key);
+      return it.verse;
+    }
+    // 2) 번갈이: false면 랜덤, true면 가중치
+    let verse = null;
+    if (altToggle){
+      verse = pickWeightedAvoidRecent();
+    } else {
+      verse = pickUniformAvoidRecent();
+    }
+    const k = verseKey(verse);
+    pushRecent(k);
+    altToggle = !altToggle;
+    return verse;
+  }
+
+  function makeOne(){
+    const verse = chooseVerse();
+    const t = qtypes[randInt(qtypes.length)];
+    return makeQuestion(t, verse);
+  }
+
+  return {
+    makeOne, retryQueue, recentKeys,
+    scheduleRetryForVerse, discardFromRetryByKey,
+    onAttempt
+  };
+}
+
+// ------------------------------
+// 설정 I/O
+// ------------------------------
+async function loadSettings(){
+  const d = await getUserData();
+  const st = d.settings || { numQuestions:30, enabledQTypes:["identify_ref","cloze","multiple_choice","continue_verse","multiple_choice_text"] };
+  document.getElementById('input-num-questions').value = st.numQuestions;
+  document.getElementById('qtype-identify').checked = st.enabledQTypes.includes('identify_ref');
+  document.getElementById('qtype-cloze').checked = st.enabledQTypes.includes('cloze');
+  document.getElementById('qtype-mc').checked = st.enabledQTypes.includes('multiple_choice');
+  document.getElementById('qtype-continue').checked = st.enabledQTypes.includes('continue_verse');
+  // ★ 버그 수정: 저장값을 그대로 반영 (자동 강제 체크 금지)
+  document.getElementById('qtype-mc-text').checked = st.enabledQTypes.includes('multiple_choice_text');
+  document.getElementById('qtype-passage-next').checked = st.enabledQTypes.includes('passage_next');
+  document.getElementById('qtype-passage-order').checked = st.enabledQTypes.includes('passage_order');
+  document.getElementById('qtype-passage-fill').checked = st.enabledQTypes.includes('passage_fill');
+  // 알림은 최초 자동 로드시엔 표시 안함(사용자 클릭 시에만 표시)
+  return st;
+}
+
+async function saveSettings(){
+  if (!CURRENT_USER){ alert('설정을 저장하려면 로그인하세요.'); showView('auth'); return; }
+  const st = {
+    numQuestions: Math.max(5, Math.min(100, parseInt(document.getElementById('input-num-questions').value,10)||30)),
+    enabledQTypes: [
+      ...(document.getElementById('qtype-identify').checked? ['identify_ref']:[]),
+      ...(document.getElementById('qtype-cloze').checked? ['cloze']:[]),
+      ...(document.getElementById('qtype-mc').checked? ['multiple_choice']:[]),
+      ...(document.getElementById('qtype-continue').checked? ['continue_verse']:[]),
+      ...(document.getElementById('qtype-mc-text').checked? ['multiple_choice_text']:[]),
+      ...passageQTypes(),
+    ]
+  };
+  const res = await apiPost('/settings', st);
+  if (res && res.ok){
+    if (USER_DATA) USER_DATA.settings = st; // 설정 변경은 푸시되지 않으므로 캐시에 직접 반영
+    alert('설정을 서버에 저장했습니다.');
+  }
+}
+
+// ------------------------------
+// 문제 생성기
+// ------------------------------
+function makeQuestion(type, verse){
+  if (type.startsWith('passage_')){
+    const pq = makePassageQuestion(type, verse);
+    if (pq) return pq;
+    type = PASSAGE_FALLBACK[type]; // 이어지는 절이 없는 구절은 한 절 문제로
+  }
+  if (type==='identify_ref'){
+    return { qtype:'identify_ref', subj:true, verse, prompt:'다음 구절의 책/장/절을 입력하세요:' };
+  } else if (type==='cloze'){
+    const masked = maskWords(verse.text, 2 + randInt(2));
+    return { qtype:'cloze', subj:true, verse,
+      prompt:`${formatRef(verse)} — 빈칸에 들어갔던 단어를 복원하세요:`,
+      maskedHtml: masked.html, answers: masked.answers };
+  } else if (type==='continue_verse'){
+    return { qtype:'continue_verse', subj:true, verse, prompt:`${formatRef(verse)} — 구절 전체를 입력하세요:` };
+  } else if (type==='multiple_choice_text'){
+    const options = [verse];
+    while (options.length<4){
+      const candidate = VERSES[randInt(VERSES.length)];
+      const dupRef = options.some(o=>o.book===candidate.book && o.chapter===candidate.chapter && o.verse===candidate.verse);
+      const dupText = options.some(o=>o.text===candidate.text);
+      if (!dupRef && !dupText){ options.push(candidate); }
+    }
+    shuffle(options);
+    const correctIndex = options.findIndex(o=>o.text===verse.text && o.book===verse.book && o.chapter===verse.chapter && o.verse===verse.verse);
+    return {
+      qtype:'multiple_choice_text', subj:false, verse,
+      prompt:`다음 참조의 올바른 문구를 고르세요: ${formatRef(verse)}`,
+      options: options.map(o=>`“${o.text}”`),
+      correctIndex
+    };
+  } else { // multiple_choice (문구→참조)
+    const options = [verse];
+    while (options.length<4){
+      const candidate = VERSES[randInt(VERSES.length)];
+      if (!options.some(o=>o.book===candidate.book && o.chapter===candidate.chapter && o.verse===candidate.verse)){
+        options.push(candidate);
+      }
+    }
+    shuffle(options);
+    const correctIndex = options.findIndex(o=>o.book===verse.book && o.chapter===verse.chapter && o.verse===verse.verse);
+    return {
+      qtype:'multiple_choice', subj:false, verse,
+      prompt:`다음 구절의 참조(책/장/절)를 고르세요: “${verse.text}”`,
+      options: options.map(o=>`${o.book} ${o.chapter},${o.verse}`),
+      correctIndex
+    };
+  }
+}
+
+// ------------------------------
+// 단락(연속 구절) 문제: 같은 책·장에서 절 번호가 이어지는 구절들 — 서버 /passage 와 같은 규칙
+// ------------------------------
+let PASSAGE_INDEX = null;  // {verses: 만들 때의 VERSES, byChapter: "책|장" → 절 순서 구절(절마다 하나)}
+let PASSAGE_FOCUS = null;  // 단락을 지정했으면 {book, chapter, start, end} — 그 범위 밖으로 단락을 늘리지 않음
+const PASSAGE_FALLBACK = { passage_next:'continue_verse', passage_order:'multiple_choice_text', passage_fill:'cloze' };
+
+function passageQTypes(){
+  const out = [];
+  if (document.getElementById('qtype-passage-next').checked) out.push('passage_next');
+  if (document.getElementById('qtype-passage-order').checked) out.push('passage_order');
+  if (document.getElementById('qtype-passage-fill').checked) out.push('passage_fill');
+  return out;
+}
+function passageLen(){
+  return Math.max(2, Math.min(12, parseInt(document.getElementById('input-passage-len').value,10) || 4));
+}
+
+function chapterVerses(v){
+  if (!PASSAGE_INDEX || PASSAGE_INDEX.verses !== VERSES){
+    const byChapter = new Map();
+    for (const x of VERSES){
+      const k = `${x.book}|${x.chapter}`;
+      if (!byChapter.has(k)) byChapter.set(k, []);
+      byChapter.get(k).push(x);
+    }
+    for (const [k, arr] of byChapter){
+      arr.sort((a,b)=> a.verse - b.verse); // 안정 정렬: 번역이 여러 개면 먼저 나온 것이 앞
+      byChapter.set(k, arr.filter((x,i)=> i===0 || x.verse!==arr[i-1].verse));
+    }
+    PASSAGE_INDEX = { verses: VERSES, byChapter };
+  }
+  return PASSAGE_INDEX.byChapter.get(`${v.book}|${v.chapter}`) || [];
+}
+
+// v 를 포함하는 연속 구절 최대 len 개 (절 번호가 끊기면 거기까지, 2절이 안 되면 null)
+function passageAround(v, len){
+  let arr = chapterVerses(v);
+  const f = PASSAGE_FOCUS;
+  if (f && f.book===v.book && f.chapter===v.chapter) arr = arr.filter(x=> x.verse>=f.start && x.verse<=f.end);
+  const i = arr.findIndex(x=> x.verse===v.verse);
+  if (i < 0) return null;
+  let lo = i, hi = i;
+  while (lo > 0 && arr[lo-1].verse === arr[lo].verse-1) lo--;
+  while (hi < arr.length-1 && arr[hi+1].verse === arr[hi].verse+1) hi++;
+  const n = Math.min(len, hi-lo+1);
+  if (n < 2) return null;
+  const start = Math.max(lo, Math.min(i - randInt(n), hi-n+1));
+  const verses = arr.slice(start, start+n);
+  return { book:v.book, chapter:v.chapter, start:verses[0].verse, end:verses[n-1].verse, verses };
+}
+function passageKey(p){ return `${p.book}|${p.chapter}|${p.start}-${p.end}`; }
+function formatPassageRef(p){ return `${p.book} ${p.chapter},${p.start}-${p.end}`; }
+function passageText(p){ return p.verses.map(x=> x.text).join(' '); }
+function passageHtml(p, upto=p.verses.length){
+  return p.verses.slice(0, upto).map(x=> `<sup>${x.verse}</sup> ${x.text}`).join(' ');
+}
+
+function makePassageQuestion(type, verse){
+  const p = passageAround(verse, passageLen());
+  if (!p) return null;
+  if (type==='passage_next'){
+    const shown = 1 + randInt(p.verses.length-1); // 앞의 shown 절을 보여 주고 바로 다음 절을 묻는다
+    const target = p.verses[shown];
+    return { qtype:'passage_next', subj:true, verse:target, passage:p, shown,
+      prompt:`${formatPassageRef(p)} — 이어지는 ${target.verse}절을 입력하세요:` };
+  }
+  if (type==='passage_order'){
+    const order = shuffle(p.verses.map((_,i)=> i));
+    if (order.every((x,i)=> x===i)) order.reverse(); // 섞은 결과가 원래 순서면 뒤집어서
+    return { qtype:'passage_order', subj:false, verse:p.verses[0], passage:p, order,
+      prompt:`${formatPassageRef(p)} — 구절에 순서대로 번호를 매기세요:` };
+  }
+  const masked = p.verses.map(x=> `<sup>${x.verse}</sup> ${maskWords(x.text, 1 + randInt(2)).html}`).join(' ');
+  return { qtype:'passage_fill', subj:true, verse:p.verses[0], passage:p, maskedHtml:masked,
+    prompt:`${formatPassageRef(p)} — 빈칸을 채워 단락 전체를 입력하세요:` };
+}
+
+// 순서 맞추기 부분 점수: 제자리 순서로 남은 가장 긴 부분(최장 증가 부분 수열) 비율
+function lisLen(a){
+  const tails = [];
+  for (const x of a){
+    let lo=0, hi=tails.length;
+    while (lo<hi){ const mid=(lo+hi)>>1; if (tails[mid] < x) lo=mid+1; else hi=mid; }
+    tails[lo] = x;
+  }
+  return tails.length;
+}
+
+// 출제 범위로 지정한 단락의 VERSES 인덱스 — 비었으면 null (PASSAGE_FOCUS 도 같이 갱신)
+async function passageFocusPool(){
+  const ref = document.getElementById('input-passage-ref').value.trim();
+  PASSAGE_FOCUS = null;
+  if (!ref) return null;
+  const r = await apiGet('/passage?ref=' + encodeURIComponent(ref) + (CORPUS_ID ? '&corpus=' + CORPUS_ID : ''));
+  if (!(r && r.ok)){ alert((r && r.error) || '단락을 찾을 수 없습니다.'); return []; }
+  const p = r.passage;
+  PASSAGE_FOCUS = { book:p.book, chapter:p.chapter, start:p.start, end:p.end };
+  const out = [];
+  VERSES.forEach((v,i)=>{ if (v.book===p.book && v.chapter===p.chapter && v.verse>=p.start && v.verse<=p.end) out.push(i); });
+  if (!out.length) alert('불러온 구절 목록에 이 단락이 없습니다.');
+  return out;
+}
+
+function maskWords(text, n=2){
+  const words = text.split(/(\s+)/); // 공백 유지
+  const idx = []
+  for (let i=0;i<words.length;i+=2){ if (words[i].trim().length>2) idx.push(i); }
+  shuffle(idx)
+  const chosen = idx.slice(0, Math.min(n, idx.length));
+  const blanks = [];
+  for (const i of chosen){ blanks.push(words[i]); words[i] = '<span class="cloze-blank">____</span>'; }
+  return {html: words.join(''), answers: blanks};
+}
+
+// ------------------------------
+// 점수표시 토글
+// ------------------------------
+function setScoreVisibility(show){
+  const sw = document.getElementById('score-wrap');
+  const skw = document.getElementById('skip-wrap');
+  if (sw) sw.style.display = show ? '' : 'none';
+  if (skw) skw.style.display = show ? '' : 'none';
+}
+
+// ------------------------------
+// 퀴즈(시험) 시작 / 재시험 시작 / TOP20 시작
+// ------------------------------
+async function startQuizInternal(){
+  if (!CURRENT_USER){ alert('시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
+  if (VERSES.length === 0){
+    await loadDefaultVersesFromServer(true);
+    if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
+  }
+
+  // 유니크 참조 수 산출
+  const uniqRefSet = new Set(VERSES.map(v=>verseKey(v)));
+  const uniqCapacity = uniqRefSet.size;
+
+  const d = await getUserData();
+  const st = d.settings || {};
+  const desired = Math.max(5, Math.min(100, parseInt(document.getElementById('input-num-questions').value,10) || st.numQuestions || 30));
+  const num = Math.min(desired, uniqCapacity); // 세트 크기는 유니크 참조 수를 넘지 않음
+
+  const qtypes = [];
+  if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
+  if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
+  if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
+  if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
+  if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
+  qtypes.push(...passageQTypes());
+  if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); return; }
+
+  // ★ 시험은 순수 랜덤(균등) + 비복원 + 참조 유니크 — 단락을 지정했으면 그 안에서, 학습 세트를 골랐으면 서버가 세트에서 뽑은 참조로
+  const focusPool = await passageFocusPool();
+  if (focusPool && focusPool.length === 0) return;
+  const setPool = focusPool ? null : await studySetPool(num);
+  if (setPool && setPool.length === 0){ alert('선택한 학습 세트에 출제할 구절이 없습니다.'); return; }
+  let pickedIdx;
+  if (focusPool){
+    const seen = new Set();
+    pickedIdx = shuffle(focusPool.slice()).filter(i=>{ const k = verseKey(VERSES[i]); if (seen.has(k)) return false; seen.add(k); return true; }).slice(0, num);
+  } else pickedIdx = setPool || pickUniqueIndicesUniform(num);
+
+  const questions = [];
+  for (let i=0;i<pickedIdx.length;i++){
+    const v = VERSES[pickedIdx[i]];
+    const t = qtypes[randInt(qtypes.length)];
+    questions.push(makeQuestion(t, v));
+  }
+
+  PRACTICE_MODE = false;
+  updatePracticeToggleUI(false);
+  setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
+
+  CURRENT_QUIZ = { questions, index: 0, score: 0, skip: 0, answered: new Array(questions.length).fill(false), practice:false, originSessionId:null };
+  LAST_RESULT = null;
+
+  document.getElementById('mode-badge').style.display = 'none';
+  document.getElementById('practice-acc').style.display = 'none';
+  document.getElementById('quiz-panel').classList.remove('hidden');
+  document.getElementById('result-panel').classList.add('hidden');
+  document.getElementById('total-count').textContent = questions.length;
+  document.getElementById('cur-score').textContent = '0';
+  document.getElementById('cur-skip').textContent = '0';
+  renderQuestion();
+  showView('quiz');
+}
+
+async function startTop20Quiz(){
+  if (!CURRENT_USER){ alert('시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
+  if (VERSES.length === 0){
+    await loadDefaultVersesFromServer(true);
+    if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
+  }
+
+  const d = await getUserData();
+  const verseScores = d.verseScores || {};
+
+  // verseScores 상위 20(>0)만 가져오기
+  const tops = Object.entries(verseScores)
+    .filter(([,v]) => (v||0) > 0)
+    .sort((a,b) => b[1]-a[1])
+    .slice(0, 20);
+
+  if (tops.length === 0){
+    alert('오답 TOP20 항목이 없습니다. 먼저 문제를 풀어 데이터가 쌓여야 합니다.');
+    return;
+  }
+
+  // 메모리의 VERSES에서 존재하는 것만 골라 준비
+  const verseMap = new Map(VERSES.map(v => [verseKey(v), v]));
+  const selectedVerses = [];
+  const used = new Set();
+  for (const [key] of tops){
+    if (used.has(key)) continue;
+    const v = verseMap.get(key);
+    if (v) { selectedVerses.push(v); used.add(key); }
+  }
+  if (selectedVerses.length === 0){
+    alert('현재 로드된 CSV에 TOP20 참조가 존재하지 않습니다. CSV를 확인해주세요.');
+    return;
+  }
+
+  const qtypes = [];
+  if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
+  if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
+  if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
+  if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
+  if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
+  qtypes.push(...passageQTypes());
+  if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); return; }
+
+  // 선택된 구절들로 세트 구성(유형은 랜덤 배정)
+  const questions = selectedVerses.map(v => makeQuestion(qtypes[randInt(qtypes.length)], v));
+
+  PRACTICE_MODE = false;
+  updatePracticeToggleUI(false);
+  setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
+
+  CURRENT_QUIZ = { questions, index: 0, score: 0, skip: 0, answered: new Array(questions.length).fill(false), practice:false, originSessionId:null };
+  LAST_RESULT = null;
+
+  document.getElementById('mode-badge').style.display = 'none';
+  document.getElementById('practice-acc').style.display = 'none';
+  document.getElementById('quiz-panel').classList.remove('hidden');
+  document.getElementById('result-panel').classList.add('hidden');
+  document.getElementById('total-count').textContent = questions.length;
+  document.getElementById('cur-score').textContent = '0';
+  document.getElementById('cur-skip').textContent = '0';
+  renderQuestion();
+  showView('quiz');
+}
+
+// 아카이브된(집계만 남은) 세션은 서버 아카이브에서 상세를 받아 합친다
+async function loadSessionDetail(se){
+  if (!se || se.questionsDump || !se.archived) return se;
+  const res = await apiGet('/session_dump?id='+encodeURIComponent(se.id));
+  if (!(res && res.ok)) return se;
+  return { ...se, details: res.details || [], questionsDump: res.questionsDump || null };
+}
+
+async function retakeSession(sessionId){
+  if (!CURRENT_USER){ alert('재시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
+  const d = await getUserData();
+  const se = await loadSessionDetail((d.sessions||[]).find(x=> x.id===sessionId));
+  if (!se){ alert('저장된 세트를 찾을 수 없습니다.'); return; }
+
+  if (!se.questionsDump){
+    alert('이 세트에는 문제 덤프가 없어 재시험을 진행할 수 없습니다.');
+    return;
+  }
+  const questions = se.questionsDump.map(q=>({ ...q, verse: q.verse }));
+
+  PRACTICE_MODE = false;
+  updatePracticeToggleUI(false);
+  setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
+
+  CURRENT_QUIZ = { questions, index:0, score:0, skip:0, answered:new Array(questions.length).fill(false), practice:false, originSessionId: sessionId };
+  LAST_RESULT = null;
+
+  document.getElementById('mode-badge').style.display = 'none';
+  document.getElementById('practice-acc').style.display = 'none';
+  document.getElementById('quiz-panel').classList.remove('hidden');
+  document.getElementById('result-panel').classList.add('hidden');
+  document.getElementById('total-count').textContent = questions.length;
+  document.getElementById('cur-score').textContent = '0';
+  document.getElementById('cur-skip').textContent = '0';
+  renderQuestion();
+  showView('quiz');
+}
+
+// ★ 틀린 문제만 다시 풀기
+async function retakeWrongOnly(sessionId){
+  if (!CURRENT_USER){ alert('재시험을 시작하려면 로그인하세요.'); showView('auth'); return; }
+  const d = await getUserData();
+  const se = await loadSessionDetail((d.sessions||[]).find(x=> x.id===sessionId));
+  if (!se){ alert('저장된 세트를 찾을 수 없습니다.'); return; }
+  if (!se.questionsDump){
+    alert('이 세트에는 문제 덤프가 없어 틀린 문제만 재시험을 진행할 수 없습니다.');
+    return;
+  }
+  const qs = se.questionsDump || [];
+  const details = se.details || [];
+
+  const usedRef = new Set();
+  const wrongQuestions = [];
+  for (let i=0;i<qs.length;i++){
+    const drec = details[i] || {};
+    const isWrong = drec.skipped || !drec.correct;
+    if (!isWrong) continue;
+    const v = qs[i].verse;
+    const key = `${v.book}|${v.chapter}|${v.verse}`;
+    if (usedRef.has(key)) continue; // 참조 중복 방지
+    usedRef.add(key);
+    wrongQuestions.push({ ...qs[i], verse: qs[i].verse });
+  }
+
+  if (wrongQuestions.length===0){
+    alert('틀린 문제가 없습니다. 잘하셨어요!');
+    return;
+  }
+
+  PRACTICE_MODE = false;
+  updatePracticeToggleUI(false);
+  setScoreVisibility(false); // 시험 중에는 점수/스킵 숨김
+
+  CURRENT_QUIZ = { questions: wrongQuestions, index:0, score:0, skip:0, answered:new Array(wrongQuestions.length).fill(false), practice:false, originSessionId: null };
+  LAST_RESULT = null;
+
+  document.getElementById('mode-badge').style.display = 'none';
+  document.getElementById('practice-acc').style.display = 'none';
+  document.getElementById('quiz-panel').classList.remove('hidden');
+  document.getElementById('result-panel').classList.add('hidden');
+  document.getElementById('total-count').textContent = wrongQuestions.length;
+  document.getElementById('cur-score').textContent = '0';
+  document.getElementById('cur-skip').textContent = '0';
+  renderQuestion();
+  showView('quiz');
+}
+
+// ------------------------------
+// 학습(무한) 모드
+// ------------------------------
+function updatePracticeToggleUI(isOn){
+  const btn = document.getElementById('btn-practice-toggle');
+  if (isOn){
+    btn.classList.remove('btn-success'); btn.classList.add('btn-danger');
+    btn.textContent = '학습하기 중지';
+    document.getElementById('mode-badge').style.display = '';
+    document.getElementById('practice-acc').style.display = '';
+    document.getElementById('total-count').textContent = '∞';
+    setScoreVisibility(true); // 학습 중에는 점수/스킵 표시
+  } else {
+    btn.classList.remove('btn-danger'); btn.classList.add('btn-success');
+    btn.textContent = '학습하기 시작';
+    document.getElementById('mode-badge').style.display = 'none';
+    document.getElementById('practice-acc').style.display = 'none';
+    setScoreVisibility(false); // 학습 중지 시 숨김(시험 대비)
+  }
+}
+
+async function togglePractice(){
+  if (!CURRENT_USER){ alert('학습하려면 로그인하세요.'); showView('auth'); return; }
+  if (VERSES.length === 0){
+    await loadDefaultVersesFromServer(true);
+    if (VERSES.length === 0){ alert('서버 verses.csv를 찾을 수 없습니다. 설정에서 CSV를 업로드하세요.'); showView('settings'); return; }
+  }
+  PRACTICE_MODE = !PRACTICE_MODE;
+  if (PRACTICE_MODE){
+    const d = await getUserData();
+    const qtypes = [];
+    if (document.getElementById('qtype-identify').checked) qtypes.push('identify_ref');
+    if (document.getElementById('qtype-cloze').checked) qtypes.push('cloze');
+    if (document.getElementById('qtype-mc').checked) qtypes.push('multiple_choice');
+    if (document.getElementById('qtype-continue').checked) qtypes.push('continue_verse');
+    if (document.getElementById('qtype-mc-text').checked) qtypes.push('multiple_choice_text');
+    qtypes.push(...passageQTypes());
+    if (qtypes.length===0){ alert('최소한 하나의 문제 유형을 선택하세요.'); PRACTICE_MODE=false; return; }
+
+    const focusPool = await passageFocusPool();
+    if (focusPool && focusPool.length === 0){ PRACTICE_MODE=false; return; }
+    const pool = focusPool || await studySetPool(0);
+    if (pool && pool.length === 0){ alert('선택한 학습 세트에 출제할 구절이 없습니다.'); PRACTICE_MODE=false; return; }
+
+    // 학습 모드 선택기 초기화 (랜덤↔가중치 번갈아 + 재출제큐, 학습 세트를 골랐으면 그 안에서만)
+    const sel = initPracticeSelector(d, qtypes, pool);
+
+    const firstQ = sel.makeOne(); // CURRENT_QUIZ 생성 전에 호출해도 안전
+
+    CURRENT_QUIZ = {
+      questions:[firstQ], index:0, score:0, skip:0, answered:[false],
+      practice:true, makeOne: sel.makeOne, practiceStats:{attempts:0, correct:0},
+      practiceRetryQueue: sel.retryQueue,
+      practiceRecent: sel.recentKeys,
+      scheduleRetryForVerse: sel.scheduleRetryForVerse,
+      discardFromRetryByKey: sel.discardFromRetryByKey,
+      onAttempt: sel.onAttempt
+    };
+    LAST_RESULT = null;
+
+    updatePracticeToggleUI(true);
+    document.getElementById('quiz-panel').classList.remove('hidden');
+    document.getElementById('result-panel').classList.add('hidden');
+    renderQuestion();
+    showView('quiz');
+    updatePracticeAccuracyLabel();
+  } else {
+    updatePracticeToggleUI(false);
+  }
+}
+
+function updatePracticeAccuracyLabel(){
+  if (!CURRENT_QUIZ || !CURRENT_QUIZ.practice || !CURRENT_QUIZ.practiceStats) return;
+  const a = CURRENT_QUIZ.practiceStats.attempts || 0;
+  const c = CURRENT_QUIZ.practiceStats.correct || 0;
+  const pct = a ? Math.round(c/a*100) : 0;
+  const el = document.getElementById('practice-acc');
+  el.textContent = `정확도: ${pct}% (${c}/${a})`;
+}
+
+// ------------------------------
+// 렌더링
+// ------------------------------
+function renderQuestion(){
+  const q = CURRENT_QUIZ.questions[CURRENT_QUIZ.index];
+  const box = document.getElementById('question-content');
+  const btnPrev = document.getElementById('btn-prev');
+  const btnNext = document.getElementById('btn-next');
+  const btnSubmit = document.getElementById('btn-submit');
+
+  if (CURRENT_QUIZ.practice){
+    btnPrev.disabled = true;
+    btnNext.textContent = '다음 문제';
+    btnNext.disabled = !CURRENT_QUIZ.answered[CURRENT_QUIZ.index];
+  } else {
+    btnPrev.disabled = CURRENT_QUIZ.index===0;
+    btnNext.textContent = '다음';
+    btnNext.disabled = CURRENT_QUIZ.index>=CURRENT_QUIZ.questions.length-1;
+  }
+  btnSubmit.disabled = CURRENT_QUIZ.answered[CURRENT_QUIZ.index];
+
+  document.getElementById('cur-index').textContent = CURRENT_QUIZ.index+1;
+
+  const headerType = `<div class="text-muted small">유형: <span class="mono">${q.qtype}</span></div>`;
+  const headerRef = `<div class="text-muted small">참조: <span class="mono">${formatRef(q.verse)}</span></div>`;
+  const showRefInQuestion = (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='multiple_choice_text');
+
+  if (q.qtype==='identify_ref'){
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType}
+      <blockquote class="border-start border-3 ps-3">${q.verse.text}</blockquote>
+      <div class="row g-2 mt-2">
+        <div class="col-12 col-md-4">
+          <label class="form-label">책</label>
+          <input class="form-control" id="ans-book" placeholder="예: 요한복음, 누가 1:37" />
+        </div>
+        <div class="col-6 col-md-4">
+          <label class="form-label">장</label>
+          <input type="number" class="form-control" id="ans-chapter" />
+        </div>
+        <div class="col-6 col-md-4">
+          <label class="form-label">절</label>
+          <input type="number" class="form-control" id="ans-verse" />
+        </div>
+      </div>`;
+  } else if (q.qtype==='cloze'){
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType} ${showRefInQuestion?headerRef:''}
+      <blockquote class="border-start border-3 ps-3">${q.maskedHtml}</blockquote>
+      <label class="form-label mt-2">복원한 문장(원문과 최대한 일치):</label>
+      <textarea class="form-control" id="ans-cloze" rows="2" placeholder="띄어쓰기 무시: 정확히 쓰면 더 유리합니다"></textarea>`;
+  } else if (q.qtype==='continue_verse'){
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType} ${showRefInQuestion?headerRef:''}
+      <label class="form-label">구절 전체:</label>
+      <textarea class="form-control" id="ans-continue" rows="3" placeholder="띄어쓰기 무시: 원문과 최대한 일치하게 입력"></textarea>`;
+  } else if (q.qtype==='passage_next'){
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType}
+      <blockquote class="border-start border-3 ps-3">${passageHtml(q.passage, q.shown)}</blockquote>
+      <label class="form-label">${q.verse.verse}절:</label>
+      <textarea class="form-control" id="ans-passage" rows="3" placeholder="띄어쓰기 무시: 원문과 최대한 일치하게 입력"></textarea>`;
+  } else if (q.qtype==='passage_order'){
+    const n = q.passage.verses.length;
+    const rows = q.order.map((vi,j)=>{
+      const opts = ['<option value="">-</option>'].concat(q.passage.verses.map((_,k)=> `<option value="${k+1}">${k+1}</option>`)).join('');
+      return `<div class="d-flex gap-2 align-items-start mb-2">
+        <select class="form-select form-select-sm" id="ans-order-${j}" style="width:70px">${opts}</select>
+        <div>${q.passage.verses[vi].text}</div></div>`;
+    }).join('');
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType}
+      <div class="text-muted small mb-2">1 ~ ${n} 번호를 한 번씩 쓰세요.</div>
+      <div class="mt-2">${rows}</div>`;
+  } else if (q.qtype==='passage_fill'){
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType}
+      <blockquote class="border-start border-3 ps-3">${q.maskedHtml}</blockquote>
+      <label class="form-label mt-2">단락 전체(절 번호 없이):</label>
+      <textarea class="form-control" id="ans-passage" rows="5" placeholder="띄어쓰기 무시: 원문과 최대한 일치하게 입력"></textarea>`;
+  } else if (q.qtype==='multiple_choice_text'){
+    const opts = q.options.map((o,idx)=>{
+      return `<div class="form-check"><input class="form-check-input" type="radio" name="mc2" id="mc2_${idx}" value="${idx}"><label class="form-check-label" for="mc2_${idx}">${o}</label></div>`
+    }).join('');
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType} ${showRefInQuestion?headerRef:''}
+      <div class="mt-2">${opts}</div>`;
+  } else {
+    const opts = q.options.map((o,idx)=>{
+      return `<div class="form-check"><input class="form-check-input" type="radio" name="mc" id="mc${idx}" value="${idx}"><label class="form-check-label" for="mc${idx}">${o}</label></div>`
+    }).join('');
+    box.innerHTML = `
+      <div class="mb-2">${q.prompt}</div>
+      ${headerType}
+      <blockquote class="border-start border-3 ps-3">${q.verse.text}</blockquote>
+      <div class="mt-2">${opts}</div>`;
+  }
+}
+
+// ------------------------------
+// 채점 + 기록
+// ------------------------------
+async function submitAnswer(){
+  const i = CURRENT_QUIZ.index;
+  if (CURRENT_QUIZ.answered[i] || CURRENT_QUIZ.grading) return;
+  const q = CURRENT_QUIZ.questions[i];
+  let correct = false; let userAnswerDisplay = '';
+
+  if (q.qtype==='identify_ref'){
+    const b = document.getElementById('ans-book').value;
+    let c = parseInt(document.getElementById('ans-chapter').value,10);
+    let v = parseInt(document.getElementById('ans-verse').value,10);
+    // 책 칸에 "누가 1:37" 처럼 참조를 통째로 써도 된다 (장/절 칸이 비었을 때만 거기서 채움)
+    const ref = parseReference(b);
+    if (ref && !Number.isFinite(c) && ref.chapter!==null) c = ref.chapter;
+    if (ref && !Number.isFinite(v) && ref.verse!==null) v = ref.verse;
+    userAnswerDisplay = `${b||'-'} ${Number.isFinite(c)?c:'-'}:${Number.isFinite(v)?v:'-'}`;
+    const bookOK = (ref ? ref.book : normalizeLabel(b))===bookIdOf(q.verse.book);
+    correct = bookOK && c===q.verse.chapter && v===q.verse.verse;
+  } else if (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='passage_next' || q.qtype==='passage_fill'){
+    const t = document.getElementById({cloze:'ans-cloze', continue_verse:'ans-continue'}[q.qtype] || 'ans-passage').value;
+    userAnswerDisplay = t;
+    CURRENT_QUIZ.grading = true; // 채점 응답 전 중복 제출 방지
+    const g = await gradeTextAnswer(q, t);
+    CURRENT_QUIZ.grading = false;
+    correct = g.correct;
+    q.similarity = g.similarity; q.credit = g.credit; q.diff = g.diff;
+  } else if (q.qtype==='passage_order'){
+    const n = q.passage.verses.length;
+    const seq = new Array(n).fill(-1); // seq[위치] = 원래 절 순번
+    for (let j=0;j<n;j++){
+      const pos = parseInt(document.getElementById('ans-order-'+j).value,10);
+      if (!(pos>=1 && pos<=n) || seq[pos-1]!==-1){ alert('각 구절에 서로 다른 번호(1~'+n+')를 매기세요.'); return; }
+      seq[pos-1] = q.order[j];
+    }
+    userAnswerDisplay = seq.map(k=> q.passage.verses[k].verse).join(' → ');
+    q.similarity = q.credit = Math.round(lisLen(seq)/n*1000)/1000;
+    q.diff = null;
+    correct = seq.every((k,idx)=> k===idx);
+  } else if (q.qtype==='multiple_choice_text'){
+    const sel = document.querySelector('input[name="mc2"]:checked');
+    if (!sel){ alert('보기를 선택하세요.'); return; }
+    const ans = parseInt(sel.value,10);
+    userAnswerDisplay = q.options[ans];
+    correct = (ans === q.correctIndex);
+  } else {
+    const sel = document.querySelector('input[name="mc"]:checked');
+    if (!sel){ alert('보기를 선택하세요.'); return; }
+    const ans = parseInt(sel.value,10);
+    userAnswerDisplay = q.options[ans];
+    correct = (ans === q.correctIndex);
+  }
+
+  q.userAnswerDisplay = userAnswerDisplay;
+  q.correct = !!correct;
+  q.skipped = false;
+  CURRENT_QUIZ.answered[i] = true;
+  if (correct) CURRENT_QUIZ.score++;
+  document.getElementById('cur-score').textContent = CURRENT_QUIZ.score;
+
+  if (CURRENT_QUIZ.practice){
+    // 오답/스킵은 재출제 큐에 스케줄
+    if (!q.correct && typeof CURRENT_QUIZ.scheduleRetryForVerse === 'function'){
+      const attemptsSoFar = (CURRENT_QUIZ.practiceStats?.attempts||0);
+      CURRENT_QUIZ.scheduleRetryForVerse(q.verse, attemptsSoFar);
+    } else if (q.correct && typeof CURRENT_QUIZ.discardFromRetryByKey === 'function'){
+      CURRENT_QUIZ.discardFromRetryByKey(verseKey(q.verse));
+    }
+
+    revealImmediateAnswer(q);
+    document.getElementById('btn-next').disabled = false;
+    document.getElementById('btn-submit').disabled = true;
+    // 누적 정확도 업데이트
+    if (!CURRENT_QUIZ.practiceStats) CURRENT_QUIZ.practiceStats = {attempts:0, correct:0};
+    CURRENT_QUIZ.practiceStats.attempts++;
+    if (typeof CURRENT_QUIZ.onAttempt === 'function') CURRENT_QUIZ.onAttempt(); // ← selector 시도수 증가
+    if (q.correct) CURRENT_QUIZ.practiceStats.correct++;
+    updatePracticeAccuracyLabel();
+    // 학습 모드: 개별 문항 자동 저장 (사용자별)
+    autoLogPracticeAttempt(q);
+  } else {
+    if (i < CURRENT_QUIZ.questions.length-1){ CURRENT_QUIZ.index++; renderQuestion(); }
+    else { showResult(true); } // 시험 종료 자동 저장
+  }
+}
+
+function skipQuestion(){
+  const i = CURRENT_QUIZ.index;
+  if (CURRENT_QUIZ.answered[i]) return;
+  const q = CURRENT_QUIZ.questions[i];
+  q.skipped = true; q.correct = false; q.userAnswerDisplay = '';
+  CURRENT_QUIZ.answered[i] = true;
+  CURRENT_QUIZ.skip++;
+  document.getElementById('cur-skip').textContent = CURRENT_QUIZ.skip;
+
+  if (CURRENT_QUIZ.practice){
+    // 스킵도 재출제 큐에 스케줄
+    if (typeof CURRENT_QUIZ.scheduleRetryForVerse === 'function'){
+      const attemptsSoFar = (CURRENT_QUIZ.practiceStats?.attempts||0);
+      CURRENT_QUIZ.scheduleRetryForVerse(q.verse, attemptsSoFar);
+    }
+
+    revealImmediateAnswer(q, true);
+    document.getElementById('btn-next').disabled = false;
+    document.getElementById('btn-submit').disabled = true;
+    if (!CURRENT_QUIZ.practiceStats) CURRENT_QUIZ.practiceStats = {attempts:0, correct:0};
+    CURRENT_QUIZ.practiceStats.attempts++;
+    if (typeof CURRENT_QUIZ.onAttempt === 'function') CURRENT_QUIZ.onAttempt(); // ← selector 시도수 증가
+    updatePracticeAccuracyLabel();
+    autoLogPracticeAttempt(q);
+  } else {
+    if (i < CURRENT_QUIZ.questions.length-1){ CURRENT_QUIZ.index++; renderQuestion(); }
+    else { showResult(true); }
+  }
+}
+
+function autoLogPracticeAttempt(q){
+  // 로그인 필요
+  if (!CURRENT_USER) return;
+  const session = {
+    id: 'sess_'+Date.now()+'_'+Math.floor(Math.random()*1e6),
+    type: 'practice',
+    dateISO: new Date().toISOString(),
+    total: 1,
+    correct: q.correct ? 1 : 0,
+    skip: q.skipped ? 1 : 0,
+    score: q.correct ? 1 : 0,
+    details: [{
+      qtype: q.qtype,
+      subj: q.qtype!=='multiple_choice' && q.qtype!=='multiple_choice_text',
+      book: q.verse.book, chapter: q.verse.chapter, verse: q.verse.verse,
+      text: q.verse.text,
+      correct: !!q.correct,
+      skipped: !!q.skipped,
+      ...(typeof q.credit==='number' && !q.skipped ? {credit:q.credit} : {}),
+      ...(q.passage && q.qtype!=='passage_next' ? {verseEnd:q.passage.end} : {}) // 단락 전체 문항은 단락의 구절마다 반영
+    }]
+  };
+  // 로컬 큐에 먼저 기록 → 온라인이면 즉시 동기화 (오프라인이면 연결 시 자동 전송)
+  AttemptQueue.add({ id: newAttemptId(), user: CURRENT_USER, session })
+    .then(()=> AttemptQueue.flush())
+    .then(()=>{ refreshAfterMutation(); });
+}
+
+function revealImmediateAnswer(q, wasSkipped=false){
+  const box = document.getElementById('question-content');
+  let correctAnswer;
+  if (q.qtype==='multiple_choice') correctAnswer = formatRef(q.verse);
+  else if (q.qtype==='multiple_choice_text') correctAnswer = `“${q.verse.text}”`;
+  else if (q.qtype==='identify_ref') correctAnswer = formatRef(q.verse);
+  else if (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='passage_next') correctAnswer = q.verse.text;
+  else if (q.passage) correctAnswer = passageHtml(q.passage);
+  else correctAnswer = formatRef(q.verse);
+
+  const status = wasSkipped ? '스킵' : (q.correct ? '정답' : '오답');
+  const html = `
+    <div class="answer-reveal">
+      <div><strong>채점:</strong> ${status}</div>
+      <div class="mt-1"><strong>정답:</strong> ${correctAnswer}</div>
+      <div class="mt-1"><strong>참조:</strong> <span class="mono">${formatRef(q.verse)}</span></div>
+      <div class="mt-1"><strong>문구:</strong> “${q.verse.text}”</div>
+      <div class="mt-1"><strong>내 답:</strong> ${wasSkipped ? '(스킵)' : (q.userAnswerDisplay||'-')}</div>
+      ${wasSkipped ? '' : gradeFeedbackHtml(q)}
+    </div>`;
+  box.insertAdjacentHTML('beforeend', html);
+}
+
+function prevQuestion(){ if (!CURRENT_QUIZ || CURRENT_QUIZ.practice) return; if (CURRENT_QUIZ.index>0){ CURRENT_QUIZ.index--; renderQuestion(); } }
+function nextQuestion(){
+  if (!CURRENT_QUIZ) return;
+  if (CURRENT_QUIZ.practice){
+    if (!CURRENT_QUIZ.answered[CURRENT_QUIZ.index]) return;
+    const nextQ = CURRENT_QUIZ.makeOne();
+    CURRENT_QUIZ.questions = [nextQ];
+    CURRENT_QUIZ.answered = [false];
+    CURRENT_QUIZ.index = 0;
+    renderQuestion();
+    return;
+  }
+  if (CURRENT_QUIZ.index<CURRENT_QUIZ.questions.length-1){
+    CURRENT_QUIZ.index++; renderQuestion();
+  }
+}
+
+// ------------------------------
+// 결과/요약 및 저장 (저장 완료 보장)
+// ------------------------------
+async function showResult(autoSave=false){
+  const total = CURRENT_QUIZ.questions.length;
+  const correct = CURRENT_QUIZ.score;
+  const skip = CURRENT_QUIZ.skip;
+  document.getElementById('res-total').textContent = total;
+  document.getElementById('res-correct').textContent = correct;
+  document.getElementById('res-skip').textContent = skip;
+  document.getElementById('res-score').textContent = `${correct}/${total}`;
+
+  const list = document.getElementById('result-list');
+  list.innerHTML = '';
+  CURRENT_QUIZ.questions.forEach((q,idx)=>{
+    const typeLabel = (q.qtype==='multiple_choice' || q.qtype==='multiple_choice_text') ? '객관식' : '주관식';
+    const badge = q.skipped ? '<span class="badge text-bg-warning">스킵</span>' : (q.correct ? '<span class="badge text-bg-success">정답</span>' : '<span class="badge text-bg-danger">오답</span>');
+    let correctAnswer;
+    if (q.qtype==='multiple_choice') correctAnswer = formatRef(q.verse);
+    else if (q.qtype==='multiple_choice_text') correctAnswer = `“${q.verse.text}”`;
+    else if (q.qtype==='identify_ref') correctAnswer = formatRef(q.verse);
+    else if (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='passage_next') correctAnswer = q.verse.text;
+    else if (q.passage) correctAnswer = passageHtml(q.passage);
+    else correctAnswer = formatRef(q.verse);
+
+    const card = document.createElement('div');
+    card.className = 'col-12';
+    card.innerHTML = `
+      <div class="card question-card ${q.correct?'correct':(q.skipped?'':'incorrect')}">
+        <div class="card-body">
+          <div class="d-flex justify-content-between align-items-start">
+            <h6 class="mb-2">Q${idx+1} <small class="text-muted">(${typeLabel} / ${q.qtype})</small></h6>
+            ${badge}
+          </div>
+          <div class="mb-2"><strong>참조:</strong> <span class="mono">${formatRef(q.verse)}</span></div>
+          <div class="mb-2"><strong>문구:</strong> “${q.verse.text}”</div>
+          <div class="mb-2"><strong>문제:</strong> ${q.prompt}</div>
+          <div><strong>정답:</strong> ${correctAnswer}</div>
+          <div class="mt-1"><strong>내 답:</strong> ${q.skipped ? '(스킵)' : (q.userAnswerDisplay||'-')}</div>
+          ${q.skipped ? '' : gradeFeedbackHtml(q)}
+        </div>
+      </div>`;
+    list.appendChild(card);
+  });
+
+  LAST_RESULT = summarizeCurrent(true); // 세트 저장 포함
+  LAST_RESULT.type = 'exam';
+
+  // 재시험이면 기존 세트 id로 덮어쓰기
+  let replaceId = null;
+  if (CURRENT_QUIZ.originSessionId){
+    LAST_RESULT.id = CURRENT_QUIZ.originSessionId;
+    replaceId = CURRENT_QUIZ.originSessionId;
+  }
+
+  document.getElementById('quiz-panel').classList.add('hidden');
+  document.getElementById('result-panel').classList.remove('hidden');
+
+  if (autoSave && LAST_RESULT){
+    // 같은 결과의 재전송(응답 유실 후 재시도, 오프라인 큐)은 서버가 이 키로 한 번만 반영
+    const attemptId = newAttemptId();
+    const payload = replaceId ? { session: LAST_RESULT, replaceId, idempotencyKey: attemptId } : { session: LAST_RESULT, idempotencyKey: attemptId };
+    const res = await apiPost('/save', payload);
+    if (res && res.offline){
+      // 오프라인: 큐에 넣어 두고 연결되면 동기화
+      await AttemptQueue.add({ id: attemptId, user: CURRENT_USER, session: LAST_RESULT, replaceId });
+      alert('오프라인 상태입니다. 결과는 기기에 보관되었다가 연결되면 자동으로 저장됩니다.');
+    } else if (!(res && res.ok)) { alert(res?.error || '저장 중 오류가 발생했습니다.'); }
+    refreshAfterMutation(); // 저장 완료 후 대시보드 동기화(실시간 연결 중이면 푸시로 반영)
+  }
+}
+
+function summarizeCurrent(includeDump=false){
+  const details = CURRENT_QUIZ.questions.map(q=>({
+    qtype: q.qtype,
+    subj: q.qtype!=='multiple_choice' && q.qtype!=='multiple_choice_text',
+    book: q.verse.book, chapter: q.verse.chapter, verse: q.verse.verse,
+    text: q.verse.text,
+    correct: !!q.correct,
+    skipped: !!q.skipped,
+    ...(typeof q.credit==='number' && !q.skipped ? {credit:q.credit} : {}),
+    ...(q.passage && q.qtype!=='passage_next' ? {verseEnd:q.passage.end} : {})
+  }));
+  const uniq = Date.now()+'_'+Math.floor(Math.random()*1e6);
+  const base = {
+    id: 'sess_'+uniq,
+    dateISO: new Date().toISOString(),
+    total: CURRENT_QUIZ.questions.length,
+    correct: CURRENT_QUIZ.score,
+    skip: CURRENT_QUIZ.skip,
+    score: CURRENT_QUIZ.score,
+    originSessionId: CURRENT_QUIZ.originSessionId || null,
+    details
+  };
+  if (includeDump){
+    // 재시험을 위한 세트 덤프(문항 그대로)
+    base["questionsDump"] = CURRENT_QUIZ.questions.map(q=>({
+      qtype: q.qtype,
+      subj: q.subj,
+      verse: {book:q.verse.book, chapter:q.verse.chapter, verse:q.verse.verse, text:q.verse.text},
+      prompt: q.prompt,
+      options: q.options || null,
+      correctIndex: (typeof q.correctIndex==='number') ? q.correctIndex : null,
+      maskedHtml: q.maskedHtml || null,
+      ...(q.passage ? {passage:q.passage, order:q.order || null, shown:q.shown || null} : {})
+    }));
+  }
+  return base;
+}
+
+async function clearAll(){
+  if (!CURRENT_USER){ alert('기록을 초기화하려면 로그인하세요.'); showView('auth'); return; }
+  if (!confirm('서버에 저장된 (내) 모든 기록과 설정을 초기화할까요?')) return;
+  const res = await apiPost('/reset', {});
+  if (res && res.ok){
+    alert('초기화되었습니다.');
+    refreshAfterMutation();
+    refreshMeta();
+    await loadSettings(); // 기본 설정으로 반영
+  }
+}
+
+// ------------------------------
+// 대시보드 구축 (+ 과거 시험/재시험/틀린만 재시험, TOP20, 랭킹, 최근 오답율)
+// ------------------------------
+async function buildDashboard(){
+  const d = await getUserData();
+  if (!d) return;
+  const sessions = (d.sessions||[]).slice();
+
+  // 1) 과거 시험 표 (시험 성격 세트만 표시)
+  try {
+    const tb = document.getElementById('table-past-sessions');
+    if (tb){ tb.innerHTML = ''; }
+    const examSessions = sessions.filter(se=> se?.type==='exam' || (se?.total||0) > 1);
+    examSessions.forEach((se,idx)=>{
+      const dt = new Date(se.dateISO || Date.now());
+      const name = `세트 ${idx+1}`;
+      const accuracy = se.total ? Math.round((se.correct||0)/se.total*100) : 0;
+      const canRetake = !!se.questionsDump || !!se.archived;
+      const tr = document.createElement('tr');
+      tr.innerHTML = `
+        <td class="nowrap">${name}</td>
+        <td class="nowrap">${dt.toLocaleString()}</td>
+        <td class="text-end">${se.total||0}</td>
+        <td class="text-end">${se.correct||0}</td>
+        <td class="text-end">${accuracy}%</td>
+        <td>
+          <div class="btn-group btn-group-sm">
+            <button class="btn btn-outline-primary" data-sid="${se.id}" ${canRetake?'':'disabled'}>재시험</button>
+            <button class="btn btn-outline-danger" data-sid="${se.id}" data-retake-wrong="1" ${canRetake?'':'disabled'}>틀린문제만</button>
+            <button class="btn btn-outline-secondary" data-sid="${se.id}" data-review="1">결과보기</button>
+            <button class="btn btn-outline-dark" data-sid="${se.id}" data-delete="1">삭제</button>
+          </div>
+        </td>`;
+      if (tb) tb.appendChild(tr);
+    });
+
+    // 버튼 바인딩
+    if (tb){
+      tb.querySelectorAll('button').forEach(btn=>{
+        btn.addEventListener('click', async (ev)=>{
+          const sid = ev.target.getAttribute('data-sid');
+          const isReview = ev.target.getAttribute('data-review');
+          const isWrongOnly = ev.target.getAttribute('data-retake-wrong');
+          const isDelete = ev.target.getAttribute('data-delete');
+          if (isDelete){
+            if (!confirm('이 시험 세트를 삭제할까요?')) return;
+            const res = await apiPost('/delete_session', {id: sid});
+            if (res && res.ok){ refreshAfterMutation(); }
+            return;
+          }
+
+          if (isReview){
+            const d2 = await getUserData();
+            const se = await loadSessionDetail((d2.sessions||[]).find(x=> x.id===sid));
+            if (!se){ alert('결과 데이터를 찾을 수 없습니다.'); return; }
+            // 과거 결과 보기
+            const list = document.getElementById('result-list');
+            list.innerHTML = '';
+            const qs = se.questionsDump || [];
+            const details = se.details || [];
+            if (qs.length === 0){
+              const msg = document.createElement('div');
+              msg.className = 'alert alert-warning';
+              msg.textContent = '이 세트에는 문제 덤프가 없어 상세 결과를 표시할 수 없습니다.';
+              list.appendChild(msg);
+            } else {
+              qs.forEach((q,idx)=>{
+                const verse = q.verse;
+                const typeLabel = (q.qtype==='multiple_choice' || q.qtype==='multiple_choice_text') ? '객관식' : '주관식';
+
+                const drec = details[idx] || {}
+                const badge = drec.skipped ? '<span class="badge text-bg-warning">스킵</span>' : (drec.correct ? '<span class="badge text-bg-success">정답</span>' : '<span class="badge text-bg-danger">오답</span>');
+
+                let correctAnswer;
+                if (q.qtype==='multiple_choice') correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
+                else if (q.qtype==='multiple_choice_text') correctAnswer = `“${verse.text}”`;
+                else if (q.qtype==='identify_ref') correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
+                else if (q.qtype==='cloze' || q.qtype==='continue_verse' || q.qtype==='passage_next') correctAnswer = verse.text;
+                else if (q.passage) correctAnswer = passageHtml(q.passage);
+                else correctAnswer = `${verse.book} ${verse.chapter},${verse.verse}`;
+
+                const card = document.createElement('div');
+                card.className = 'col-12';
+                card.innerHTML = `
+                  <div class="card question-card ${drec.correct?'correct':(drec.skipped?'':'incorrect')}">
+                    <div class="card-body">
+                      <div class="d-flex justify-content-between align-items-start">
+                        <h6 class="mb-2">Q${idx+1} <small class="text-muted">(${typeLabel} / ${q.qtype})</small></h6>
+                        ${badge}
+                      </div>
+                      <div class="mb-2"><strong>참조:</strong> <span class="mono">${verse.book} ${verse.chapter},${verse.verse}</span></div>
+                      <div class="mb-2"><strong>문구:</strong> “${verse.text}”</div>
+                      <div class="mb-2"><strong>문제:</strong> ${q.prompt}</div>
+                      <div><strong>정답:</strong> ${correctAnswer}</div>
+                    </div>
+                  </div>`;
+                list.appendChild(card);
+              });
+            }
+            document.getElementById('res-total').textContent = se.total||0;
+            document.getElementById('res-correct').textContent = se.correct||0;
+            document.getElementById('res-skip').textContent = se.skip||0;
+            document.getElementById('res-score').textContent = `${se.correct||0}/${se.total||0}`;
+            document.getElementById('quiz-panel').classList.add('hidden');
+            document.getElementById('result-panel').classList.remove('hidden');
+            showView('quiz');
+          } else if (isWrongOnly){
+            retakeWrongOnly(sid);
+          } else {
+            retakeSession(sid);
+          }
+        });
+      });
+    }
+  } catch(e){ console.warn('past-sessions build error', e); }
+
+  // 2) 요약/차트: 시험 세션만 반영 (practice 제외)
+  try {
+    const exams = sessions.filter(se => se.type === 'exam' || (se?.total||0) > 1);
+    document.getElementById('stat-total-tests').textContent = exams.length;
+    document.getElementById('stat-last-score').textContent = exams.length ? `${exams[exams.length-1].correct||0}/${exams[exams.length-1].total||0}` : '-';
+    const avg = exams.length ? (exams.reduce((acc,x)=>acc + (x.correct||0)/(x.total||1)*30,0)/exams.length) : 0;
+    document.getElementById('stat-avg-score').textContent = exams.length ? avg.toFixed(1)+'/30' : '-';
+
+    let subjC=0, subjT=0, objC=0, objT=0, skipC=0, skipT=0;
+    for (const se of exams){
+      if (se.archived && se.tallies){
+        // 아카이브된 세션은 집계값으로 합산
+        const t = se.tallies;
+        subjT += t.subjT||0; subjC += t.subjC||0; objT += t.objT||0; objC += t.objC||0;
+        skipT += t.skipT||0; skipC += t.skipC||0;
+        continue;
+      }
+      for (const d0 of (se.details||[])){
+        const d = d0||{};
+        if (d.subj){subjT++; if (d.correct) subjC++;} else {objT++; if (d.correct) objC++;}
+        skipT++; if (d.skipped) skipC++;
+      }
+    }
+    document.getElementById('stat-subj-acc').textContent = subjT? ((subjC/subjT*100).toFixed(1)+'%') : '-';
+    document.getElementById('stat-obj-acc').textContent = objT? ((objC/objT*100).toFixed(1)+'%') : '-';
+    document.getElementById('stat-skip-rate').textContent = skipT? ((skipC/skipT*100).toFixed(1)+'%') : '-';
+
+    const labels = exams.map((_,i)=> i+1);
+    const scores = exams.map(se=> Math.round((se.correct||0)/(se.total||1)*30));
+    await loadScriptOnce(LAZY_ASSETS.chart); // Chart.js는 대시보드에서만 필요
+    const ctx = document.getElementById('chart-scores').getContext('2d');
+    if (chartScores) { chartScores.destroy(); }
+    chartScores = new Chart(ctx, {
+      type: 'line',
+      data: { labels, datasets: [{ label: '점수(30점 만점 환산)', data: scores }] },
+      options: { responsive: true, scales: { y: { beginAtZero: true, suggestedMax: 30 } } }
+    });
+
+    // 3) 오답 TOP20: verseScores 기반
+    const verseScores = d.verseScores || {};
+    const entries = Object.entries(verseScores).filter(([,v])=> (v||0)>0).sort((a,b)=> (b[1] - a[1])).slice(0,20);
+
+    const textIndex = new Map();
+    for (const v of VERSES){
+      textIndex.set(`${v.book}|${v.chapter}|${v.verse}`, v.text);
+    }
+
+    const ul = document.getElementById('wrong-top'); if (ul) ul.innerHTML = '';
+    for (const [key, cnt] of entries){
+      const [book, chapter, verse] = key.split('|');
+      const numC = parseInt(chapter,10), numV = parseInt(verse,10);
+      const verseText = textIndex.get(key) || '(텍스트 로드 전 또는 미상)';
+      const li = document.createElement('li');
+      li.className = 'list-group-item d-flex justify-content-between align-items-center';
+      li.innerHTML = `
+        <span>[${book} ${numC},${numV}] ${verseText}</span>
+        <span class="d-flex align-items-center gap-2">
+          <span class="badge bg-danger">${cnt}</span>
+          <button class="btn btn-sm btn-outline-dark" data-del-key="${key}">삭제</button>
+        </span>`;
+      ul?.appendChild(li);
+    }
+    // TOP20 삭제 버튼 바인딩
+    if (ul){
+      ul.querySelectorAll('button[data-del-key]').forEach(btn=>{
+        btn.addEventListener('click', async (ev)=>{
+          const key = ev.target.getAttribute('data-del-key');
+          if (!confirm('이 항목을 TOP20에서 제거(카운트 리셋)할까요?')) return;
+          const res = await apiPost('/delete_verse_score', {key});
+          if (res && res.ok){ refreshAfterMutation(); }
+        });
+      });
+    }
+
+    // 4) 책별 최근 오답율 (최근 100문항, 시험+학습 모두 포함)
+    try {
+      const recentWindow = 100;
+      const flattened = []; // [{book, correct, skipped, dateISO}]
+      // 세션을 최신순으로 훑으면서 details를 최신순으로 채우기
+      const sorted = sessions.slice().sort((a,b)=> new Date(b.dateISO||0) - new Date(a.dateISO||0));
+      for (const se of sorted){
+        const det = (se.details||[]).slice(); // 원본 보존
+        // 세트 내부 문항도 뒤에서부터(최신) 넣자
+        for (let i=det.length-1; i>=0; i--){
+          if (flattened.length >= recentWindow) break;
+          const d0 = det[i];
+          flattened.push({ book: d0.book, correct: !!d0.correct, skipped: !!d0.skipped, dateISO: se.dateISO });
+        }
+        if (flattened.length >= recentWindow) break;
+      }
+      const byBook = new Map();
+      for (const r of flattened){
+        const b = r.book || '(미상)';
+        if (!byBook.has(b)) byBook.set(b, {t:0,w:0});
+        byBook.get(b).t++;
+        if (r.skipped || !r.correct) byBook.get(b).w++;
+      }
+      const rows = Array.from(byBook.entries()).map(([book,st])=>{
+        const rate = st.t? (st.w/st.t*100) : 0;
+        return {book, t:st.t, w:st.w, rate};
+      }).sort((a,b)=> b.rate - a.rate || b.t - a.t || a.book.localeCompare(b.book));
+      const tbody = document.getElementById('table-recent-wrong-by-book');
+      if (tbody){
+        tbody.innerHTML = '';
+        for (const r of rows){
+          const tr = document.createElement('tr');
+          tr.innerHTML = `<td>${r.book}</td><td class="text-end">${r.t}</td><td class="text-end">${r.w}</td><td class="text-end">${r.rate.toFixed(1)}%</td>`;
+          tbody.appendChild(tr);
+        }
+        const rangeEl = document.getElementById('recent-window-range');
+        if (rangeEl){
+          if (flattened.length>0){
+            const lastDate = new Date(flattened[flattened.length-1].dateISO||Date.now());
+            const firstDate = new Date(flattened[0].dateISO||Date.now());
+            rangeEl.textContent = `${flattened.length}문항 · ${lastDate.toLocaleDateString()} – ${firstDate.toLocaleDateString()}`;
+          } else {
+            rangeEl.textContent = '';
+          }
+        }
+      }
+    } catch(e){ console.warn('recent wrong by book error', e); }
+
+    // 5) 랭킹
+    await renderLeaderboard();
+
+    // 6) 학습 세트 (숙달/시도 수는 verseScores 기준이라 기록이 바뀌면 다시 받는다)
+    await loadStudySets();
+  } catch(e){ console.warn('summary/stats build error', e); }
+}
+
+// ------------------------------
+// 학습 세트: 서버가 코퍼스 비트맵으로 범위를 계산하고, 여기서는 돌려받은 참조 키로 VERSES를 거른다
+// ------------------------------
+function escapeHtml(s){
+  return String(s).replace(/[&<>"']/g, c=>({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}[c]));
+}
+
+async function loadStudySets(){
+  if (!CURRENT_USER){ STUDY_SETS = []; renderStudySets(); return; }
+  const r = await apiGet('/study_sets');
+  if (r && r.ok) STUDY_SETS = r.sets || [];
+  renderStudySets();
+}
+
+function renderStudySets(){
+  const sel = document.getElementById('select-study-set');
+  if (sel){
+    const cur = sel.value;
+    sel.innerHTML = '<option value="">전체 구절</option>' +
+      STUDY_SETS.map(st=>`<option value="${escapeHtml(st.id)}">${escapeHtml(st.name)} (${st.count})</option>`).join('');
+    sel.value = STUDY_SETS.some(st=>st.id===cur) ? cur : '';
+  }
+  const tbody = document.getElementById('table-study-sets');
+  if (!tbody) return;
+  tbody.innerHTML = '';
+  for (const st of STUDY_SETS){
+    const pct = st.count ? Math.round(st.mastered/st.count*100) : 0;
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+      <td>${escapeHtml(st.name)}${st.rules.excludeMastered ? ' <small class="text-muted">(숙달 제외)</small>' : ''}</td>
+      <td class="text-end">${st.count}</td>
+      <td class="text-end">${st.attempted}</td>
+      <td class="text-end">${st.mastered} (${pct}%)</td>
+      <td>
+        <div class="btn-group btn-group-sm">
+          <button class="btn btn-outline-primary" data-ss-exam="${escapeHtml(st.id)}">시험</button>
+          <button class="btn btn-outline-secondary" data-ss-practice="${escapeHtml(st.id)}">학습</button>
+          <button class="btn btn-outline-dark" data-ss-delete="${escapeHtml(st.id)}">삭제</button>
+        </div>
+      </td>`;
+    tbody.appendChild(tr);
+  }
+  tbody.querySelectorAll('button[data-ss-exam]').forEach(btn=> btn.addEventListener('click', ()=>{
+    document.getElementById('select-study-set').value = btn.dataset.ssExam;
+    startQuizInternal();
+  }));
+  tbody.querySelectorAll('button[data-ss-practice]').forEach(btn=> btn.addEventListener('click', ()=>{
+    document.getElementById('select-study-set').value = btn.dataset.ssPractice;
+    if (PRACTICE_MODE) togglePractice(); // 켜져 있으면 끄고 새 범위로 다시
+    togglePractice();
+  }));
+  tbody.querySelectorAll('button[data-ss-delete]').forEach(btn=> btn.addEventListener('click', async ()=>{
+    if (!confirm('이 학습 세트를 삭제할까요?')) return;
+    const res = await apiPost('/study_sets/delete', {id: btn.dataset.ssDelete});
+    if (res && res.ok) loadStudySets();
+  }));
+}
+
+// 입력 폼 → rules: 책/장 범위와 참조 목록은 합집합, 검색어는 책이 있으면 그 안에서(교집합) 아니면 합집합에 추가
+function studySetRulesFromForm(){
+  const book = document.getElementById('ss-book').value.trim();
+  const chFrom = parseInt(document.getElementById('ss-ch-from').value, 10);
+  const chTo = parseInt(document.getElementById('ss-ch-to').value, 10);
+  const q = document.getElementById('ss-search').value.trim();
+  const refs = document.getElementById('ss-refs').value.split(/[;\n]/).map(s=>s.trim()).filter(Boolean);
+  const include = [], within = [];
+  if (book){
+    const src = {book};
+    if (chFrom || chTo) src.chapters = [chFrom || chTo, chTo || chFrom];
+    include.push(src);
+  }
+  if (refs.length) include.push({refs});
+  if (q) (book ? within : include).push({search: q});
+  return {include, within, exclude: [], excludeMastered: document.getElementById('ss-exclude-mastered').checked};
+}
+
+async function previewStudySet(){
+  if (!CURRENT_USER){ alert('로그인하세요.'); showView('auth'); return; }
+  const out = document.getElementById('ss-preview');
+  const r = await apiPost('/study_sets/preview', {rules: studySetRulesFromForm()});
+  if (!(r && r.ok)){ out.textContent = (r && r.error) || '미리보기 실패'; return; }
+  const refs = r.keys.map(k=>{ const [b,c,v] = k.split('|'); return `${b} ${c},${v}`; });
+  out.textContent = `${r.count}구절 — ${refs.slice(0,5).join(', ')}${r.count>5 ? ' …' : ''}`;
+}
+
+async function saveStudySet(){
+  if (!CURRENT_USER){ alert('로그인하세요.'); showView('auth'); return; }
+  const name = document.getElementById('ss-name').value.trim();
+  if (!name){ alert('세트 이름을 입력하세요.'); return; }
+  const r = await apiPost('/study_sets', {name, rules: studySetRulesFromForm()});
+  if (!(r && r.ok)){ alert((r && r.error) || '저장 실패'); return; }
+  document.getElementById('ss-preview').textContent = `저장됨: ${r.set.count}구절`;
+  await loadStudySets();
+}
+
+// 출제 범위로 고른 세트의 VERSES 인덱스 — sample>0 이면 서버가 서로 다른 참조를 무작위로 뽑는다. 세트 미선택이면 null
+async function studySetPool(sample){
+  const sel = document.getElementById('select-study-set');
+  const sid = sel ? sel.value : '';
+  if (!sid) return null;
+  const r = await apiGet(`/study_sets/${encodeURIComponent(sid)}/verses` + (sample ? `?sample=${sample}` : ''));
+  if (!(r && r.ok)) return [];
+  const byKey = new Map();
+  VERSES.forEach((v,i)=>{ const k = verseKey(v); if (!byKey.has(k)) byKey.set(k, i); });
+  return r.keys.map(k=>byKey.get(k)).filter(i=>i!==undefined);
+}
+
+// 랭킹 표: 실시간 연결 중에는 푸시된 캐시를, 아니면 서버에서 다시 받아 그린다
+async function renderLeaderboard(){
+  try {
+    if (!LEADERBOARD || !Live.connected){
+      const lb = await apiGet('/leaderboard');
+      if (!(lb && lb.ok)) return;
+      LEADERBOARD = lb.leaders || [];
+    }
+    const tbody = document.getElementById('table-leaderboard');
+    if (tbody){
+      tbody.innerHTML = '';
+      LEADERBOARD.forEach((row, idx)=>{
+        const tr = document.createElement('tr');
+        tr.innerHTML = `<td class="text-center">${idx+1}</td><td>${row.username}</td><td class="text-end">${row.avgPercent.toFixed(1)}%</td><td class="text-end">${row.sampleCount}</td>`;
+        tbody.appendChild(tr);
+      });
+    }
+  } catch(e){ console.warn('leaderboard error', e); }
+}
+
+// 초기 로드
+document.addEventListener('DOMContentLoaded', async ()=>{
+  if ('serviceWorker' in navigator){
+    navigator.serviceWorker.register('/sw.js').catch(e=> console.warn('service worker 등록 실패', e));
+  }
+  bindAuthUI();
+  await refreshWhoAmI();
+  Live.connect(); // 기록/랭킹 실시간 갱신
+  AttemptQueue.flush(); // 이전에 오프라인으로 쌓인 시도 전송
+  // 올려 둔 코퍼스가 있으면 그것, 없으면 서버 기본 verses.csv 자동 로드
+  await loadVerses();
+  loadBookAliases(); // 채점 전에만 있으면 된다 — 기다리지 않음
+  showView('home');
+  buildDashboard();
+  // 첫 로드 시 점수 표시 기본 숨김(시험 디폴트 가정)
+  setScoreVisibility(false);
+  refreshMeta();
+});
+
+// 인라인 onclick에서 쓰는 함수들을 전역(window)에 노출
+window.showView = showView;
+window.saveSettings = saveSettings;
+window.loadSettings = loadSettings;
+window.clearAll = clearAll;
+window.prevQuestion = prevQuestion;
+window.nextQuestion = nextQuestion;
+window.submitAnswer = submitAnswer;
+window.skipQuestion = skipQuestion;
+window.retakeSession = retakeSession;
+window.retakeWrongOnly = retakeWrongOnly;
+window.startTop20Quiz = startTop20Quiz;
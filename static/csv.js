@@ -0,0 +1,45 @@
+// ------------------------------
+// 최소 CSV 파서 (RFC 4180: 따옴표 필드, "" 이스케이프, 필드 내 줄바꿈)
+// CSV 업로드를 시작할 때만 지연 로드된다. 결과: 헤더 행 기준 객체 배열(빈 줄 제외)
+// ------------------------------
+(function(){
+  function parseRows(text){
+    const rows = [];
+    let row = [], field = '', i = 0, quoted = false;
+    const n = text.length;
+    while (i < n){
+      const ch = text[i];
+      if (quoted){
+        if (ch === '"'){
+          if (text[i+1] === '"'){ field += '"'; i += 2; continue; }
+          quoted = false; i++; continue;
+        }
+        field += ch; i++; continue;
+      }
+      if (ch === '"'){ quoted = true; i++; continue; }
+      if (ch === ','){ row.push(field); field = ''; i++; continue; }
+      if (ch === '\r' || ch === '\n'){
+        row.push(field); rows.push(row); row = []; field = '';
+        if (ch === '\r' && text[i+1] === '\n') i++;
+        i++; continue;
+      }
+      field += ch; i++;
+    }
+    if (field !== '' || row.length){ row.push(field); rows.push(row); }
+    return rows;
+  }
+
+  function parse(text){
+    if (text.charCodeAt(0) === 0xFEFF) text = text.slice(1); // BOM 제거
+    const rows = parseRows(text).filter(r => !(r.length === 1 && r[0].trim() === ''));
+    if (!rows.length) return [];
+    const header = rows[0].map(h => h.trim());
+    return rows.slice(1).map(r => {
+      const obj = {};
+      header.forEach((h, idx) => { obj[h] = r[idx] !== undefined ? r[idx] : ''; });
+      return obj;
+    });
+  }
+
+  window.QuizCsv = { parse };
+})();
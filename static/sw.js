@@ -0,0 +1,95 @@
+// ------------------------------
+// 서비스 워커: 앱 셸 / 구절 코퍼스 / 최근 데이터 오프라인 캐시
+// {{...}} 자리표시자는 서버 기동 시 지문 URL로 치환된다
+// (자산이 바뀌면 이 파일 내용도 바뀌므로 브라우저가 새 워커를 설치하고 이전 셸 캐시를 지운다)
+// ------------------------------
+const SHELL_ASSETS = [
+  '/',
+  '{{app.css}}',
+  '{{app.js}}',
+  '{{csv.js}}',
+  '{{vendor/bootstrap.min.css}}',
+  '{{vendor/chart.umd.min.js}}',
+  '{{manifest.webmanifest}}',
+  '{{icon.svg}}'
+];
+const SHELL_CACHE = 'quiz-shell-' + hashList(SHELL_ASSETS);
+const DATA_CACHE = 'quiz-data';
+// 오프라인일 때 마지막 응답으로 대신할 GET API
+const DATA_PATHS = ['/data', '/whoami', '/leaderboard'];
+// 로그인 사용자가 바뀌는 요청 — 성공하면 이전 사용자의 데이터 캐시를 지운 뒤 응답을 넘긴다
+const AUTH_PATHS = ['/login', '/signup', '/logout'];
+
+function hashList(list){
+  let h = 0;
+  const s = list.join('|');
+  for (let i=0;i<s.length;i++){ h = (h*31 + s.charCodeAt(i)) | 0; }
+  return (h >>> 0).toString(16);
+}
+
+self.addEventListener('install', (ev)=>{
+  ev.waitUntil(caches.open(SHELL_CACHE).then(c => c.addAll(SHELL_ASSETS)).then(()=> self.skipWaiting()));
+});
+
+self.addEventListener('activate', (ev)=>{
+  ev.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(k => k.startsWith('quiz-shell-') && k !== SHELL_CACHE).map(k => caches.delete(k))))
+      .then(()=> self.clients.claim())
+  );
+});
+
+// 로그아웃/세션 만료(401) 시 사용자 데이터 캐시 삭제(다른 사용자에게 오프라인 응답으로 보이지 않도록)
+self.addEventListener('message', (ev)=>{
+  if (ev.data === 'logout') ev.waitUntil(caches.delete(DATA_CACHE));
+});
+
+async function cacheFirst(req){
+  const hit = await caches.match(req);
+  if (hit) return hit;
+  const res = await fetch(req);
+  if (res.ok){ const c = await caches.open(SHELL_CACHE); c.put(req, res.clone()); }
+  return res;
+}
+
+async function networkFirst(req, cacheName){
+  try {
+    const res = await fetch(req);
+    if (res.ok){ const c = await caches.open(cacheName); c.put(req, res.clone()); }
+    else if (res.status === 401 && cacheName === DATA_CACHE) await caches.delete(DATA_CACHE);
+    return res;
+  } catch(e){
+    const hit = await caches.match(req, { ignoreSearch: req.mode === 'navigate' });
+    if (hit) return hit;
+    throw e;
+  }
+}
+
+async function authChange(req){
+  const res = await fetch(req);
+  if (res.ok) await caches.delete(DATA_CACHE);
+  return res;
+}
+
+// 코퍼스: 캐시 즉시 응답 + 백그라운드 갱신
+async function staleWhileRevalidate(req, ev){
+  const c = await caches.open(DATA_CACHE);
+  const hit = await c.match(req);
+  const update = fetch(req).then(res => { if (res.ok) c.put(req, res.clone()); return res; });
+  if (hit){ ev.waitUntil(update.catch(()=>{})); return hit; }
+  return update;
+}
+
+self.addEventListener('fetch', (ev)=>{
+  const req = ev.request;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+  if (req.method === 'POST' && AUTH_PATHS.includes(url.pathname)){ ev.respondWith(authChange(req)); return; }
+  if (req.method !== 'GET') return;
+  if (url.pathname.startsWith('/static/')){ ev.respondWith(cacheFirst(req)); return; }
+  if ((url.pathname === '/verses' || url.pathname === '/book_aliases') && !url.search){ ev.respondWith(staleWhileRevalidate(req, ev)); return; }
+  // 업로드 코퍼스: 사용자 데이터라 DATA_CACHE(로그아웃 시 삭제)에 둔다
+  if (url.pathname.startsWith('/corpus/')){ ev.respondWith(staleWhileRevalidate(req, ev)); return; }
+  if (req.mode === 'navigate'){ ev.respondWith(networkFirst(req, SHELL_CACHE)); return; }
+  if (DATA_PATHS.includes(url.pathname)){ ev.respondWith(networkFirst(req, DATA_CACHE)); return; }
+});
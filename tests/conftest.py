@@ -0,0 +1,26 @@
+import os, sys
+import pytest
+
+os.environ.setdefault("QUIZ_HASH_WORKERS", "0")       # 비밀번호 해시를 요청 스레드에서
+os.environ.setdefault("QUIZ_SNAPSHOT_INTERVAL", "0")  # 주기 스냅샷 끔
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bible_quiz_app as quiz  # noqa: E402
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """임시 디렉터리의 빈 file 저장소 — 모듈 전역 DB 캐시를 비우고, 끝나면 남은 기록을 그 디렉터리에 flush"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(quiz, "STORE", quiz.FileStore())
+    monkeypatch.setattr(quiz, "_DB_CACHE", None)
+    monkeypatch.setattr(quiz, "_DB_STAT", None)
+    monkeypatch.setattr(quiz, "_DB_DIRTY", False)
+    monkeypatch.setattr(quiz, "_MIGRATED", False)
+    monkeypatch.setattr(quiz, "_CRED_CACHE", {})
+    yield quiz
+    quiz.flush_db()
+
+@pytest.fixture
+def client(app_env):
+    c = app_env.app.test_client()
+    assert c.post("/signup", json={"username": "alice", "password": "pw"}).status_code == 200
+    return c
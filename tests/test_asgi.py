@@ -0,0 +1,41 @@
+import asyncio
+
+WHOAMI = {"type": "http", "method": "GET", "path": "/whoami", "raw_path": b"/whoami",
+          "query_string": b"", "headers": [], "scheme": "http", "http_version": "1.1"}
+
+async def _request(quiz, scope):
+    sent, body = [], [{"type": "http.request", "body": b"", "more_body": False}]
+    async def receive():
+        if body:
+            return body.pop(0)
+        await asyncio.Event().wait()  # 연결이 끊기지 않음
+    async def send(msg):
+        sent.append(msg)
+    await quiz.asgi_app(scope, receive, send)
+    return sent
+
+def test_lifespan_owns_the_route_executor(app_env, monkeypatch):
+    monkeypatch.setattr(app_env, "_ASGI_EXECUTOR", None)
+
+    async def run():
+        inbox, sent = asyncio.Queue(), []
+        async def send(msg):
+            sent.append(msg)
+        life = asyncio.create_task(app_env.asgi_app({"type": "lifespan"}, inbox.get, send))
+        await inbox.put({"type": "lifespan.startup"})
+        while not sent:
+            await asyncio.sleep(0.01)
+        assert sent[-1]["type"] == "lifespan.startup.complete"
+        pool = app_env._ASGI_EXECUTOR
+        assert pool is not None and app_env._asgi_executor() is pool
+
+        assert (await _request(app_env, WHOAMI))[0]["status"] == 200
+
+        await inbox.put({"type": "lifespan.shutdown"})
+        await asyncio.wait_for(life, 10)
+        assert sent[-1]["type"] == "lifespan.shutdown.complete"
+        return pool
+
+    pool = asyncio.run(run())
+    assert app_env._ASGI_EXECUTOR is None
+    assert pool._shutdown
@@ -0,0 +1,23 @@
+import time
+
+def _set_hash_behind_cache(quiz, username, pw_hash):
+    # 다른 노드의 복원/가져오기처럼 이 프로세스의 캐시를 거치지 않고 레코드를 바꾼다
+    with quiz.STORE.process_lock():
+        u = quiz.STORE.get_user(username)
+        u["pw_hash"] = pw_hash
+        quiz.STORE.put_user(username, u)
+
+def test_cached_pw_hash_expires(app_env, client, monkeypatch):
+    monkeypatch.setattr(app_env, "CRED_CACHE_TTL", 0.05)
+    app_env.forget_pw_hash("alice")  # 가입 시 기본 TTL 로 들어간 항목
+    old = app_env.lookup_pw_hash("alice")
+    _set_hash_behind_cache(app_env, "alice", "changed")
+    assert app_env.lookup_pw_hash("alice") == old
+    time.sleep(0.1)
+    assert app_env.lookup_pw_hash("alice") == "changed"
+
+def test_restore_drops_cached_pw_hash(app_env, client, monkeypatch):
+    app_env.lookup_pw_hash("alice")
+    _set_hash_behind_cache(app_env, "alice", "changed")
+    app_env.forget_pw_hash("alice")
+    assert app_env.lookup_pw_hash("alice") == "changed"
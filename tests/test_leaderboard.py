@@ -0,0 +1,28 @@
+def _count_leader_entries(app_env, monkeypatch):
+    calls = []
+    orig = app_env._leader_entry
+    monkeypatch.setattr(app_env, "_leader_entry", lambda uname, u: calls.append(uname) or orig(uname, u))
+    return calls
+
+def test_sync_mode_leaderboard_reuses_entries(app_env, monkeypatch):
+    monkeypatch.setattr(app_env, "PERSIST_MODE", "sync")
+    c = app_env.app.test_client()
+    for name in ("a", "b", "c"):
+        assert c.post("/signup", json={"username": name, "password": "pw"}).status_code == 200
+    calls = _count_leader_entries(app_env, monkeypatch)
+    c.get("/leaderboard")
+    c.get("/leaderboard")
+    assert len(calls) <= 3  # 처음 한 번만 전체 계산
+
+    calls.clear()
+    c.post("/save", json={"session": {"id": "s1", "type": "practice", "total": 1, "correct": 1, "details": []}})
+    c.get("/leaderboard")
+    assert calls == ["c"]  # 저장한 사용자만
+
+    # 다른 프로세스가 파일을 바꾸면 다시 계산
+    calls.clear()
+    db = app_env.load_db()
+    db["users"]["d"] = app_env.new_user()
+    app_env._write_db_file(app_env._encode_db(db))
+    c.get("/leaderboard")
+    assert sorted(calls) == ["a", "b", "c", "d"]
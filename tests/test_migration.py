@@ -0,0 +1,25 @@
+import json, os
+
+def _write(quiz, db):
+    with open(quiz.DATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(db, f)
+
+def _legacy_db():
+    return {"sessions": [], "settings": None, "verseScores": {"창세기|1|1": 2}}
+
+def test_startup_migration_upgrades_old_file(app_env):
+    _write(app_env, _legacy_db())
+    app_env.run_startup_migration()
+    assert os.path.exists(f"{app_env.DATA_FILE}.schema0.bak")
+    with open(app_env.DATA_FILE, encoding="utf-8") as f:
+        assert json.load(f)["schemaVersion"] == app_env.SCHEMA_VERSION
+
+def test_startup_migration_reads_schema_from_current_file(app_env):
+    # 가져온 뒤 저장 경로로 현재 스키마 파일을 기록(벤치 시드처럼) — 메모리 DB와 파일이 일치해 다시 읽지 않는다
+    app_env.load_db()
+    app_env.save_db({"schemaVersion": app_env.SCHEMA_VERSION, "users": {"bob": app_env.new_user()}})
+    app_env.flush_db()
+    before = os.stat(app_env.DATA_FILE).st_mtime_ns
+    app_env.run_startup_migration()
+    assert not os.path.exists(f"{app_env.DATA_FILE}.schema0.bak")
+    assert os.stat(app_env.DATA_FILE).st_mtime_ns == before
@@ -0,0 +1,21 @@
+import gzip, io
+
+def _exam(sid, date):
+    details = [{"qtype": "cloze", "subj": True, "book": "창세기", "chapter": 1, "verse": 1,
+                "text": "태초에", "correct": True, "skipped": False}] * 2
+    return {"id": sid, "type": "exam", "dateISO": date, "total": 2, "correct": 2, "skip": 0, "score": 2,
+            "details": details}
+
+def test_delete_session_removes_archived_details(app_env, client, monkeypatch):
+    monkeypatch.setattr(app_env, "KEEP_FULL_EXAMS", 1)
+    client.post("/save", json={"session": _exam("old", "2025-01-05T00:00:00.000Z")})
+    client.post("/save", json={"session": _exam("new", "2025-02-05T00:00:00.000Z")})
+    assert app_env.STORE.archive_fetch("alice", "2025-01", "old") is not None
+
+    r = client.post("/delete_session", json={"id": "old"})
+    assert r.json["deleted"] == 1
+    assert app_env.STORE.archive_fetch("alice", "2025-01", "old") is None
+    export = gzip.decompress(b"".join(app_env.export_stream(["alice"]))).decode("utf-8")
+    assert '"old"' not in export
+    # 다른 세션의 아카이브에는 영향 없음
+    assert client.get("/data").json["sessions"][0]["id"] == "new"
@@ -0,0 +1,31 @@
+import pytest
+
+KEY = "창세기|1|1"
+
+@pytest.fixture
+def published(app_env, monkeypatch):
+    deltas = []
+    monkeypatch.setattr(app_env, "publish_user_change", lambda uname, **delta: deltas.append(delta))
+    return deltas
+
+def _seed(quiz):
+    with quiz.STORE.process_lock():
+        u = quiz.ensure_user("alice")
+        u["verseScores"] = {KEY: 3, "창세기|1|2": 1}
+        u["verseStats"] = {KEY: [4, 0.25], "창세기|1|2": [2, 0.5]}
+        quiz.save_user("alice", u)
+
+def test_delete_verse_score_drops_its_stats(app_env, client, published):
+    _seed(app_env)
+    assert client.post("/delete_verse_score", json={"key": KEY}).json["ok"]
+    data = client.get("/data").json
+    assert KEY not in data["verseScores"] and KEY not in data["verseStats"]
+    assert "창세기|1|2" in data["verseStats"]
+    assert published[-1] == {"removedVerseScores": [KEY], "removedVerseStats": [KEY]}
+
+def test_clear_top20_drops_all_stats(app_env, client, published):
+    _seed(app_env)
+    assert client.post("/clear_top20", json={}).json["ok"]
+    data = client.get("/data").json
+    assert data["verseScores"] == {} and data["verseStats"] == {}
+    assert published[-1] == {"replaceVerseScores": {}, "replaceVerseStats": {}}